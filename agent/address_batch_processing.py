@@ -0,0 +1,75 @@
+import os
+from typing import List, Union
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.constants import Send
+from langgraph.graph import END, START, StateGraph
+from typing_extensions import Literal
+
+from address_data_processing import graph as address_graph
+from metrics import instrumented_node
+from models import BatchGraphState, BatchInputState, BatchItemResult, BatchItemState, BatchOutputState
+from providers import BULK
+
+# Default upper bound on addresses processed in parallel, can be overridden per run with "max_concurrency"
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "8"))
+# Scheduler lane of the batch's provider calls unless the run sets {"configurable": {"priority": ...}}
+BATCH_PRIORITY = os.environ.get("BATCH_PRIORITY", BULK)
+
+
+def fan_out_addresses(state: BatchGraphState) -> Union[List[Send], Literal["gather_results"]]:
+    """Send every address of the batch to its own address processing run"""
+    if not state['addresses']:
+        return "gather_results"
+    return [Send("process_address", BatchItemState(index=index, address=address))
+            for index, address in enumerate(state['addresses'])]
+
+
+def with_batch_priority(config: RunnableConfig) -> RunnableConfig:
+    """Put the item runs into the batch lane of the provider scheduler unless the run chose a lane"""
+    configurable = config.get('configurable') or {}
+    if 'priority' in configurable:
+        return config
+    return {**config, 'configurable': {**configurable, 'priority': BATCH_PRIORITY}}
+
+
+def process_address(state: BatchItemState, config: RunnableConfig):
+    """Run the address processing graph for a single address of the batch"""
+    try:
+        result = address_graph.invoke({"address": state['address']}, with_batch_priority(config))
+    except Exception as e:
+        print(f"Error processing batch address #{state['index']}: {e}")
+        result = {"address": state['address'], "matchedAddresses": [], "error": True,
+                  "description": f"Processing failed: {e}"}
+    return {"itemResults": [BatchItemResult(index=state['index'], result=result)]}
+
+
+async def aprocess_address(state: BatchItemState, config: RunnableConfig):
+    """Run the address processing graph for a single address of the batch (async)"""
+    try:
+        result = await address_graph.ainvoke({"address": state['address']}, with_batch_priority(config))
+    except Exception as e:
+        print(f"Error processing batch address #{state['index']}: {e}")
+        result = {"address": state['address'], "matchedAddresses": [], "error": True,
+                  "description": f"Processing failed: {e}"}
+    return {"itemResults": [BatchItemResult(index=state['index'], result=result)]}
+
+
+def gather_results(state: BatchGraphState):
+    """Collect the per-address results in input order"""
+    item_results = sorted(state.get('itemResults') or [], key=lambda item: item['index'])
+    return {"results": [item['result'] for item in item_results]}
+
+
+# Add nodes and edges
+builder = StateGraph(BatchGraphState, input_schema=BatchInputState, output_schema=BatchOutputState)
+builder.add_node("process_address", instrumented_node("process_address", process_address, aprocess_address))
+builder.add_node("gather_results", gather_results)
+
+# Logic
+builder.add_conditional_edges(START, fan_out_addresses, ["process_address", "gather_results"])
+builder.add_edge("process_address", "gather_results")
+builder.add_edge("gather_results", END)
+
+# Compile
+graph = builder.compile().with_config(max_concurrency=BATCH_MAX_CONCURRENCY)
@@ -1,32 +1,92 @@
-from langgraph.constants import Send
+from typing import List
+
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, START, StateGraph
 from typing_extensions import Literal
 
-from models import GraphState
-from nodes.check_normalize_address import check_normalize_address_llm
-from nodes.find_address import find_address_llm
-from nodes.web_search_address import web_search_address
+from matching.indexes import aget_blocking_index, get_blocking_index
+from metrics import instrumented_node
+from models import GraphState, ProcessingState
+from nodes.check_normalize_address import acheck_normalize_address_llm, check_normalize_address_llm
+from nodes.exact_match_address import aexact_match_address, exact_match_address
+from nodes.find_address import afind_address_llm, find_address_llm
+from nodes.score_address_confidence import (FIND_ROUTE, MATCH_ROUTE, ascore_address_confidence,
+                                            score_address_confidence)
+from nodes.speculation import should_speculate, speculative_normalizations
+from nodes.speculative_normalize_address import aspeculative_normalize_address, speculative_normalize_address
+from nodes.stats import start_stats_logger
+from nodes.web_search_address import aweb_search_address, web_search_address
+
+
+def was_exact_match_found(state: ProcessingState) -> Literal[END, "score_address_confidence"]:
+    """Skip the rest of the pipeline if the address matched a reference address exactly"""
+    if len(state['matchedAddresses']) > 0:
+        return END
+    else:
+        return "score_address_confidence"
+
+
+ConfidenceRoute = List[Literal[END, "find_address_llm", "web_search_address", "speculative_normalize_address"]]
+
 
+def _confidence_route(state: ProcessingState, speculate: bool) -> ConfidenceRoute:
+    next_node = "find_address_llm" if state['confidenceRoute'] == FIND_ROUTE else "web_search_address"
+    if speculate:
+        return [next_node, "speculative_normalize_address"]
+    return [next_node]
 
-def was_address_found(state: GraphState) -> Literal[END, "check_normalize_address_llm"]:
+
+def route_by_confidence(state: ProcessingState) -> ConfidenceRoute:
+    """End on a confident match, otherwise go to find_address_llm or to the web search first,
+    optionally starting normalization speculatively next to the matching"""
+    if state['confidenceRoute'] == MATCH_ROUTE:
+        return [END]
+    return _confidence_route(state, should_speculate(state['address'], get_blocking_index()))
+
+
+async def aroute_by_confidence(state: ProcessingState) -> ConfidenceRoute:
+    """Async version of `route_by_confidence`, the blocking index is built off the event loop"""
+    if state['confidenceRoute'] == MATCH_ROUTE:
+        return [END]
+    return _confidence_route(state, should_speculate(state['address'], await aget_blocking_index()))
+
+
+def was_address_found(state: ProcessingState) -> Literal[END, "check_normalize_address_llm"]:
     """Check if any address was found"""
     if len(state['matchedAddresses']) > 0:
+        speculative_normalizations.discard(state.get('speculationId'))
         return END
     else:
         return "check_normalize_address_llm"
 
 
-# Add nodes and edges
-builder = StateGraph(GraphState)
-builder.add_node("web_search_address", web_search_address)
-builder.add_node("find_address_llm", find_address_llm)
-builder.add_node("check_normalize_address_llm", check_normalize_address_llm)
+# Private state key the nodes stamp their finish time into, to measure queueing time
+QUEUE_KEY = 'lastNodeFinishedAt'
+
+
+def add_node(name, func, afunc):
+    """Add a node with native sync and async implementations that records its wall and queueing time"""
+    builder.add_node(name, instrumented_node(name, func, afunc, queue_key=QUEUE_KEY))
+
+
+# Add nodes and edges; every node has a native async implementation used by the LangGraph server
+builder = StateGraph(ProcessingState, input_schema=GraphState, output_schema=GraphState)
+add_node("exact_match_address", exact_match_address, aexact_match_address)
+add_node("score_address_confidence", score_address_confidence, ascore_address_confidence)
+add_node("web_search_address", web_search_address, aweb_search_address)
+add_node("find_address_llm", find_address_llm, afind_address_llm)
+add_node("check_normalize_address_llm", check_normalize_address_llm, acheck_normalize_address_llm)
+add_node("speculative_normalize_address", speculative_normalize_address, aspeculative_normalize_address)
 
 # Logic
-builder.add_edge(START, "web_search_address")
+builder.add_edge(START, "exact_match_address")
+builder.add_conditional_edges("exact_match_address", was_exact_match_found, [END, "score_address_confidence"])
+builder.add_conditional_edges("score_address_confidence", RunnableLambda(route_by_confidence, afunc=aroute_by_confidence),
+                              [END, "find_address_llm", "web_search_address", "speculative_normalize_address"])
 builder.add_edge("web_search_address", "find_address_llm")
-builder.add_conditional_edges("find_address_llm", was_address_found)
+builder.add_conditional_edges("find_address_llm", was_address_found, [END, "check_normalize_address_llm"])
 builder.add_edge("check_normalize_address_llm", END)
 
 # Compile
 graph = builder.compile()
+start_stats_logger()
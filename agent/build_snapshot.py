@@ -0,0 +1,90 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+from matching.indexes import PREBUILT_INDEXES
+from stores.reference_store import (REFERENCE_ADDRESSES_PATH, REFERENCE_SNAPSHOT_PATH, ReferenceSnapshot,
+                                    ReferenceStore, parse_reference_addresses)
+from stores.snapshot_file import builder_digest, write_snapshot
+
+# Compiles addresses-to-match-against.json into a binary snapshot holding the
+# columnar addresses and the prebuilt matching indexes. Workers memory-map it
+# read-only instead of parsing the JSON and building the indexes, so the pages
+# are shared between the server's processes. The snapshot records the size,
+# mtime and SHA-256 of the JSON it was built from and a digest of the matching
+# code that built it, and is ignored once either changes, so rebuild it
+# whenever the reference addresses or the matching rules are updated.
+#
+#   python build_snapshot.py [--input addresses.json] [--output addresses.snapshot]
+
+
+def build(input_path, output_path, indexes):
+    """Build the snapshot of `input_path` with the given index sections and return a summary"""
+    started = time.perf_counter()
+    stat = os.stat(input_path)
+    with open(input_path, 'rb') as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    snapshot = ReferenceSnapshot(0, digest, parse_reference_addresses(json.loads(content) if content.strip() else None))
+
+    sections = {'addresses': snapshot.addresses.to_arrays()}
+    for name in indexes:
+        sections[name] = snapshot.derived(name, PREBUILT_INDEXES[name]).to_arrays()
+    source = {
+        'path': os.path.abspath(input_path),
+        'digest': digest,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'records': len(snapshot),
+        'builder': builder_digest(),
+    }
+    size = write_snapshot(output_path, source, sections)
+    return {'records': len(snapshot), 'sections': list(sections), 'bytes': size,
+            'build_seconds': time.perf_counter() - started}
+
+
+def cold_start(input_path, snapshot_path, indexes):
+    """Seconds until a fresh store serves the snapshot with every index, with and without the prebuilt file"""
+    result = {}
+    for name, path in (('json', None), ('prebuilt', snapshot_path)):
+        started = time.perf_counter()
+        snapshot = ReferenceStore(input_path, parse_reference_addresses, snapshot_path=path).snapshot()
+        for index in indexes:
+            snapshot.derived(index, PREBUILT_INDEXES[index])
+        result[f"{name}_seconds"] = time.perf_counter() - started
+        if path is not None and snapshot.prebuilt is None:
+            result['error'] = "the prebuilt snapshot was not used"
+    return result
+
+
+def parse_args(argv):
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="Build the memory-mapped snapshot of the reference addresses")
+    parser.add_argument('--input', default=REFERENCE_ADDRESSES_PATH, help="reference addresses JSON")
+    parser.add_argument('--output', default=REFERENCE_SNAPSHOT_PATH, help="snapshot file to write")
+    parser.add_argument('--indexes', nargs='*', choices=list(PREBUILT_INDEXES), default=list(PREBUILT_INDEXES),
+                        help="indexes to prebuild, all by default")
+    parser.add_argument('--no-verify', action='store_true', help="skip comparing the cold start with the JSON load")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not args.output:
+        print("Error: no --output and REFERENCE_SNAPSHOT_PATH is empty", file=sys.stderr)
+        sys.exit(1)
+    try:
+        summary = build(args.input, args.output, args.indexes)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not args.no_verify:
+        summary['cold_start'] = cold_start(args.input, args.output, args.indexes)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import csv
+import http.client
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from send_request import build_payload
+
+# Streams a CSV or JSONL file of addresses through the graph and writes one JSONL
+# result line per input record, in input order. Only `--window` records are read
+# ahead of the oldest unfinished one, so memory stays bounded for any input size.
+# Progress is checkpointed at the in-order watermark (next input offset, next
+# index and output size), so a restarted job truncates the output to the
+# checkpoint and continues from there.
+#
+#   python bulk_reconcile.py addresses.csv results.jsonl --concurrency 16
+
+ADDRESS_FIELDS = ('city', 'zip_code', 'country', 'province')
+
+
+class CheckpointMismatchError(Exception):
+    pass
+
+
+def parse_csv_line(text, header=None):
+    """Parse one CSV record, returning the list of cells or a field-name dict when the header is known"""
+    cells = next(csv.reader(io.StringIO(text)), [])
+    return dict(zip(header, cells)) if header is not None else cells
+
+
+def address_from_row(row):
+    """Build an address from a CSV row; address lines come from the `address_line*` columns in order"""
+    address = {field: (row.get(field) or "").strip() for field in ADDRESS_FIELDS}
+    address['address_lines'] = [value.strip() for column, value in row.items()
+                                if column and column.startswith('address_line') and value and value.strip()]
+    return address
+
+
+def address_from_json(record):
+    """Accept either an address or a request-like `{"address": {...}}` object"""
+    return record.get('address', record) if isinstance(record, dict) else record
+
+
+def read_records(file, input_format, offset):
+    """Yield (input offset after the record, address or None, parse error or None) from the byte offset on"""
+    header = None
+    if input_format == 'csv':
+        file.seek(0)
+        header_line = file.readline().decode('utf-8-sig')
+        header = [column.strip() for column in parse_csv_line(header_line)]
+        offset = max(offset, file.tell())
+    file.seek(offset)
+
+    text = ""
+    while True:
+        line = file.readline()
+        if not line:
+            break
+        text += line.decode('utf-8')
+        # A quoted CSV cell may contain line breaks, keep reading until the quotes are balanced
+        if input_format == 'csv' and text.count('"') % 2:
+            continue
+        record, text = text, ""
+        if not record.strip():
+            continue
+        try:
+            if input_format == 'csv':
+                address = address_from_row(parse_csv_line(record, header))
+            else:
+                address = address_from_json(json.loads(record))
+            yield file.tell(), address, None
+        except (ValueError, csv.Error) as e:
+            yield file.tell(), None, f"Invalid record: {e}"
+
+
+def load_checkpoint(path, input_path):
+    """Return the saved checkpoint for this input, or None to start from the beginning"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return None
+    if checkpoint.get('input') != os.path.abspath(input_path):
+        raise CheckpointMismatchError(f"Checkpoint {path} belongs to {checkpoint.get('input')}, use --restart")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def server_processor(host, timeout, retries):
+    """Process an address with a /runs/wait call, retrying connection errors and 5xx responses"""
+
+    def process(address):
+        error = None
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(min(30.0, 2 ** (attempt - 1)))
+            conn = http.client.HTTPConnection(host, timeout=timeout)
+            try:
+                conn.request("POST", "/runs/wait", json.dumps(build_payload(address, priority="bulk")),
+                             {'content-type': "application/json"})
+                res = conn.getresponse()
+                data = res.read()
+                if res.status == 200:
+                    return json.loads(data.decode("utf-8")), None
+                error = f"HTTP {res.status}"
+                if res.status < 500:
+                    break
+            except Exception as e:
+                error = str(e)
+            finally:
+                conn.close()
+        return None, error
+
+    return process
+
+
+def in_process_processor():
+    """Process an address by invoking the compiled graph in this process"""
+    from address_data_processing import graph
+
+    def process(address):
+        try:
+            return graph.invoke({'address': address}, {'configurable': {'priority': "bulk"}}), None
+        except Exception as e:
+            return None, str(e)
+
+    return process
+
+
+def reconcile(input_path, output_path, process, input_format, concurrency, window, checkpoint_path,
+              checkpoint_every, restart=False, progress_every=1000):
+    """Run every input record through `process` and return a summary; resumes from the checkpoint"""
+    checkpoint = None if restart else load_checkpoint(checkpoint_path, input_path)
+    offset = checkpoint['input_offset'] if checkpoint else 0
+    index = checkpoint['next_index'] if checkpoint else 0
+    start_index = index
+
+    output = open(output_path, 'r+b' if checkpoint and os.path.exists(output_path) else 'wb')
+    if checkpoint:
+        output.truncate(checkpoint['output_size'])
+        output.seek(checkpoint['output_size'])
+
+    summary = {'resumed_from': start_index, 'processed': 0, 'errors': 0}
+    started = time.perf_counter()
+    pending = {}
+
+    def write_next():
+        nonlocal index
+        future, next_offset = pending.pop(index)
+        result, error = future.result()
+        line = {'index': index, 'result': result, 'error': error}
+        output.write((json.dumps(line, ensure_ascii=False) + "\n").encode('utf-8'))
+        index += 1
+        summary['processed'] += 1
+        summary['errors'] += error is not None
+        if summary['processed'] % checkpoint_every == 0:
+            output.flush()
+            os.fsync(output.fileno())
+            save_checkpoint(checkpoint_path, {'input': os.path.abspath(input_path), 'input_offset': next_offset,
+                                              'next_index': index, 'output_size': output.tell()})
+        if progress_every and summary['processed'] % progress_every == 0:
+            elapsed = time.perf_counter() - started
+            print(f"Processed {index} records ({summary['processed'] / elapsed:.1f}/s, "
+                  f"{summary['errors']} errors)", file=sys.stderr)
+
+    try:
+        with open(input_path, 'rb') as file, ThreadPoolExecutor(max_workers=concurrency) as executor:
+            next_index = index
+            for next_offset, address, parse_error in read_records(file, input_format, offset):
+                if parse_error is not None:
+                    future = executor.submit(lambda error=parse_error: (None, error))
+                else:
+                    future = executor.submit(process, address)
+                pending[next_index] = (future, next_offset)
+                next_index += 1
+                # Write finished results in order; block on the oldest one once the window is full
+                while pending and (len(pending) >= window or pending[index][0].done()):
+                    write_next()
+            while pending:
+                write_next()
+        output.flush()
+        os.fsync(output.fileno())
+        with open(input_path, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            save_checkpoint(checkpoint_path, {'input': os.path.abspath(input_path), 'input_offset': file.tell(),
+                                              'next_index': index, 'output_size': output.tell()})
+    finally:
+        output.close()
+
+    summary['elapsed_s'] = time.perf_counter() - started
+    summary['records_per_s'] = summary['processed'] / summary['elapsed_s'] if summary['elapsed_s'] > 0 else 0.0
+    summary['total'] = index
+    return summary
+
+
+def parse_args(argv):
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="Stream a CSV/JSONL file of addresses through the address graph")
+    parser.add_argument('input', help="CSV with a header row or JSONL with one address per line")
+    parser.add_argument('output', help="JSONL file with one {index, result, error} line per input record")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help="input format, by default from the file extension")
+    parser.add_argument('--host', default="127.0.0.1:2024", help="server host:port")
+    parser.add_argument('--in-process', action='store_true', help="invoke the graph in this process instead")
+    parser.add_argument('--concurrency', type=int, default=8, help="records processed at the same time")
+    parser.add_argument('--window', type=int, help="records read ahead of the oldest unfinished one "
+                                                   "(default 4x concurrency)")
+    parser.add_argument('--timeout', type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument('--retries', type=int, default=2, help="retries of failed requests")
+    parser.add_argument('--checkpoint', help="checkpoint file, defaults to OUTPUT.checkpoint.json")
+    parser.add_argument('--checkpoint-every', type=int, default=100, help="records between two checkpoints")
+    parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint and start over")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    input_format = args.format or ('csv' if args.input.lower().endswith('.csv') else 'jsonl')
+    concurrency = max(1, args.concurrency)
+    process = in_process_processor() if args.in_process else server_processor(args.host, args.timeout, args.retries)
+
+    try:
+        summary = reconcile(args.input, args.output, process, input_format, concurrency,
+                            max(concurrency, args.window or 4 * concurrency),
+                            args.checkpoint or f"{args.output}.checkpoint.json", max(1, args.checkpoint_every),
+                            restart=args.restart)
+    except (FileNotFoundError, CheckpointMismatchError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from metrics import metrics
+from nodes.stats import collect_stats
+
+
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """Node, external call, token and cache metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def json_metrics(request: Request) -> JSONResponse:
+    """The same metrics with histogram quantiles, plus the index and cache statistics"""
+    return JSONResponse({'metrics': metrics.to_json(), 'stats': collect_stats()})
+
+
+# Custom routes mounted next to the LangGraph API (see "http" in langgraph.json)
+app = Starlette(routes=[
+    Route("/metrics", prometheus_metrics),
+    Route("/metrics.json", json_metrics),
+])
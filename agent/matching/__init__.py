@@ -0,0 +1,24 @@
+from .blocking_index import BlockingIndex, blocking_keys
+from .canonicalizer import CanonicalizationResult, Canonicalizer
+from .exact_match import ExactMatchIndex, canonical_key
+from .new_address_index import NewAddressIndex, SegmentedCandidateIndex, SegmentedExactMatchIndex
+from .similarity_index import SimilarityIndex, char_ngrams, similarity_text
+from .text import fold, tokenize, zip_digits
+
+__all__ = [
+    'BlockingIndex',
+    'CanonicalizationResult',
+    'Canonicalizer',
+    'ExactMatchIndex',
+    'NewAddressIndex',
+    'SegmentedCandidateIndex',
+    'SegmentedExactMatchIndex',
+    'SimilarityIndex',
+    'blocking_keys',
+    'canonical_key',
+    'char_ngrams',
+    'fold',
+    'similarity_text',
+    'tokenize',
+    'zip_digits'
+]
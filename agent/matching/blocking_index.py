@@ -0,0 +1,259 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from models import Address, AddressWithId
+from matching.text import fold, tokenize, zip_digits
+
+# Key weights are multiplied by the key's IDF, so rare keys dominate the score
+KEY_WEIGHTS = {
+    'zip': 3.0,
+    'zip_prefix': 1.0,
+    'city': 2.0,
+    'city_prefix': 1.5,
+    'street': 2.0,
+    'number': 0.5,
+}
+
+CITY_PREFIX_LENGTH = 4
+ZIP_PREFIX_LENGTH = 2
+MIN_STREET_TOKEN_LENGTH = 3
+# Posting lists longer than this (common keys such as a big city or a zip prefix) do not add
+# candidates, they only add their weight to the candidates of the rarer keys, so the work of a
+# query stays bounded as the reference set grows; while there are fewer candidates than the
+# limit, they add up to this many of their addresses
+MAX_POSTING_SCAN = 5000
+
+
+def blocking_keys(address: Address) -> List[Tuple[str, str]]:
+    """Build (kind, value) blocking keys for an address.
+
+    Keys are diacritic-folded, so "Marszalkowska"/"Warsaw" share keys with
+    "ul. Marszałkowska"/"warszawa" (street token and city prefix).
+    """
+    keys = []
+
+    zip_code = zip_digits(address.get('zip_code') or "")
+    if zip_code:
+        keys.append(('zip', zip_code))
+        keys.append(('zip_prefix', zip_code[:ZIP_PREFIX_LENGTH]))
+
+    city = "".join(tokenize(address.get('city') or ""))
+    if city:
+        keys.append(('city', city))
+        keys.append(('city_prefix', city[:CITY_PREFIX_LENGTH]))
+
+    for line in address.get('address_lines') or []:
+        for token in tokenize(line):
+            if token.isdigit() or any(ch.isdigit() for ch in token):
+                keys.append(('number', token))
+            elif len(token) >= MIN_STREET_TOKEN_LENGTH:
+                keys.append(('street', token))
+
+    return list(dict.fromkeys(keys))
+
+
+class _PostingLists(Mapping):
+    """Posting lists of one country stored as slices of a shared positions array."""
+
+    def __init__(self, keys: Dict[Tuple[str, str], int], positions: np.ndarray, offsets: np.ndarray):
+        self._keys = keys
+        self._positions = positions
+        self._offsets = offsets
+
+    def __getitem__(self, key: Tuple[str, str]) -> np.ndarray:
+        """Return the ascending positions of the addresses with the key, as a view of the shared array."""
+        posting = self._keys[key]
+        return self._positions[self._offsets[posting]:self._offsets[posting + 1]]
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class BlockingIndex:
+    """Inverted index from blocking keys to reference addresses.
+
+    Postings are partitioned by country, so a query with a known country only
+    touches that country's posting lists. Candidates are ranked by the sum of
+    IDF-weighted matching keys and only the top N are returned. Candidates
+    come from the rare keys of the query and are scored with numpy, so a
+    query's cost is bounded by MAX_POSTING_SCAN rather than the index size.
+    """
+
+    def __init__(self, addresses: Iterable[AddressWithId]):
+        # A sequence such as the snapshot's columnar store is kept as is, records are materialized on access
+        self.addresses: Sequence[AddressWithId] = addresses if isinstance(addresses, Sequence) else list(addresses)
+        postings: Dict[str, Dict[Tuple[str, str], List[int]]] = defaultdict(lambda: defaultdict(list))
+        country_sizes: Dict[str, int] = defaultdict(int)
+
+        for position, address in enumerate(self.addresses):
+            country = fold(address.get('country') or "")
+            country_sizes[country] += 1
+            for key in blocking_keys(address):
+                postings[country][key].append(position)
+
+        countries, lengths, positions = {}, [0], []
+        for country, country_postings in postings.items():
+            countries[country] = {'size': country_sizes[country], 'keys': [list(key) for key in country_postings]}
+            for posting in country_postings.values():
+                lengths.append(len(posting))
+                positions.extend(posting)
+        self._load({'countries': countries}, {
+            'positions': np.asarray(positions, dtype=np.int32),
+            'offsets': np.cumsum(lengths, dtype=np.int64),
+        })
+
+    def _load(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> None:
+        """Index the posting lists of every country as slices of the concatenated positions."""
+        self._meta = meta
+        self._arrays = arrays
+        self._postings: Dict[str, _PostingLists] = {}
+        self._country_sizes: Dict[str, int] = {}
+        posting = 0
+        for country, entry in meta['countries'].items():
+            keys = {}
+            for key in entry['keys']:
+                keys[tuple(key)] = posting
+                posting += 1
+            self._postings[country] = _PostingLists(keys, arrays['positions'], arrays['offsets'])
+            self._country_sizes[country] = entry['size']
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self._queries = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+        self._total_candidates = 0
+        self._empty_results = 0
+        self._stats_lock = threading.Lock()
+
+    def to_arrays(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """Return the keys and the concatenated posting lists, e.g. for `stores.snapshot_file.write_snapshot`."""
+        return self._meta, self._arrays
+
+    @classmethod
+    def from_arrays(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray],
+                    addresses: Sequence[AddressWithId]) -> 'BlockingIndex':
+        """Rebuild the index over `addresses` around the arrays of `to_arrays` without copying them."""
+        index = cls.__new__(cls)
+        index.addresses = addresses
+        index._load(meta, arrays)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    def _countries_for(self, address: Address) -> List[str]:
+        country = fold(address.get('country') or "")
+        if country in self._postings:
+            return [country]
+        # Unknown or malformed country - fall back to scanning every partition
+        return list(self._postings.keys())
+
+    def _rank(self, address: Address, limit: int) -> List[Tuple[AddressWithId, float]]:
+        """Score candidates sharing blocking keys with the address, without recording statistics."""
+        if limit <= 0:
+            return []
+        query_keys = blocking_keys(address)
+        pools, pool_scores = [], []
+        for country in self._countries_for(address):
+            postings = self._postings[country]
+            size = self._country_sizes[country]
+            hits = []
+            for key in query_keys:
+                positions = postings.get(key)
+                if positions is not None and len(positions):
+                    hits.append((positions, KEY_WEIGHTS[key[0]] * math.log(1 + size / len(positions))))
+            if not hits:
+                continue
+
+            # Rare keys propose the candidates, common keys only while there are too few of them
+            hits.sort(key=lambda hit: len(hit[0]))
+            proposed = [positions for positions, _ in hits if len(positions) <= MAX_POSTING_SCAN]
+            count = sum(len(positions) for positions in proposed)
+            for positions, _ in hits:
+                if count >= limit:
+                    break
+                if len(positions) > MAX_POSTING_SCAN:
+                    proposed.append(positions[:MAX_POSTING_SCAN])
+                    count += MAX_POSTING_SCAN
+            candidates = np.unique(np.concatenate(proposed))
+
+            # Every key adds its weight to the candidates in its posting list (sorted, so a binary search)
+            scores = np.zeros(len(candidates))
+            for positions, weight in hits:
+                found = np.minimum(np.searchsorted(positions, candidates), len(positions) - 1)
+                scores += weight * (positions[found] == candidates)
+            pools.append(candidates)
+            pool_scores.append(scores)
+        if not pools:
+            return []
+
+        candidates, scores = np.concatenate(pools), np.concatenate(pool_scores)
+        if len(candidates) > limit:
+            # Keep the top `limit` scores and every candidate tied with the last of them
+            threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            keep = scores >= threshold
+            candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((candidates, -scores))[:limit]
+        return [(self.addresses[int(candidates[i])], float(scores[i])) for i in order]
+
+    def search_with_scores(self, address: Address, limit: int) -> List[Tuple[AddressWithId, float]]:
+        """Return up to `limit` candidates with their blocking scores, best first."""
+        started = time.perf_counter()
+        result = self._rank(address, limit)
+        elapsed = time.perf_counter() - started
+
+        with self._stats_lock:
+            self._queries += 1
+            self._total_seconds += elapsed
+            self._max_seconds = max(self._max_seconds, elapsed)
+            self._total_candidates += len(result)
+            if not result:
+                self._empty_results += 1
+
+        return result
+
+    def search(self, address: Address, limit: int) -> List[AddressWithId]:
+        """Return up to `limit` candidate addresses, best first."""
+        return [candidate for candidate, _ in self.search_with_scores(address, limit)]
+
+    def match_probability(self, address: Address) -> float:
+        """Estimate how likely the address has a reference match, in [0, 1].
+
+        This is the score of the best candidate relative to the score of a
+        candidate that would share every blocking key of the query.
+        """
+        # Not recorded in the query statistics, which describe candidate searches
+        best = self._rank(address, 1)
+        if not best:
+            return 0.0
+        candidate, score = best[0]
+        country = fold(candidate.get('country') or "")
+        postings = self._postings[country]
+        size = self._country_sizes[country]
+        ideal = sum(KEY_WEIGHTS[key[0]] * math.log(1 + size / (len(postings.get(key, ())) or 1))
+                    for key in blocking_keys(address))
+        return min(1.0, score / ideal) if ideal else 0.0
+
+    def stats(self) -> dict:
+        """Return size, latency and candidate-count statistics for this index."""
+        queries = self._queries or 1
+        return {
+            'records': len(self.addresses),
+            'countries': len(self._postings),
+            'keys': sum(len(postings) for postings in self._postings.values()),
+            'queries': self._queries,
+            'avg_latency_ms': self._total_seconds / queries * 1000,
+            'max_latency_ms': self._max_seconds * 1000,
+            'avg_candidates': self._total_candidates / queries,
+            'empty_results': self._empty_results,
+        }
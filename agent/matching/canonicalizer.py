@@ -0,0 +1,260 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from typing_extensions import TypedDict
+
+from models import Address, AddressWithId
+from matching.text import fold, tokenize
+
+# Per-country rules. Zip codes are rebuilt from their digits using `zip_groups`
+# joined with `zip_separator`; street types map folded spellings to the canonical
+# abbreviation, `default_street_type` is used for a known street whose reference
+# spelling has no type; exonyms map folded foreign names to the name used in the
+# country.
+COUNTRY_RULES = {
+    'PL': {
+        'zip_groups': (2, 3),
+        'zip_separator': '-',
+        'street_types': {
+            'ul': 'Ul.', 'ulica': 'Ul.',
+            'al': 'Al.', 'aleja': 'Al.', 'aleje': 'Al.',
+            'pl': 'Pl.', 'plac': 'Pl.',
+            'os': 'Os.', 'osiedle': 'Os.',
+            'rondo': 'Rondo',
+        },
+        'default_street_type': 'Ul.',
+        'city_exonyms': {
+            'warsaw': 'Warszawa', 'warschau': 'Warszawa',
+            'cracow': 'Kraków', 'krakau': 'Kraków',
+            'danzig': 'Gdańsk', 'breslau': 'Wrocław', 'posen': 'Poznań', 'stettin': 'Szczecin',
+        },
+        'province_exonyms': {
+            'masovian': 'Mazowieckie', 'masovia': 'Mazowieckie',
+            'lesser poland': 'Małopolskie', 'greater poland': 'Wielkopolskie',
+            'lower silesian': 'Dolnośląskie', 'silesian': 'Śląskie', 'pomeranian': 'Pomorskie',
+        },
+    },
+    'CZ': {
+        'zip_groups': (3, 2),
+        'zip_separator': ' ',
+        'city_exonyms': {'prague': 'Praha', 'prag': 'Praha', 'pilsen': 'Plzeň', 'brunn': 'Brno', 'olmutz': 'Olomouc'},
+        'province_exonyms': {'prague': 'Praha', 'south moravian': 'Jihomoravský'},
+    },
+    'SK': {
+        'zip_groups': (3, 2),
+        'zip_separator': ' ',
+        'city_exonyms': {'pressburg': 'Bratislava', 'kaschau': 'Košice', 'kassa': 'Košice'},
+        'province_exonyms': {},
+    },
+    'HU': {
+        'zip_groups': (4,),
+        'zip_separator': '',
+        'city_exonyms': {'funfkirchen': 'Pécs', 'raab': 'Győr', 'odenburg': 'Sopron'},
+        'province_exonyms': {},
+    },
+}
+
+# Words kept in lowercase inside proper names, e.g. "Ústí nad Labem"
+LOWERCASE_WORDS = {'nad', 'pod', 'na', 'pri', 'u', 'w', 'z', 'i'}
+
+HOUSE_NUMBER_RE = re.compile(r"^\d+[a-zA-Z]?(/\d+[a-zA-Z]?)?$")
+
+# Leading zip code digits that must match a reference address of the city for a complete result
+CITY_ZIP_PREFIX_LENGTH = 2
+
+
+class CanonicalizationResult(TypedDict):
+    address: Address
+    complete: bool
+    changes: List[str]
+
+
+def proper_name(name: str) -> str:
+    """Capitalize every word of a place name except connecting words."""
+    words = []
+    for position, word in enumerate(name.split()):
+        if position > 0 and word.lower() in LOWERCASE_WORDS:
+            words.append(word.lower())
+        else:
+            words.append("-".join(part[:1].upper() + part[1:].lower() for part in word.split('-')))
+    return " ".join(words)
+
+
+def clean_punctuation(text: str) -> str:
+    """Collapse whitespace and drop stray punctuation around the text."""
+    text = re.sub(r"\s+", " ", text or "").strip()
+    text = re.sub(r"\s+([,.;:])", r"\1", text)
+    return text.strip(" ,;:")
+
+
+class Canonicalizer:
+    """Table-driven canonicalizer for the mechanical part of address normalization.
+
+    Known city, province and street spellings come from the reference
+    addresses, so "krakow" or "KRAKÓW" become "Kraków" and "marszalkowska 1"
+    becomes "Ul. Marszałkowska 1"; exonyms come from `COUNTRY_RULES`. The
+    result is `complete` only if every field could be validated by rules,
+    otherwise the caller should fall back to the LLM. Only single-line
+    addresses on a street known in that city, with a zip code prefix known
+    for that city, qualify; secondary lines ("lok. 5"), unknown streets and
+    fields that do not fit together are left to the LLM.
+    """
+
+    def __init__(self, reference_addresses: Iterable[AddressWithId]):
+        self.cities: Dict[str, Dict[str, str]] = {}
+        self.provinces: Dict[str, Dict[str, str]] = {}
+        self.streets: Dict[str, Dict[str, Tuple[Optional[str], str]]] = {}
+        # Per country and folded city name: its known streets and zip code prefixes
+        city_streets: Dict[str, Dict[str, set]] = {}
+        city_zip_prefixes: Dict[str, Dict[str, set]] = {}
+        for address in reference_addresses:
+            country = (address.get('country') or "").upper()
+            city = fold(address.get('city') or "")
+            if address.get('city'):
+                self.cities.setdefault(country, {})[city] = proper_name(address['city'])
+                zip_code = "".join(tokenize(address.get('zip_code') or ""))
+                if zip_code:
+                    city_zip_prefixes.setdefault(country, {}).setdefault(city, set()).add(
+                        zip_code[:CITY_ZIP_PREFIX_LENGTH])
+            if address.get('province'):
+                self.provinces.setdefault(country, {})[fold(address['province'])] = proper_name(address['province'])
+            street = self._split_street(address.get('address_lines') or [], COUNTRY_RULES.get(country, {}))
+            if street is not None:
+                street_type, name, _ = street
+                street_key = " ".join(tokenize(name))
+                self.streets.setdefault(country, {})[street_key] = (street_type, name)
+                city_streets.setdefault(country, {}).setdefault(city, set()).add(street_key)
+        self.city_streets = self._sorted_lists(city_streets)
+        self.city_zip_prefixes = self._sorted_lists(city_zip_prefixes)
+        self._city_sets = self._sets(self.city_streets, self.city_zip_prefixes)
+        for country, rules in COUNTRY_RULES.items():
+            for exonym, name in rules['city_exonyms'].items():
+                self.cities.setdefault(country, {})[exonym] = name
+            for exonym, name in rules['province_exonyms'].items():
+                self.provinces.setdefault(country, {})[exonym] = name
+
+    def to_arrays(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Return the known spellings, e.g. for `stores.snapshot_file.write_snapshot`."""
+        return {'cities': self.cities, 'provinces': self.provinces, 'streets': self.streets,
+                'city_streets': self.city_streets, 'city_zip_prefixes': self.city_zip_prefixes}, {}
+
+    @classmethod
+    def from_arrays(cls, meta: Dict[str, Any], arrays: Dict[str, Any]) -> 'Canonicalizer':
+        """Rebuild the canonicalizer from the spellings of `to_arrays`."""
+        canonicalizer = cls.__new__(cls)
+        canonicalizer.cities = meta['cities']
+        canonicalizer.provinces = meta['provinces']
+        canonicalizer.streets = {country: {key: tuple(street) for key, street in streets.items()}
+                                 for country, streets in meta['streets'].items()}
+        canonicalizer.city_streets = meta['city_streets']
+        canonicalizer.city_zip_prefixes = meta['city_zip_prefixes']
+        canonicalizer._city_sets = cls._sets(canonicalizer.city_streets, canonicalizer.city_zip_prefixes)
+        return canonicalizer
+
+    @staticmethod
+    def _sorted_lists(values: Dict[str, Dict[str, set]]) -> Dict[str, Dict[str, List[str]]]:
+        return {country: {city: sorted(items) for city, items in cities.items()} for country, cities in values.items()}
+
+    @staticmethod
+    def _sets(city_streets: Dict[str, Dict[str, List[str]]],
+              city_zip_prefixes: Dict[str, Dict[str, List[str]]]) -> Dict[Tuple[str, str], Tuple[set, set]]:
+        """Index the known streets and zip code prefixes by (country, folded city)."""
+        keys = {(country, city) for values in (city_streets, city_zip_prefixes)
+                for country, cities in values.items() for city in cities}
+        return {(country, city): (set(city_streets.get(country, {}).get(city, ())),
+                                  set(city_zip_prefixes.get(country, {}).get(city, ())))
+                for country, city in keys}
+
+    def _fits_city(self, canonical: Address, country: str, rules: dict) -> bool:
+        """Whether the street and the zip code prefix are known for the city, e.g. not a Kraków street in Gdańsk."""
+        streets, zip_prefixes = self._city_sets.get((country, fold(canonical['city'])), (set(), set()))
+        street = self._split_street(canonical['address_lines'], rules)
+        zip_code = "".join(tokenize(canonical['zip_code']))
+        return (street is not None and " ".join(tokenize(street[1])) in streets
+                and zip_code[:CITY_ZIP_PREFIX_LENGTH] in zip_prefixes)
+
+    def _zip_code(self, zip_code: str, rules: dict) -> Optional[str]:
+        digits = "".join(tokenize(zip_code))
+        groups = rules['zip_groups']
+        if not digits.isdigit() or len(digits) != sum(groups):
+            return None
+        parts, start = [], 0
+        for size in groups:
+            parts.append(digits[start:start + size])
+            start += size
+        return rules['zip_separator'].join(parts)
+
+    @staticmethod
+    def _split_street(address_lines: List[str], rules: dict) -> Optional[Tuple[Optional[str], str, str]]:
+        """Split a one-line street address into (street type, street name, house number)."""
+        if len(address_lines) != 1:
+            return None
+        words = clean_punctuation(address_lines[0]).replace('.', '. ').split()
+        street_type = rules.get('street_types', {}).get(fold(words[0]).rstrip('.')) if len(words) > 2 else None
+        if street_type is not None:
+            words = words[1:]
+        if len(words) < 2 or not HOUSE_NUMBER_RE.match(words[-1]):
+            return None
+        name = " ".join(words[:-1])
+        return street_type, name[:1].upper() + name[1:], words[-1]
+
+    def _address_lines(self, address_lines: List[str], country: str, rules: dict) -> Optional[List[str]]:
+        street = self._split_street(address_lines, rules)
+        if street is None:
+            return None
+        street_type, name, number = street
+        known = self.streets.get(country, {}).get(" ".join(tokenize(name)))
+        if known is None:
+            return None
+        known_type, known_name = known
+        if street_type is not None and known_type is not None and street_type != known_type:
+            # "Al. Długa" is not "Ul. Długa"
+            return None
+        street_type = known_type or rules.get('default_street_type')
+        return [" ".join(([street_type] if street_type else []) + [known_name, number])]
+
+    def canonicalize(self, address: Address) -> CanonicalizationResult:
+        """Apply the rules of the address's country to every field."""
+        country = clean_punctuation(address.get('country') or "").upper()
+        rules = COUNTRY_RULES.get(country)
+        canonical = Address(
+            city=clean_punctuation(address.get('city') or ""),
+            zip_code=clean_punctuation(address.get('zip_code') or ""),
+            country=country,
+            province=clean_punctuation(address.get('province') or ""),
+            address_lines=[clean_punctuation(line) for line in address.get('address_lines') or [] if clean_punctuation(line)],
+        )
+        complete = rules is not None
+
+        if rules is not None:
+            zip_code = self._zip_code(canonical['zip_code'], rules)
+            if zip_code is None:
+                complete = False
+            else:
+                canonical['zip_code'] = zip_code
+
+            city = self.cities.get(country, {}).get(fold(canonical['city']))
+            if city is None:
+                complete = False
+            else:
+                canonical['city'] = city
+
+            province = self.provinces.get(country, {}).get(fold(canonical['province']))
+            if province is None:
+                complete = False
+            else:
+                canonical['province'] = province
+
+            address_lines = self._address_lines(canonical['address_lines'], country, rules)
+            if address_lines is None:
+                complete = False
+            else:
+                canonical['address_lines'] = address_lines
+
+            if complete and not self._fits_city(canonical, country, rules):
+                complete = False
+
+        changes = [field for field in ('city', 'zip_code', 'country', 'province', 'address_lines')
+                   if canonical[field] != address.get(field)]
+        return CanonicalizationResult(address=canonical, complete=complete, changes=changes)
+
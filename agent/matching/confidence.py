@@ -0,0 +1,88 @@
+import re
+from difflib import SequenceMatcher
+from typing import Iterable, List, Tuple
+
+from models import Address, AddressWithId
+from matching.canonicalizer import COUNTRY_RULES
+from matching.text import tokenize, zip_digits
+
+# Weights of the per-field similarities; fields empty on either side are left out
+FIELD_WEIGHTS = {
+    'address_lines': 0.45,
+    'zip_code': 0.25,
+    'city': 0.2,
+    'province': 0.1,
+}
+# A different house number makes a different address however similar the street is
+HOUSE_NUMBER_MISMATCH_FACTOR = 0.5
+
+STREET_TYPE_TOKENS = {street_type for rules in COUNTRY_RULES.values() for street_type in rules.get('street_types', {})}
+
+_COUNTRY_RE = re.compile(r"^[A-Za-z]{2}$")
+
+
+def _similarity(left: str, right: str) -> float:
+    if left == right:
+        return 1.0
+    return SequenceMatcher(None, left, right, autojunk=False).ratio()
+
+
+def _street_and_numbers(address: Address) -> Tuple[str, Tuple[str, ...]]:
+    words, numbers = [], []
+    for line in address.get('address_lines') or []:
+        for token in tokenize(line):
+            if any(ch.isdigit() for ch in token):
+                numbers.append(token)
+            elif token not in STREET_TYPE_TOKENS:
+                words.append(token)
+    return " ".join(words), tuple(numbers)
+
+
+def field_similarities(address: Address, candidate: Address) -> dict:
+    """Similarity in [0, 1] of each non-empty field, diacritic- and case-insensitive."""
+    similarities = {}
+
+    street, numbers = _street_and_numbers(address)
+    candidate_street, candidate_numbers = _street_and_numbers(candidate)
+    if street or numbers:
+        similarity = _similarity(street, candidate_street)
+        if numbers != candidate_numbers:
+            similarity *= HOUSE_NUMBER_MISMATCH_FACTOR
+        similarities['address_lines'] = similarity
+
+    zip_code, candidate_zip_code = zip_digits(address.get('zip_code') or ""), zip_digits(candidate.get('zip_code') or "")
+    if zip_code and candidate_zip_code:
+        similarities['zip_code'] = _similarity(zip_code, candidate_zip_code)
+
+    for field in ('city', 'province'):
+        value, candidate_value = " ".join(tokenize(address.get(field) or "")), " ".join(tokenize(candidate.get(field) or ""))
+        if value and candidate_value:
+            similarities[field] = _similarity(value, candidate_value)
+
+    return similarities
+
+
+def match_confidence(address: Address, candidate: Address) -> float:
+    """Weighted average of the field similarities; 0 for a different country."""
+    if " ".join(tokenize(address.get('country') or "")) != " ".join(tokenize(candidate.get('country') or "")):
+        return 0.0
+    similarities = field_similarities(address, candidate)
+    total_weight = sum(FIELD_WEIGHTS[field] for field in similarities)
+    if 'address_lines' not in similarities or not total_weight:
+        return 0.0
+    return sum(FIELD_WEIGHTS[field] * similarity for field, similarity in similarities.items()) / total_weight
+
+
+def rank_by_confidence(address: Address, candidates: Iterable[AddressWithId]) -> List[Tuple[AddressWithId, float]]:
+    """Score the candidates against the address, most confident first."""
+    scored = [(candidate, match_confidence(address, candidate)) for candidate in candidates]
+    return sorted(scored, key=lambda item: -item[1])
+
+
+def is_malformed(address: Address) -> bool:
+    """True if the address lacks what is needed to match it without outside help."""
+    if not _COUNTRY_RE.match((address.get('country') or "").strip()):
+        return True
+    if not any(tokenize(line) for line in address.get('address_lines') or []):
+        return True
+    return not (tokenize(address.get('city') or "") or zip_digits(address.get('zip_code') or ""))
@@ -0,0 +1,87 @@
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models import Address, AddressWithId
+from matching.canonicalizer import Canonicalizer
+from matching.text import tokenize, zip_digits
+
+CanonicalKey = Tuple[str, str, str, Tuple[str, ...]]
+
+
+def canonical_key(address: Address) -> CanonicalKey:
+    """Build a case-, whitespace-, punctuation- and diacritic-insensitive key.
+
+    The key covers country, zip code, city and address lines, e.g.
+    "Ul.  Marszałkowska 1, WARSZAWA, 00-001" and "ul. marszalkowska 1, warszawa, 00001"
+    share the same key.
+    """
+    return (
+        " ".join(tokenize(address.get('country') or "")),
+        zip_digits(address.get('zip_code') or ""),
+        " ".join(tokenize(address.get('city') or "")),
+        tuple(" ".join(tokenize(line)) for line in address.get('address_lines') or [] if tokenize(line)),
+    )
+
+
+def key_hash(key: CanonicalKey) -> int:
+    """64-bit hash of a canonical key that is stable across processes, unlike `hash()`."""
+    digest = hashlib.blake2b(json.dumps(key, ensure_ascii=False).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class ExactMatchIndex:
+    """Hash index from canonical keys to reference addresses.
+
+    With a canonicalizer, both sides are passed through the rules first, so
+    "Warsaw, 00001, Marszałkowska 1" hits "warszawa, 00-001, ul. Marszałkowska 1".
+    Record positions are sorted by the stable hash of their key and found by
+    binary search; records are only materialized for a hit, and are checked
+    against the key in case of a hash collision. With `key_addresses`, the
+    key of each record is taken from the address at the same position
+    instead, e.g. the input a new address was normalized from.
+    """
+
+    def __init__(self, addresses: Iterable[AddressWithId], canonicalizer: Optional[Canonicalizer] = None,
+                 key_addresses: Optional[Sequence[Address]] = None):
+        self.canonicalizer = canonicalizer
+        self._records: Sequence[AddressWithId] = addresses if isinstance(addresses, Sequence) else list(addresses)
+        self._key_addresses = key_addresses if key_addresses is not None else self._records
+        hashes = np.fromiter((key_hash(self._key(address)) for address in self._key_addresses), dtype=np.uint64,
+                             count=len(self._key_addresses))
+        self._positions = np.argsort(hashes, kind='stable').astype(np.int32)
+        self._hashes = hashes[self._positions]
+
+    def to_arrays(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """Return the sorted key hashes and positions, e.g. for `stores.snapshot_file.write_snapshot`."""
+        return {}, {'hashes': self._hashes, 'positions': self._positions}
+
+    @classmethod
+    def from_arrays(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray], addresses: Sequence[AddressWithId],
+                    canonicalizer: Optional[Canonicalizer] = None) -> 'ExactMatchIndex':
+        """Rebuild the index over `addresses` around the arrays of `to_arrays` without copying them."""
+        index = cls.__new__(cls)
+        index.canonicalizer = canonicalizer
+        index._records = index._key_addresses = addresses
+        index._hashes = arrays['hashes']
+        index._positions = arrays['positions']
+        return index
+
+    def _key(self, address: Address) -> CanonicalKey:
+        if self.canonicalizer is not None:
+            address = self.canonicalizer.canonicalize(address)['address']
+        return canonical_key(address)
+
+    def __len__(self) -> int:
+        """Number of distinct keys."""
+        return int(np.count_nonzero(np.diff(self._hashes))) + 1 if len(self._hashes) else 0
+
+    def lookup(self, address: Address) -> List[AddressWithId]:
+        """Return all reference addresses sharing the canonical key of `address`."""
+        key = self._key(address)
+        value = np.uint64(key_hash(key))
+        start, end = np.searchsorted(self._hashes, value, side='left'), np.searchsorted(self._hashes, value, side='right')
+        return [self._records[int(position)] for position in self._positions[start:end]
+                if self._key(self._key_addresses[int(position)]) == key]
@@ -0,0 +1,166 @@
+import asyncio
+import os
+from typing import Union
+
+from matching.blocking_index import BlockingIndex
+from matching.canonicalizer import Canonicalizer
+from matching.exact_match import ExactMatchIndex
+from matching.new_address_index import (DeltaSegment, NewAddressIndex, SegmentedCandidateIndex,
+                                        SegmentedExactMatchIndex)
+from matching.similarity_index import SimilarityIndex
+from stores import ReferenceSnapshot, get_new_address_store, get_reference_store
+
+# Index that ranks the candidates of find_address_llm:
+# "blocking" - IDF-weighted blocking keys, "similarity" - TF-IDF over character n-grams
+CANDIDATE_RETRIEVER = os.environ.get("CANDIDATE_RETRIEVER", "blocking").lower()
+
+CandidateIndex = Union[BlockingIndex, SimilarityIndex, SegmentedCandidateIndex]
+
+# Structures derived from the reference addresses. They are built at most once
+# per snapshot and replaced together with it when the reference file changes;
+# a snapshot loaded from a prebuilt file maps them from its section of the same name.
+
+
+def build_blocking_index(snapshot: ReferenceSnapshot) -> BlockingIndex:
+    section = snapshot.section('blocking_index')
+    if section is not None:
+        return BlockingIndex.from_arrays(*section, snapshot.addresses)
+    return BlockingIndex(snapshot.addresses)
+
+
+def build_similarity_index(snapshot: ReferenceSnapshot) -> SimilarityIndex:
+    section = snapshot.section('similarity_index')
+    if section is not None:
+        return SimilarityIndex.from_arrays(*section, snapshot.addresses)
+    return SimilarityIndex(snapshot.addresses)
+
+
+def build_canonicalizer(snapshot: ReferenceSnapshot) -> Canonicalizer:
+    section = snapshot.section('canonicalizer')
+    if section is not None:
+        return Canonicalizer.from_arrays(*section)
+    return Canonicalizer(snapshot.addresses)
+
+
+def build_exact_match_index(snapshot: ReferenceSnapshot) -> ExactMatchIndex:
+    canonicalizer = snapshot.derived('canonicalizer', build_canonicalizer)
+    section = snapshot.section('exact_match_index')
+    if section is not None:
+        return ExactMatchIndex.from_arrays(*section, snapshot.addresses, canonicalizer)
+    return ExactMatchIndex(snapshot.addresses, canonicalizer)
+
+
+def build_new_address_index(snapshot: ReferenceSnapshot) -> NewAddressIndex:
+    canonicalizer = snapshot.derived('canonicalizer', build_canonicalizer)
+
+    def exact_match_index(segment: DeltaSegment) -> ExactMatchIndex:
+        # Keyed by the new address and by the input it was normalized from, so a repeat of the input matches
+        records = segment.addresses + [address for address, source in segment.entries if source is not None]
+        key_addresses = segment.addresses + [source for _, source in segment.entries if source is not None]
+        return ExactMatchIndex(records, canonicalizer, key_addresses)
+
+    return NewAddressIndex(get_new_address_store().since, {
+        'exact_match_index': exact_match_index,
+        'blocking_index': lambda segment: BlockingIndex(segment.addresses),
+        'similarity_index': lambda segment: SimilarityIndex(segment.addresses),
+    })
+
+
+# Factories of the structures a prebuilt snapshot can hold, by section name
+PREBUILT_INDEXES = {
+    'canonicalizer': build_canonicalizer,
+    'exact_match_index': build_exact_match_index,
+    'blocking_index': build_blocking_index,
+    'similarity_index': build_similarity_index,
+}
+
+
+def get_blocking_index() -> BlockingIndex:
+    """Return the blocking index for the current reference snapshot."""
+    return get_reference_store().snapshot().derived('blocking_index', build_blocking_index)
+
+
+async def aget_blocking_index() -> BlockingIndex:
+    """Async version of `get_blocking_index`, the reload and first build run in a worker thread."""
+    snapshot = await get_reference_store().asnapshot()
+    return await snapshot.aderived('blocking_index', build_blocking_index)
+
+
+def get_canonicalizer() -> Canonicalizer:
+    """Return the rule-based canonicalizer built from the current snapshot's known spellings."""
+    return get_reference_store().snapshot().derived('canonicalizer', build_canonicalizer)
+
+
+async def aget_canonicalizer() -> Canonicalizer:
+    """Async version of `get_canonicalizer`, the reload and first build run in a worker thread."""
+    snapshot = await get_reference_store().asnapshot()
+    return await snapshot.aderived('canonicalizer', build_canonicalizer)
+
+
+def get_new_address_index() -> NewAddressIndex:
+    """Return the delta segments of the new addresses, refreshed from the store when due."""
+    new_address_index = get_reference_store().snapshot().derived('new_address_index', build_new_address_index)
+    new_address_index.refresh()
+    return new_address_index
+
+
+async def aget_new_address_index() -> NewAddressIndex:
+    """Async version of `get_new_address_index`, a due refresh runs in a worker thread."""
+    snapshot = await get_reference_store().asnapshot()
+    new_address_index = await snapshot.aderived('new_address_index', build_new_address_index)
+    if new_address_index.refresh_due():
+        await asyncio.to_thread(new_address_index.refresh)
+    return new_address_index
+
+
+def refresh_new_address_index() -> None:
+    """Index the addresses saved since the last refresh right away, e.g. after saving one."""
+    get_reference_store().snapshot().derived('new_address_index', build_new_address_index).refresh(force=True)
+
+
+async def arefresh_new_address_index() -> None:
+    """Async version of `refresh_new_address_index`."""
+    snapshot = await get_reference_store().asnapshot()
+    new_address_index = await snapshot.aderived('new_address_index', build_new_address_index)
+    await asyncio.to_thread(new_address_index.refresh, True)
+
+
+def get_exact_match_index() -> SegmentedExactMatchIndex:
+    """Return the canonical-key index for the current reference snapshot and the new addresses."""
+    base = get_reference_store().snapshot().derived('exact_match_index', build_exact_match_index)
+    return SegmentedExactMatchIndex(base, get_new_address_index().indexes('exact_match_index'))
+
+
+async def aget_exact_match_index() -> SegmentedExactMatchIndex:
+    """Async version of `get_exact_match_index`, the reload and first build run in a worker thread."""
+    snapshot = await get_reference_store().asnapshot()
+    base = await snapshot.aderived('exact_match_index', build_exact_match_index)
+    new_address_index = await aget_new_address_index()
+    return SegmentedExactMatchIndex(base, new_address_index.indexes('exact_match_index'))
+
+
+def get_similarity_index() -> SimilarityIndex:
+    """Return the character n-gram similarity index for the current reference snapshot."""
+    return get_reference_store().snapshot().derived('similarity_index', build_similarity_index)
+
+
+async def aget_similarity_index() -> SimilarityIndex:
+    """Async version of `get_similarity_index`, the reload and first build run in a worker thread."""
+    snapshot = await get_reference_store().asnapshot()
+    return await snapshot.aderived('similarity_index', build_similarity_index)
+
+
+def get_candidate_index() -> CandidateIndex:
+    """Return the index selected by CANDIDATE_RETRIEVER, extended with the new addresses."""
+    name = 'similarity_index' if CANDIDATE_RETRIEVER == "similarity" else 'blocking_index'
+    base = get_similarity_index() if name == 'similarity_index' else get_blocking_index()
+    deltas = get_new_address_index().indexes(name)
+    return SegmentedCandidateIndex(base, deltas) if deltas else base
+
+
+async def aget_candidate_index() -> CandidateIndex:
+    """Async version of `get_candidate_index`."""
+    name = 'similarity_index' if CANDIDATE_RETRIEVER == "similarity" else 'blocking_index'
+    base = await aget_similarity_index() if name == 'similarity_index' else await aget_blocking_index()
+    deltas = (await aget_new_address_index()).indexes(name)
+    return SegmentedCandidateIndex(base, deltas) if deltas else base
@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from matching.confidence import rank_by_confidence
+from matching.exact_match import ExactMatchIndex
+from models import Address, AddressWithId
+
+# Seconds between two checks of the new address store for addresses saved by other processes
+NEW_ADDRESS_REFRESH_INTERVAL = float(os.environ.get("NEW_ADDRESS_REFRESH_INTERVAL", "5"))
+# Delta segments kept before a background merge combines them
+NEW_ADDRESS_MAX_SEGMENTS = int(os.environ.get("NEW_ADDRESS_MAX_SEGMENTS", "8"))
+
+# (new address, input address it was normalized from or None)
+Entry = Tuple[AddressWithId, Optional[Address]]
+
+
+class DeltaSegment:
+    """Immutable batch of new addresses; its indexes are built on first use."""
+
+    def __init__(self, entries: Sequence[Entry], factories: Dict[str, Callable[['DeltaSegment'], Any]]):
+        self.entries = list(entries)
+        self.addresses: List[AddressWithId] = [address for address, _ in self.entries]
+        self._factories = factories
+        self._indexes: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def index(self, name: str) -> Any:
+        index = self._indexes.get(name)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(name)
+                if index is None:
+                    index = self._indexes[name] = self._factories[name](self)
+        return index
+
+    def built(self) -> List[str]:
+        return list(self._indexes)
+
+
+class NewAddressIndex:
+    """Newly saved addresses indexed on top of the reference snapshot without rebuilding it.
+
+    New addresses are polled from the store (`load(cursor)`) and appended as
+    small immutable delta segments. Once there are more than `max_segments`,
+    a background thread merges the newest segments into one, together with
+    the oldest segment once the others have grown as large as it, so every
+    address is re-indexed only a logarithmic number of times. Queries see
+    the segments as they were when they started, before or after a merge.
+    """
+
+    def __init__(self, load: Callable[[int], Tuple[List[Entry], int]],
+                 factories: Dict[str, Callable[[DeltaSegment], Any]],
+                 refresh_interval: float = NEW_ADDRESS_REFRESH_INTERVAL, max_segments: int = NEW_ADDRESS_MAX_SEGMENTS):
+        self._load = load
+        self._factories = factories
+        self.refresh_interval = refresh_interval
+        self.max_segments = max_segments
+        self.segments: Tuple[DeltaSegment, ...] = ()
+        self._cursor = 0
+        self._next_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self._segments_lock = threading.Lock()
+        self._merging: Optional[threading.Thread] = None
+        self.refreshes = 0
+        self.merges = 0
+        self.merge_seconds = 0.0
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    def refresh_due(self) -> bool:
+        return time.monotonic() >= self._next_refresh
+
+    def refresh(self, force: bool = False) -> None:
+        """Append the addresses saved since the last refresh as a new segment, at most every refresh interval."""
+        if not force and not self.refresh_due():
+            return
+        with self._refresh_lock:
+            if not force and not self.refresh_due():
+                return
+            entries, cursor = self._load(self._cursor)
+            self._cursor = cursor
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            self.refreshes += 1
+            if not entries:
+                return
+            with self._segments_lock:
+                self.segments = self.segments + (DeltaSegment(entries, self._factories),)
+                if len(self.segments) > self.max_segments:
+                    self._start_merge()
+
+    def indexes(self, name: str) -> List[Any]:
+        """Return the index `name` of every current segment, building missing ones."""
+        return [segment.index(name) for segment in self.segments]
+
+    def _start_merge(self) -> None:
+        """Start a background merge; the caller holds `_segments_lock`."""
+        if self._merging is not None and self._merging.is_alive():
+            return
+        self._merging = threading.Thread(target=self._merge, name='new-address-merge', daemon=True)
+        self._merging.start()
+
+    def _merge(self) -> None:
+        try:
+            started = time.perf_counter()
+            segments = self.segments
+            rest = sum(len(segment) for segment in segments[1:])
+            merged_segments = segments if len(segments[0]) <= rest else segments[1:]
+            merged = DeltaSegment([entry for segment in merged_segments for entry in segment.entries],
+                                  self._factories)
+            # Build what the queries already use, so they never wait for the merged segment
+            for name in {name for segment in merged_segments for name in segment.built()}:
+                merged.index(name)
+
+            with self._segments_lock:
+                # Segments appended during the merge stay after the merged one
+                added = self.segments[len(segments):]
+                kept = segments[:len(segments) - len(merged_segments)]
+                self.segments = kept + (merged,) + added
+                self.merges += 1
+                self.merge_seconds += time.perf_counter() - started
+                if len(self.segments) > self.max_segments:
+                    self._merging = None
+                    self._start_merge()
+        except Exception as e:
+            print(f"Error merging new address segments: {e}")
+
+    def stats(self) -> dict:
+        segments = self.segments
+        return {
+            'records': sum(len(segment) for segment in segments),
+            'segments': len(segments),
+            'refreshes': self.refreshes,
+            'merges': self.merges,
+            'avg_merge_ms': self.merge_seconds / self.merges * 1000 if self.merges else 0.0,
+        }
+
+
+class SegmentedExactMatchIndex:
+    """Exact match lookups over the reference index and the new address segments."""
+
+    def __init__(self, base: ExactMatchIndex, deltas: Sequence[ExactMatchIndex]):
+        self.base = base
+        self.deltas = deltas
+
+    def __len__(self) -> int:
+        return len(self.base) + sum(len(delta) for delta in self.deltas)
+
+    def lookup(self, address: Address) -> List[AddressWithId]:
+        """Return the reference addresses, then the new addresses, sharing the canonical key of `address`."""
+        matches, new_ids = self.base.lookup(address), set()
+        for delta in self.deltas:
+            for match in delta.lookup(address):
+                # A new address is keyed twice when its input has the same key as the address itself
+                if match['id'] not in new_ids:
+                    new_ids.add(match['id'])
+                    matches.append(match)
+        return matches
+
+
+class SegmentedCandidateIndex:
+    """Candidate search over the reference index and the new address segments.
+
+    Scores of indexes built over different records are not comparable (the
+    IDF of a key depends on the records), so when the segments contribute
+    candidates the pool is ordered by `match_confidence` instead, which only
+    depends on the address and the candidate.
+    """
+
+    def __init__(self, base: Any, deltas: Sequence[Any]):
+        self.base = base
+        self.deltas = deltas
+
+    def __len__(self) -> int:
+        return len(self.base) + sum(len(delta) for delta in self.deltas)
+
+    def search_with_scores(self, address: Address, limit: int) -> List[Tuple[AddressWithId, float]]:
+        """Return up to `limit` candidates, best first; with new address candidates the score is the confidence."""
+        result = self.base.search_with_scores(address, limit)
+        delta_candidates = [candidate for delta in self.deltas for candidate, _ in delta.search_with_scores(address, limit)]
+        if not delta_candidates:
+            return result
+        return rank_by_confidence(address, [candidate for candidate, _ in result] + delta_candidates)[:limit]
+
+    def search(self, address: Address, limit: int) -> List[AddressWithId]:
+        """Return up to `limit` candidate addresses, best first."""
+        return [candidate for candidate, _ in self.search_with_scores(address, limit)]
+
+    def stats(self) -> dict:
+        return self.base.stats()
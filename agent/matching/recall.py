@@ -0,0 +1,67 @@
+import time
+from typing import List, Tuple, Union
+
+from models import Address, AddressWithId
+from matching.blocking_index import BlockingIndex
+from matching.similarity_index import SimilarityIndex
+from matching.text import fold, zip_digits
+
+
+def _perturb(address: AddressWithId) -> Address:
+    """Simulate a typical fuzzy query: no diacritics, no street type, no zip hyphen."""
+    address_lines = []
+    for line in address['address_lines']:
+        tokens = line.split()
+        if tokens and tokens[0].rstrip('.').lower() in ('ul', 'al', 'pl', 'os'):
+            tokens = tokens[1:]
+        address_lines.append(fold(" ".join(tokens)).title())
+    return Address(
+        city=fold(address['city']).title(),
+        zip_code=zip_digits(address['zip_code']),
+        country=address['country'],
+        province=address['province'],
+        address_lines=address_lines,
+    )
+
+
+def evaluate_recall(index: Union[BlockingIndex, SimilarityIndex], queries: List[Tuple[Address, str]], limit: int) -> dict:
+    """Measure recall@limit and latency for (query address, expected id) pairs."""
+    hits = 0
+    latencies = []
+    for query, expected_id in queries:
+        started = time.perf_counter()
+        candidates = index.search(query, limit)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if any(candidate['id'] == expected_id for candidate in candidates):
+            hits += 1
+
+    latencies.sort()
+    total = len(queries) or 1
+    return {
+        'queries': len(queries),
+        'limit': limit,
+        'recall': hits / total,
+        'p50_latency_ms': latencies[len(latencies) // 2] if latencies else 0.0,
+        'p95_latency_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    from stores import get_reference_store
+
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    reference = get_reference_store().all()
+    exact_queries = [(address, address['id']) for address in reference]
+    fuzzy_queries = [(_perturb(address), address['id']) for address in reference]
+
+    report = {}
+    for name, index in (('blocking', BlockingIndex(reference)), ('similarity', SimilarityIndex(reference))):
+        report[name] = {
+            'exact': evaluate_recall(index, exact_queries, limit),
+            'fuzzy': evaluate_recall(index, fuzzy_queries, limit),
+            'index': index.stats(),
+        }
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,188 @@
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from models import Address, AddressWithId
+from matching.text import fold, zip_digits
+
+NGRAM_SIZE = 3
+# N-grams found in more than this share of the records (e.g. " ul") barely
+# discriminate but dominate the cost of the matrix product, so queries skip them
+MAX_DOCUMENT_FREQUENCY = 0.2
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def similarity_text(address: Address) -> str:
+    """Diacritic-folded text the n-grams are taken from: address lines, zip digits and city."""
+    parts = list(address.get('address_lines') or [])
+    parts.append(zip_digits(address.get('zip_code') or ""))
+    parts.append(address.get('city') or "")
+    return " ".join(_NON_ALNUM_RE.sub(" ", fold(part)).strip() for part in parts if part)
+
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> Counter:
+    """Count the character n-grams of every word padded with a space on both sides."""
+    grams = Counter()
+    for word in text.split():
+        padded = f" {word} "
+        for start in range(max(1, len(padded) - n + 1)):
+            grams[padded[start:start + n]] += 1
+    return grams
+
+
+class SimilarityIndex:
+    """TF-IDF index over character n-grams of the reference addresses.
+
+    Records are rows of an L2-normalized sparse matrix, so the cosine
+    similarity of a batch of queries to every record is a single sparse
+    matrix product. Only the top `limit` records per query are returned,
+    restricted to the query's country when that country is indexed.
+    """
+
+    def __init__(self, addresses: Iterable[AddressWithId], n: int = NGRAM_SIZE,
+                 max_document_frequency: float = MAX_DOCUMENT_FREQUENCY):
+        self.addresses: Sequence[AddressWithId] = addresses if isinstance(addresses, Sequence) else list(addresses)
+        self.n = n
+        self.vocabulary: Dict[str, int] = {}
+
+        rows, columns, counts = [], [], []
+        for position, address in enumerate(self.addresses):
+            for gram, count in char_ngrams(similarity_text(address), n).items():
+                rows.append(position)
+                columns.append(self.vocabulary.setdefault(gram, len(self.vocabulary)))
+                counts.append(count)
+
+        records, features = len(self.addresses), len(self.vocabulary)
+        matrix = sparse.csr_matrix((np.asarray(counts, dtype=np.float32), (rows, columns)),
+                                   shape=(records, features))
+        document_frequency = np.bincount(matrix.indices, minlength=features)
+        self.idf = (np.log((1 + records) / (1 + document_frequency)) + 1).astype(np.float32)
+        # Feature columns the queries use, the others are too common to matter
+        self._query_features = document_frequency <= max(1, max_document_frequency * records)
+
+        matrix.data = (1 + np.log(matrix.data)) * self.idf[matrix.indices]
+        self._matrix_t = _normalize_rows(matrix).T.tocsr()
+
+        country_codes: Dict[str, int] = {}
+        self._countries = np.fromiter(
+            (country_codes.setdefault(fold(address.get('country') or ""), len(country_codes))
+             for address in self.addresses), dtype=np.int32, count=records)
+        self._country_codes = country_codes
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self._queries = 0
+        self._batches = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def to_arrays(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """Return the vocabulary and the matrix arrays, e.g. for `stores.snapshot_file.write_snapshot`."""
+        meta = {'n': self.n, 'vocabulary': list(self.vocabulary), 'country_codes': self._country_codes}
+        return meta, {
+            'idf': self.idf,
+            'query_features': self._query_features,
+            'matrix_data': self._matrix_t.data,
+            'matrix_indices': self._matrix_t.indices,
+            'matrix_indptr': self._matrix_t.indptr,
+            'countries': self._countries,
+        }
+
+    @classmethod
+    def from_arrays(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray],
+                    addresses: Sequence[AddressWithId]) -> 'SimilarityIndex':
+        """Rebuild the index over `addresses` around the arrays of `to_arrays` without copying them."""
+        index = cls.__new__(cls)
+        index.addresses = addresses
+        index.n = meta['n']
+        index.vocabulary = {gram: column for column, gram in enumerate(meta['vocabulary'])}
+        index.idf = arrays['idf']
+        index._query_features = arrays['query_features']
+        index._matrix_t = sparse.csr_matrix(
+            (arrays['matrix_data'], arrays['matrix_indices'], arrays['matrix_indptr']),
+            shape=(len(index.vocabulary), len(addresses)), copy=False)
+        index._countries = arrays['countries']
+        index._country_codes = meta['country_codes']
+        index._reset_stats()
+        return index
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    def _query_matrix(self, addresses: Sequence[Address]) -> sparse.csr_matrix:
+        rows, columns, values = [], [], []
+        for row, address in enumerate(addresses):
+            for gram, count in char_ngrams(similarity_text(address), self.n).items():
+                column = self.vocabulary.get(gram)
+                if column is not None and self._query_features[column]:
+                    rows.append(row)
+                    columns.append(column)
+                    values.append((1 + np.log(count)) * self.idf[column])
+        matrix = sparse.csr_matrix((np.asarray(values, dtype=np.float32), (rows, columns)),
+                                   shape=(len(addresses), len(self.vocabulary)))
+        return _normalize_rows(matrix)
+
+    def _top(self, scores: sparse.csr_matrix, row: int, address: Address,
+             limit: int) -> List[Tuple[AddressWithId, float]]:
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        positions, values = scores.indices[start:end], scores.data[start:end]
+        country = self._country_codes.get(fold(address.get('country') or ""))
+        if country is not None:
+            same_country = self._countries[positions] == country
+            positions, values = positions[same_country], values[same_country]
+        if len(values) > limit:
+            best = np.argpartition(-values, limit - 1)[:limit]
+            positions, values = positions[best], values[best]
+        order = np.lexsort((positions, -values))
+        return [(self.addresses[positions[i]], float(values[i])) for i in order]
+
+    def search_batch(self, addresses: Sequence[Address], limit: int) -> List[List[Tuple[AddressWithId, float]]]:
+        """Return up to `limit` candidates with cosine scores for each address, best first."""
+        if not addresses:
+            return []
+        started = time.perf_counter()
+        scores = (self._query_matrix(addresses) @ self._matrix_t).tocsr()
+        result = [self._top(scores, row, address, limit) for row, address in enumerate(addresses)]
+        elapsed = time.perf_counter() - started
+
+        with self._stats_lock:
+            self._queries += len(addresses)
+            self._batches += 1
+            self._total_seconds += elapsed
+            self._max_seconds = max(self._max_seconds, elapsed)
+
+        return result
+
+    def search_with_scores(self, address: Address, limit: int) -> List[Tuple[AddressWithId, float]]:
+        """Return up to `limit` candidates with their cosine scores, best first."""
+        return self.search_batch([address], limit)[0]
+
+    def search(self, address: Address, limit: int) -> List[AddressWithId]:
+        """Return up to `limit` candidate addresses, best first."""
+        return [candidate for candidate, _ in self.search_with_scores(address, limit)]
+
+    def stats(self) -> dict:
+        """Return size and latency statistics for this index."""
+        batches = self._batches or 1
+        return {
+            'records': len(self.addresses),
+            'features': len(self.vocabulary),
+            'nonzeros': int(self._matrix_t.nnz),
+            'queries': self._queries,
+            'batches': self._batches,
+            'avg_batch_latency_ms': self._total_seconds / batches * 1000,
+            'max_batch_latency_ms': self._max_seconds * 1000,
+        }
+
+
+def _normalize_rows(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix, dtype=np.float32)
@@ -0,0 +1,35 @@
+import re
+import unicodedata
+from typing import List
+
+# Letters that do not decompose into a base letter + combining mark under NFKD
+_SPECIAL_FOLDS = str.maketrans({
+    'ł': 'l', 'Ł': 'L',
+    'đ': 'd', 'Đ': 'D',
+    'ø': 'o', 'Ø': 'O',
+    'ß': 'ss',
+    'æ': 'ae', 'Æ': 'AE',
+    'œ': 'oe', 'Œ': 'OE',
+})
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    """Lowercase the text and strip diacritics, e.g. "Łódź" -> "lodz"."""
+    if not text:
+        return ""
+    text = text.translate(_SPECIAL_FOLDS)
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return stripped.casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split diacritic-folded text into alphanumeric tokens."""
+    return _TOKEN_RE.findall(fold(text))
+
+
+def zip_digits(zip_code: str) -> str:
+    """Keep only the alphanumeric characters of a zip code, e.g. "00-001" -> "00001"."""
+    return "".join(tokenize(zip_code))
@@ -0,0 +1,32 @@
+from .instrument import (
+    instrumented_node,
+    record_cache_lookup,
+    record_client_setup,
+    record_coalesced_call,
+    record_confidence_route,
+    record_external_call,
+    record_find_candidates,
+    record_llm_prompt,
+    record_llm_usage,
+    record_scheduler_throttle,
+    record_scheduler_wait
+)
+from .registry import Counter, Histogram, MetricsRegistry, metrics
+
+__all__ = [
+    'Counter',
+    'Histogram',
+    'MetricsRegistry',
+    'instrumented_node',
+    'metrics',
+    'record_cache_lookup',
+    'record_client_setup',
+    'record_coalesced_call',
+    'record_confidence_route',
+    'record_external_call',
+    'record_find_candidates',
+    'record_llm_prompt',
+    'record_llm_usage',
+    'record_scheduler_throttle',
+    'record_scheduler_wait'
+]
@@ -0,0 +1,184 @@
+import contextvars
+import inspect
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+
+from metrics.registry import CHAR_BUCKETS, COUNT_BUCKETS, TOKEN_BUCKETS, metrics
+
+# Attach each node's measurements to its LangSmith run as metadata (only when tracing is enabled)
+METRICS_RUN_METADATA = os.environ.get("METRICS_RUN_METADATA", "false").lower() in ("1", "true", "yes")
+
+node_duration = metrics.histogram('address_node_duration_seconds', "Wall time of a graph node")
+node_queue = metrics.histogram('address_node_queue_seconds',
+                               "Time from the end of the node's previous superstep to the start of the node")
+node_errors = metrics.counter('address_node_errors_total', "Graph nodes that raised an exception")
+external_call_duration = metrics.histogram('address_external_call_duration_seconds',
+                                           "Wall time of calls to the LLM and the web search, by cache outcome")
+llm_input_tokens = metrics.histogram('address_llm_input_tokens', "Prompt tokens of an LLM call", TOKEN_BUCKETS)
+llm_output_tokens = metrics.histogram('address_llm_output_tokens', "Completion tokens of an LLM call", TOKEN_BUCKETS)
+llm_prompt_chars = metrics.histogram('address_llm_prompt_chars', "Characters in the messages of an LLM call", CHAR_BUCKETS)
+find_candidates = metrics.histogram('address_find_candidates', "Candidate addresses put into the find_address_llm prompt",
+                                    COUNT_BUCKETS)
+find_candidate_tokens = metrics.histogram('address_find_candidate_tokens', "Prompt tokens per candidate address",
+                                          COUNT_BUCKETS)
+cache_lookups = metrics.counter('address_cache_lookups_total', "Cache lookups by cache and outcome")
+client_setup = metrics.histogram('address_client_setup_seconds',
+                                 "Time to build a shared model or search client, including its first imports")
+coalesced_calls = metrics.counter('address_coalesced_calls_total',
+                                  "Pipeline stage calls by whether they ran (leader) or shared a concurrent call (follower)")
+scheduler_wait = metrics.histogram('address_scheduler_wait_seconds',
+                                   "Time a provider call waited for its quota and concurrency slot, by lane")
+scheduler_throttles = metrics.counter('address_scheduler_throttled_total', "Provider calls answered with a 429")
+confidence_routes = metrics.counter('address_confidence_routes_total', "Addresses by the route their match confidence chose")
+
+# Measurements of the node running in the current context, for METRICS_RUN_METADATA
+_node_record: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar('node_record', default=None)
+
+
+def _record(**values) -> None:
+    record = _node_record.get()
+    if record is not None:
+        for key, value in values.items():
+            record[key] = record.get(key, 0) + value
+
+
+class _NodeMeasurement:
+    def __init__(self, name: str, ready_at: Optional[float]):
+        self.name = name
+        self.ready_at = ready_at
+        self.record: Dict[str, Any] = {}
+        self.token = None
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.ready_at:
+            queued = max(0.0, time.time() - self.ready_at)
+            node_queue.observe(queued, {'node': self.name})
+            self.record['queue_seconds'] = queued
+        self.token = _node_record.set(self.record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        _node_record.reset(self.token)
+        node_duration.observe(seconds, {'node': self.name})
+        self.record['seconds'] = seconds
+        if exc_type is not None:
+            node_errors.inc(labels={'node': self.name, 'error': exc_type.__name__})
+        if METRICS_RUN_METADATA:
+            _attach_run_metadata(self.record)
+        return False
+
+
+def _attach_run_metadata(record: Dict[str, Any]) -> None:
+    try:
+        from langsmith.run_helpers import get_current_run_tree
+
+        run_tree = get_current_run_tree()
+        if run_tree is not None:
+            run_tree.add_metadata({'metrics': dict(record)})
+    except Exception as e:
+        print(f"Error attaching metrics to run metadata: {e}")
+
+
+def instrumented_node(name: str, func: Callable, afunc: Optional[Callable] = None,
+                      queue_key: Optional[str] = None) -> RunnableLambda:
+    """Wrap sync/async node functions into a RunnableLambda that records node metrics.
+
+    With `queue_key`, every node stamps its finish time into that state key,
+    which must be reduced with a max-like reducer (see `models.latest`). The next superstep
+    starts once all of its predecessors finished, so the key holds the moment
+    the node became runnable and the difference to its start is the queueing
+    time.
+    """
+    pass_config = 'config' in inspect.signature(func).parameters
+
+    def finished(update):
+        if queue_key is None or not (update is None or isinstance(update, dict)):
+            return update
+        return dict(update or {}, **{queue_key: time.time()})
+
+    def run(state, config: RunnableConfig):
+        with _NodeMeasurement(name, state.get(queue_key) if queue_key else None):
+            update = func(state, config) if pass_config else func(state)
+        return finished(update)
+
+    if afunc is None:
+        return RunnableLambda(run, name=name)
+
+    async def arun(state, config: RunnableConfig):
+        with _NodeMeasurement(name, state.get(queue_key) if queue_key else None):
+            update = await (afunc(state, config) if pass_config else afunc(state))
+        return finished(update)
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
+def record_cache_lookup(cache: str, node: str, hit: bool) -> None:
+    """Count a lookup of one of the persistent caches."""
+    cache_lookups.inc(labels={'cache': cache, 'node': node, 'outcome': 'hit' if hit else 'miss'})
+    _record(**{f'{cache}_hits' if hit else f'{cache}_misses': 1})
+
+
+def record_external_call(service: str, node: str, seconds: float, cached: bool) -> None:
+    """Record the wall time of an LLM or web search call, served from a cache or not."""
+    external_call_duration.observe(seconds, {'service': service, 'node': node, 'cache': 'hit' if cached else 'miss'})
+    _record(**{f'{service}_seconds': seconds, f'{service}_calls': 1})
+
+
+def record_llm_prompt(node: str, messages: List[BaseMessage]) -> None:
+    """Record the size of the rendered prompt in characters."""
+    chars = sum(len(message.content) if isinstance(message.content, str) else len(str(message.content))
+                for message in messages)
+    llm_prompt_chars.observe(chars, {'node': node})
+    _record(prompt_chars=chars)
+
+
+def record_llm_usage(node: str, usage: Optional[Dict[str, Any]]) -> None:
+    """Record the token counts reported for an LLM call."""
+    if not usage:
+        return
+    input_tokens = usage.get('input_tokens') or 0
+    output_tokens = usage.get('output_tokens') or 0
+    llm_input_tokens.observe(input_tokens, {'node': node})
+    llm_output_tokens.observe(output_tokens, {'node': node})
+    _record(input_tokens=input_tokens, output_tokens=output_tokens)
+
+
+def record_find_candidates(count: int, tokens: int) -> None:
+    """Record how many candidate addresses went into the find prompt and their tokens per candidate."""
+    find_candidates.observe(count)
+    if count:
+        find_candidate_tokens.observe(tokens / count)
+    _record(candidates=count, candidate_tokens=tokens)
+
+
+def record_confidence_route(route: str) -> None:
+    """Count an address routed by its match confidence."""
+    confidence_routes.inc(labels={'route': route})
+
+
+def record_client_setup(client: str, seconds: float) -> None:
+    """Record how long building a shared client took."""
+    client_setup.observe(seconds, {'client': client})
+
+
+def record_coalesced_call(node: str, shared: bool) -> None:
+    """Count a coalesced stage call as its leader or as a follower sharing the leader's result."""
+    coalesced_calls.inc(labels={'node': node, 'role': 'follower' if shared else 'leader'})
+
+
+def record_scheduler_wait(resource: str, lane: str, seconds: float) -> None:
+    """Record how long a provider call waited in the scheduler."""
+    scheduler_wait.observe(seconds, {'resource': resource, 'lane': lane})
+    _record(scheduler_wait_seconds=seconds)
+
+
+def record_scheduler_throttle(resource: str) -> None:
+    """Count a provider call throttled with a 429."""
+    scheduler_throttles.inc(labels={'resource': resource})
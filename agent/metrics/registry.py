@@ -0,0 +1,163 @@
+import bisect
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+# Bucket upper bounds for the kinds of values that are recorded
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+CHAR_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> LabelValues:
+    return tuple(sorted((key, str(value)) for key, value in (labels or {}).items()))
+
+
+def _format_labels(labels: LabelValues, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter with one value per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def to_json(self) -> List[dict]:
+        with self._lock:
+            return [{'labels': dict(labels), 'value': value} for labels, value in sorted(self._values.items())]
+
+    def to_prometheus(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(labels)} {value}" for labels, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label set.
+
+    Besides the Prometheus buckets, the JSON view reports p50/p95/p99
+    interpolated within the buckets.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float]):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _labels(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [per-bucket counts incl. +Inf, count, sum, max]
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0, 0.0, 0.0]
+            series[0][position] += 1
+            series[1] += 1
+            series[2] += value
+            series[3] = max(series[3], value)
+
+    def _quantile(self, counts: List[int], count: int, maximum: float, fraction: float) -> float:
+        rank = fraction * count
+        seen = 0
+        for position, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                upper = min(self.buckets[position], maximum) if position < len(self.buckets) else maximum
+                lower = min(self.buckets[position - 1], upper) if position > 0 else 0.0
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return maximum
+
+    def to_json(self) -> List[dict]:
+        with self._lock:
+            series = [(labels, list(counts), count, total, maximum)
+                      for labels, (counts, count, total, maximum) in sorted(self._series.items())]
+        return [{
+            'labels': dict(labels),
+            'count': count,
+            'sum': total,
+            'mean': total / count if count else 0.0,
+            'max': maximum,
+            'p50': self._quantile(counts, count, maximum, 0.50),
+            'p95': self._quantile(counts, count, maximum, 0.95),
+            'p99': self._quantile(counts, count, maximum, 0.99),
+        } for labels, counts, count, total, maximum in series]
+
+    def to_prometheus(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(counts), count, total) for labels, (counts, count, total, _) in sorted(self._series.items())]
+        lines = []
+        for labels, counts, count, total in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide collection of named counters and histograms."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, factory):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = factory()
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._get(name, lambda: Counter(name, description))
+
+    def histogram(self, name: str, description: str, buckets: Sequence[float] = SECONDS_BUCKETS) -> Histogram:
+        return self._get(name, lambda: Histogram(name, description, buckets))
+
+    def to_json(self) -> dict:
+        """Return every metric with its series, histograms summarized with quantiles."""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        return {name: {'type': metric.kind, 'description': metric.description, 'series': metric.to_json()}
+                for name, metric in metrics}
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.to_prometheus())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
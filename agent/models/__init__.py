@@ -1,23 +1,47 @@
 from .address_models import (
     Address,
     AddressWithId,
+    ExactMatchInputState,
+    ExactMatchOutputState,
+    ConfidenceInputState,
+    ConfidenceOutputState,
     FindInputState,
     FindOutputState,
     WebSearchInputState,
     WebSearchOutputState,
     CheckNormalizeInputState,
     NormalizeOutputState,
-    GraphState
+    NormalizeBatchOutputState,
+    SpeculativeNormalizeOutputState,
+    GraphState,
+    ProcessingState,
+    BatchItemState,
+    BatchItemResult,
+    BatchInputState,
+    BatchOutputState,
+    BatchGraphState
 )
 
 __all__ = [
     'Address',
     'AddressWithId',
+    'ExactMatchInputState',
+    'ExactMatchOutputState',
+    'ConfidenceInputState',
+    'ConfidenceOutputState',
     'FindInputState',
     'FindOutputState',
     'WebSearchInputState',
     'WebSearchOutputState',
     'CheckNormalizeInputState',
     'NormalizeOutputState',
-    'GraphState'
+    'NormalizeBatchOutputState',
+    'SpeculativeNormalizeOutputState',
+    'GraphState',
+    'ProcessingState',
+    'BatchItemState',
+    'BatchItemResult',
+    'BatchInputState',
+    'BatchOutputState',
+    'BatchGraphState'
 ]
@@ -1,5 +1,6 @@
+import operator
 from typing import List
-from typing_extensions import TypedDict
+from typing_extensions import Annotated, TypedDict
 
 
 class Address(TypedDict):
@@ -14,6 +15,25 @@ class AddressWithId(Address):
     id: str
 
 
+class ExactMatchInputState(TypedDict):
+    address: Address
+
+
+class ExactMatchOutputState(TypedDict):
+    matchedAddresses: List[AddressWithId]
+
+
+class ConfidenceInputState(TypedDict):
+    address: Address
+
+
+class ConfidenceOutputState(TypedDict):
+    matchedAddresses: List[AddressWithId]
+    description: str
+    confidence: float
+    confidenceRoute: str
+
+
 class FindInputState(TypedDict):
     address: Address
     description: str
@@ -32,19 +52,62 @@ class WebSearchOutputState(TypedDict):
     description: str
 
 
-class CheckNormalizeInputState(TypedDict):
-    address: Address
-
-
 class NormalizeOutputState(TypedDict):
     normalizedAddress: Address
     description: str
     error: bool
 
 
+class NormalizeBatchOutputState(TypedDict):
+    results: List[NormalizeOutputState]
+
+
+class CheckNormalizeInputState(TypedDict):
+    address: Address
+    speculationId: str
+
+
+class SpeculativeNormalizeOutputState(TypedDict):
+    speculationId: str
+
+
 class GraphState(TypedDict):
     address: Address
     normalizedAddress: Address
     matchedAddresses: List[Address]
     description: str
     error: bool
+
+
+def latest(left: float, right: float) -> float:
+    """Reducer keeping the latest of two timestamps."""
+    return max(left, right)
+
+
+class ProcessingState(GraphState):
+    confidence: float
+    confidenceRoute: str
+    speculationId: str
+    lastNodeFinishedAt: Annotated[float, latest]
+
+
+class BatchItemState(TypedDict):
+    index: int
+    address: Address
+
+
+class BatchItemResult(TypedDict):
+    index: int
+    result: GraphState
+
+
+class BatchInputState(TypedDict):
+    addresses: List[Address]
+
+
+class BatchOutputState(TypedDict):
+    results: List[GraphState]
+
+
+class BatchGraphState(BatchInputState, BatchOutputState):
+    itemResults: Annotated[List[BatchItemResult], operator.add]
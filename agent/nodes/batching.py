@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+
+class _Batch:
+    """Items waiting for one call, with the futures of their callers."""
+
+    def __init__(self, full):
+        self.items: List[Any] = []
+        self.futures: List[Any] = []
+        self.submitted: List[float] = []
+        self.full = full
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+class MicroBatcher:
+    """Collects items of concurrent callers into batches that are processed by one call each.
+
+    The first item opens a batch; it is dispatched `window` seconds later or
+    as soon as it holds `max_size` items. `process` (or `aprocess` for async
+    callers) gets the items and returns one result per item, in order; each
+    caller gets its result, or the exception of the call. Threads and the
+    callers of each event loop are batched separately: the thread that opened
+    a batch dispatches it, on an event loop a task does, so a cancelled caller
+    does not strand the others.
+    """
+
+    def __init__(self, name: str, process: Callable[[List[Any]], List[Any]],
+                 aprocess: Callable[[List[Any]], Awaitable[List[Any]]], window: float, max_size: int):
+        self.name = name
+        self.process = process
+        self.aprocess = aprocess
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._open = None
+        self._async_open: Dict[int, _Batch] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.full_batches = 0
+        self.failed_batches = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.call_seconds = 0.0
+        self.tokens = 0
+        self.unbatched_tokens = 0
+
+    def submit(self, item: Any) -> Any:
+        """Process the item in the open batch of the calling threads and return its result."""
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch(threading.Event())
+            future = Future()
+            self._add(batch, item, future)
+            if len(batch) >= self.max_size:
+                self._open = None
+                batch.full.set()
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._dispatch(batch)
+        return future.result()
+
+    async def asubmit(self, item: Any) -> Any:
+        """Async version of `submit` for callers on the same event loop."""
+        loop = asyncio.get_running_loop()
+        key = id(loop)
+        batch = self._async_open.get(key)
+        if batch is None:
+            batch = self._async_open[key] = _Batch(asyncio.Event())
+            task = loop.create_task(self._adispatch_after_window(key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        future = loop.create_future()
+        self._add(batch, item, future)
+        if len(batch) >= self.max_size:
+            self._async_open.pop(key, None)
+            batch.full.set()
+        return await future
+
+    def _add(self, batch: _Batch, item: Any, future: Any) -> None:
+        batch.items.append(item)
+        batch.futures.append(future)
+        batch.submitted.append(time.perf_counter())
+
+    def _dispatch(self, batch: _Batch) -> None:
+        started = time.perf_counter()
+        try:
+            results = self.process(batch.items)
+            self._check(batch, results)
+        except Exception as e:
+            self._finish(batch, started, None, e)
+            return
+        self._finish(batch, started, results, None)
+
+    async def _adispatch_after_window(self, key: int, batch: _Batch) -> None:
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        if self._async_open.get(key) is batch:
+            self._async_open.pop(key)
+        started = time.perf_counter()
+        try:
+            results = await self.aprocess(batch.items)
+            self._check(batch, results)
+        except Exception as e:
+            self._finish(batch, started, None, e)
+            return
+        self._finish(batch, started, results, None)
+
+    def _check(self, batch: _Batch, results: List[Any]) -> None:
+        if len(results) != len(batch):
+            raise ValueError(f"{self.name} returned {len(results)} results for a batch of {len(batch)}")
+
+    def _finish(self, batch: _Batch, started: float, results, error) -> None:
+        finished = time.perf_counter()
+        for position, future in enumerate(batch.futures):
+            # A cancelled async caller no longer waits for its result
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[position])
+        waits = [started - submitted for submitted in batch.submitted]
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.full_batches += len(batch) >= self.max_size
+            self.failed_batches += error is not None
+            self.wait_seconds += sum(waits)
+            self.max_wait_seconds = max(self.max_wait_seconds, max(waits))
+            self.call_seconds += finished - started
+
+    def record_tokens(self, tokens: int, unbatched_tokens: int) -> None:
+        """Record the prompt tokens of a batch and what one call per item would have sent."""
+        with self._lock:
+            self.tokens += tokens
+            self.unbatched_tokens += unbatched_tokens
+
+    def stats(self) -> dict:
+        """Latency added by waiting for batches against the prompt tokens paid per item."""
+        return {
+            'window_ms': self.window * 1000,
+            'max_size': self.max_size,
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+            'full_batches': self.full_batches,
+            'failed_batches': self.failed_batches,
+            'avg_wait_ms': self.wait_seconds / self.items * 1000 if self.items else 0.0,
+            'max_wait_ms': self.max_wait_seconds * 1000,
+            'avg_call_ms': self.call_seconds / self.batches * 1000 if self.batches else 0.0,
+            'prompt_tokens_per_item': self.tokens / self.items if self.items else 0.0,
+            'unbatched_prompt_tokens_per_item': self.unbatched_tokens / self.items if self.items else 0.0,
+            'prompt_token_savings': 1 - self.tokens / self.unbatched_tokens if self.unbatched_tokens else 0.0,
+        }
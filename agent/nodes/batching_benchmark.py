@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import List
+
+# Offline by default: the synthetic provider answers every call after PROVIDER_LATENCY_MS
+os.environ.setdefault("PROVIDER_MODE", "synthetic")
+os.environ.setdefault("PROVIDER_LATENCY_MS", "800")
+
+from nodes import check_normalize_address  # noqa: E402
+from nodes.batching import MicroBatcher  # noqa: E402
+
+# Sweeps the window and batch size of the normalization micro-batcher and
+# reports, per setting, the latency an address pays (waiting for its batch
+# plus the call) against the prompt tokens paid per address. Addresses arrive
+# as a Poisson process at the given rate.
+# Run from the agent directory: python -m nodes.batching_benchmark [addresses per second] [addresses]
+
+WINDOWS_MS = (0, 10, 25, 50, 100, 200)
+MAX_SIZES = (1, 4, 8, 16)
+
+
+def sample_addresses(count: int) -> List[dict]:
+    """Distinct addresses that need the LLM"""
+    return [{'city': f"Miasto {n}", 'zip_code': f"{n % 100:02d}-{n % 1000:03d}", 'country': "PL",
+             'province': "mazowieckie", 'address_lines': [f"Ul. Testowa {n}"]} for n in range(count)]
+
+
+async def replay(batcher: MicroBatcher, addresses: List[dict], rate: float, seed: int = 0) -> List[float]:
+    """Submit the addresses at `rate` per second and return the latency of each"""
+    arrivals = random.Random(seed)
+
+    async def one(address):
+        started = time.perf_counter()
+        await batcher.asubmit(address)
+        return time.perf_counter() - started
+
+    tasks = []
+    for address in addresses:
+        tasks.append(asyncio.create_task(one(address)))
+        await asyncio.sleep(arrivals.expovariate(rate))
+    return sorted(await asyncio.gather(*tasks))
+
+
+def batcher_for(window_ms: float, max_size: int) -> MicroBatcher:
+    """Install a batcher with the setting; the batch functions account their tokens to the module's batcher"""
+    batcher = check_normalize_address.normalize_batcher = MicroBatcher(
+        "check_normalize_address_llm", check_normalize_address.normalize_addresses_llm,
+        check_normalize_address.anormalize_addresses_llm, window_ms / 1000, max_size)
+    return batcher
+
+
+def sweep(rate: float, count: int) -> List[dict]:
+    """Latency and prompt tokens per address for every window and batch size"""
+    addresses = sample_addresses(count)
+    # Unmeasured first replay: builds the clients and lets the scheduler's concurrency limit ramp up
+    asyncio.run(replay(batcher_for(0, 1), addresses, rate))
+    report = []
+    for max_size in MAX_SIZES:
+        for window_ms in (WINDOWS_MS if max_size > 1 else (0,)):
+            batcher = batcher_for(window_ms, max_size)
+            latencies = asyncio.run(replay(batcher, addresses, rate))
+            stats = batcher.stats()
+            report.append({
+                'window_ms': window_ms,
+                'max_size': max_size,
+                'avg_batch_size': stats['avg_batch_size'],
+                'p50_ms': latencies[len(latencies) // 2] * 1000,
+                'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+                'avg_wait_ms': stats['avg_wait_ms'],
+                'llm_calls': stats['batches'],
+                'prompt_tokens_per_address': stats['prompt_tokens_per_item'],
+                'prompt_token_savings': stats['prompt_token_savings'],
+            })
+    return report
+
+
+if __name__ == "__main__":
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(json.dumps({'rate': rate, 'addresses': count,
+                      'provider_latency_ms': float(os.environ["PROVIDER_LATENCY_MS"]),
+                      'settings': sweep(rate, count)}, indent=2))
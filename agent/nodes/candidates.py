@@ -0,0 +1,49 @@
+import os
+from typing import List, Optional, Sequence, Tuple
+
+from models import AddressWithId
+from providers import count_tokens
+
+# Token budget for the candidate list of the find_address_llm prompt
+FIND_ADDRESS_CANDIDATE_TOKEN_BUDGET = int(os.environ.get("FIND_ADDRESS_CANDIDATE_TOKEN_BUDGET", "1500"))
+
+CANDIDATE_COLUMNS = ('id', 'address_lines', 'zip_code', 'city', 'province', 'country')
+CANDIDATE_HEADER = "|".join(CANDIDATE_COLUMNS)
+
+
+def _field(value) -> str:
+    # Pipes and line breaks are the separators, keep them out of the values
+    return str(value or "").replace("|", "/").replace("\n", " ").strip()
+
+
+def serialize_candidate(address: AddressWithId) -> str:
+    """One pipe-separated line per candidate, columns as in CANDIDATE_HEADER."""
+    return "|".join([
+        _field(address.get('id')),
+        _field("; ".join(address.get('address_lines') or [])),
+        _field(address.get('zip_code')),
+        _field(address.get('city')),
+        _field(address.get('province')),
+        _field(address.get('country')),
+    ])
+
+
+def format_candidates(scored_candidates: Sequence[Tuple[AddressWithId, float]],
+                      token_budget: Optional[int] = None) -> Tuple[str, List[AddressWithId], int]:
+    """Serialize the best candidates that fit into the token budget.
+
+    Candidates are expected best-first (e.g. by blocking or similarity score) and are added
+    until the next one would exceed the budget. Returns the text with a header
+    line, the included candidates and the tokens spent on candidate lines.
+    """
+    budget = FIND_ADDRESS_CANDIDATE_TOKEN_BUDGET if token_budget is None else token_budget
+    lines, included, tokens = [], [], 0
+    for candidate, _ in scored_candidates:
+        line = serialize_candidate(candidate)
+        line_tokens = count_tokens(line) + 1
+        if tokens + line_tokens > budget:
+            break
+        lines.append(line)
+        included.append(candidate)
+        tokens += line_tokens
+    return "\n".join([CANDIDATE_HEADER] + lines), included, tokens
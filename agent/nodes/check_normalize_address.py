@@ -1,20 +1,44 @@
-from typing import List
-import json
+import asyncio
 import os
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import AzureChatOpenAI
-from models import Address, AddressWithId, CheckNormalizeInputState, NormalizeOutputState
+import threading
+from typing import List, Optional
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from matching import Canonicalizer
+from matching.indexes import (aget_canonicalizer, arefresh_new_address_index, get_canonicalizer,
+                              refresh_new_address_index)
+from metrics import record_llm_prompt
+from models import Address, AddressWithId, CheckNormalizeInputState, NormalizeBatchOutputState, NormalizeOutputState
+from nodes.batching import MicroBatcher
+from nodes.coalescing import check_normalize_flights, coalescing_key
+from nodes.speculation import speculative_normalizations
+from providers import count_message_tokens
+from stores import get_new_address_store
+from stores.llm_cache import acall_llm, ainvoke_structured, call_llm, invoke_structured
 
 
-# LLM instance
-llm = AzureChatOpenAI(
-    azure_deployment="gpt-4o",
-    api_version="2024-08-01-preview",
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
+# Azure OpenAI deployment; its shared client is built on the first call
+LLM_DEPLOYMENT = "gpt-4o"
+
+# Opt-in: normalize the addresses that miss the rules and the LLM cache within a short window in
+# one LLM call, so they share the instructions; each address waits up to the window for the others
+NORMALIZE_BATCH_ENABLED = os.environ.get("NORMALIZE_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+# Milliseconds the first address of a batch waits for more addresses
+NORMALIZE_BATCH_WINDOW_MS = float(os.environ.get("NORMALIZE_BATCH_WINDOW_MS", "50"))
+# Addresses per LLM call; a full batch is sent without waiting for the window
+NORMALIZE_BATCH_MAX_SIZE = int(os.environ.get("NORMALIZE_BATCH_MAX_SIZE", "8"))
+
+check_normalize_address_llm_rules = """- Put the normalized address in the "normalizedAddress" field in the output.
+- Check if country is a valid country ISO 2-letter code. If not, set the "error" field to "true".
+- Check if the city name is correctly spelled and capitalized. Check that the city exists in the specified country or if you are not aware of a city of such name check if there is a well-known city with a similar name and correct it.
+- If the city name is a translated version, use the name that is commonly used in the specified country. For example, for country "PL", replace "Warsaw" with "Warszawa".
+- If the city name does not resemble any existing city in the specified country, leave it as is.
+- Verify the zip code format is appropriate for the country. Normalize it if it differs from the desired format only due to missing hyphens or similar formatting issues but the type and number of characters is otherwise correct.
+- Ensure the province or state name is correctly spelled and capitalized. Check that the province exists in the specified country.
+- Standardize the address lines by removing any unnecessary punctuation and ensuring proper capitalization.
+- For Polish addresses, normalize the street address to contain the abbreviated street type, for example normalize "Cicha 27" to "Ul. Cicha 27" and "Plac Litewski 2/3" to "Pl. Litewski 2/3".
+- In the description field, include any additional context or comments about the address and its normalization.
+- If the address does not match the pattern of addresses found in the specified country, set the "error" field to "true".
+"""
 
 check_normalize_address_llm_instructions = """Your task is checking and normalizing the address provided below.
 The input address is:
@@ -28,99 +52,227 @@ The input address is:
 
 Follow these instructions carefully:
 
-- Put the normalized address in the "normalizedAddress" field in the output.
-- Check if country is a valid country ISO 2-letter code. If not, set the "error" field to "true".
-- Check if the city name is correctly spelled and capitalized. Check that the city exists in the specified country or if you are not aware of a city of such name check if there is a well-known city with a similar name and correct it.
-- If the city name is a translated version, use the name that is commonly used in the specified country. For example, for country "PL", replace "Warsaw" with "Warszawa".
-- If the city name does not resemble any existing city in the specified country, leave it as is.
-- Verify the zip code format is appropriate for the country. Normalize it if it differs from the desired format only due to missing hyphens or similar formatting issues but the type and number of characters is otherwise correct.
-- Ensure the province or state name is correctly spelled and capitalized. Check that the province exists in the specified country.
-- Standardize the address lines by removing any unnecessary punctuation and ensuring proper capitalization.
-- For Polish addresses, normalize the street address to contain the abbreviated street type, for example normalize "Cicha 27" to "Ul. Cicha 27" and "Plac Litewski 2/3" to "Pl. Litewski 2/3".
-- In the description field, include any additional context or comments about the address and its normalization.
-- If the address does not match the pattern of addresses found in the specified country, set the "error" field to "true".
+""" + check_normalize_address_llm_rules
+
+check_normalize_addresses_llm_batch_instructions = """Your task is checking and normalizing each of the addresses provided below, independently of each other.
+The input addresses are:
+{addresses}
+
+Follow these instructions carefully for every address:
+
+""" + check_normalize_address_llm_rules + """- Put exactly one result per input address in the "results" field, in the order of the input addresses.
 """
 
+check_normalize_batch_address = """<address index="{index}">
+    <city>{city}</city>
+    <zip_code>{zip_code}</zip_code>
+    <country>{country}</country>
+    <province>{province}</province>
+    <address_lines>{address_lines}</address_lines>
+</address>"""
+
+
+# How many addresses were normalized by rules and how many needed the LLM
+normalization_stats = {'rules': 0, 'llm': 0}
+_normalization_stats_lock = threading.Lock()
+
+
+def normalize_address_by_rules(state: CheckNormalizeInputState,
+                               canonicalizer: Optional[Canonicalizer] = None) -> Optional[NormalizeOutputState]:
+    """Normalize the address with deterministic rules; None if the LLM is needed"""
+    canonical = (canonicalizer or get_canonicalizer()).canonicalize(state['address'])
+    with _normalization_stats_lock:
+        normalization_stats['rules' if canonical['complete'] else 'llm'] += 1
+    if not canonical['complete']:
+        return None
+    if canonical['changes']:
+        description = f"Normalized by rules, changed: {', '.join(canonical['changes'])}."
+    else:
+        description = "Address is already normalized."
+    return NormalizeOutputState(normalizedAddress=canonical['address'], description=description, error=False)
+
 
-def load_new_addresses() -> List[AddressWithId]:
-    """Load existing new addresses from the JSON file."""
-    current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    json_path = os.path.join(current_dir, 'resources', 'new-addresses.json')
+def save_new_address(new_address: Address, source: Optional[Address] = None, error: bool = False) -> AddressWithId:
+    """Append a new address to the new address store and index it for matching; return it with an ID.
 
+    `source` is the input address it was normalized from, a repeat of it then hits the exact match.
+    An address flagged with `error` is stored but not indexed, so it is never returned as a match.
+    """
     try:
-        with open(json_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            return data
-    except FileNotFoundError:
-        return []
-    except json.JSONDecodeError as e:
-        print(f"Error parsing new addresses JSON file: {e}")
-        return []
+        address_with_id = get_new_address_store().append(new_address, source, error)
+        print(f"Saved new address with ID: {address_with_id['id']}")
     except Exception as e:
-        print(f"Error loading new addresses: {e}")
-        return []
-
-
-def save_new_address(new_address: Address) -> AddressWithId:
-    """Save a new address to the new-addresses.json file and return it with an ID."""
-    current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    json_path = os.path.join(current_dir, 'resources', 'new-addresses.json')
-
-    # Load existing new addresses
-    existing_addresses = load_new_addresses()
-
-    # Generate a unique ID for the new address
-    # Use format: NEW_{country}_{index}
-    country_code = new_address['country'].upper()
-    existing_count = len([addr for addr in existing_addresses if addr['id'].startswith(f"{country_code}")])
-    new_id = f"{country_code}_{existing_count}"
-
-    # Create address with ID
-    address_with_id = AddressWithId(
-        id=new_id,
-        city=new_address['city'],
-        zip_code=new_address['zip_code'],
-        province=new_address['province'],
-        country=new_address['country'],
-        address_lines=new_address['address_lines']
-    )
-
-    # Add to existing addresses
-    existing_addresses.append(address_with_id)
-
-    # Save back to file
+        print(f"Error saving new address: {e}")
+        return AddressWithId(id="", **new_address)
     try:
-        with open(json_path, 'w', encoding='utf-8') as file:
-            json.dump(existing_addresses, file, indent=2, ensure_ascii=False)
-        print(f"Saved new address with ID: {new_id}")
+        refresh_new_address_index()
     except Exception as e:
-        print(f"Error saving new address: {e}")
-
+        print(f"Error indexing new address: {e}")
     return address_with_id
 
 
-def check_normalize_address_llm(state: CheckNormalizeInputState):
-    """Check the address for correctness and normalize it if possible"""
+async def asave_new_address(new_address: Address, source: Optional[Address] = None,
+                            error: bool = False) -> AddressWithId:
+    """Async version of `save_new_address`."""
+    try:
+        address_with_id = await get_new_address_store().aappend(new_address, source, error)
+        print(f"Saved new address with ID: {address_with_id['id']}")
+    except Exception as e:
+        print(f"Error saving new address: {e}")
+        return AddressWithId(id="", **new_address)
+    try:
+        await arefresh_new_address_index()
+    except Exception as e:
+        print(f"Error indexing new address: {e}")
+    return address_with_id
+
 
+def build_check_normalize_messages(state: CheckNormalizeInputState) -> List[BaseMessage]:
+    """Build the prompt that asks to validate and normalize the address."""
     city = state['address']['city']
     zip_code = state['address']['zip_code']
     country = state['address']['country']
     province = state['address']['province']
     address_lines = state['address']['address_lines']
 
-    # Enforce structured output
-    structured_llm = llm.with_structured_output(NormalizeOutputState)
-
     # System message
     system_message = check_normalize_address_llm_instructions.format(city=city,
                                                                      zip_code=zip_code,
                                                                      country=country,
                                                                      province=province,
                                                                      address_lines=", ".join(address_lines))
-    # Generate question
-    result = structured_llm.invoke(
-        [SystemMessage(content=system_message)] + [
-            HumanMessage(content="Validate and normalize the address based on provided details.")])
+    return [SystemMessage(content=system_message)] + [
+        HumanMessage(content="Validate and normalize the address based on provided details.")]
+
+
+def build_check_normalize_batch_messages(addresses: List[Address]) -> List[BaseMessage]:
+    """Build the prompt that asks to validate and normalize several addresses at once."""
+    blocks = [check_normalize_batch_address.format(index=index,
+                                                   city=address['city'],
+                                                   zip_code=address['zip_code'],
+                                                   country=address['country'],
+                                                   province=address['province'],
+                                                   address_lines=", ".join(address['address_lines']))
+              for index, address in enumerate(addresses, 1)]
+    system_message = check_normalize_addresses_llm_batch_instructions.format(addresses="\n".join(blocks))
+    return [SystemMessage(content=system_message)] + [
+        HumanMessage(content="Validate and normalize each of the addresses based on provided details.")]
+
+
+def _batch_messages(addresses: List[Address]) -> List[BaseMessage]:
+    """Render and account for the prompt of a batch against one prompt per address"""
+    messages = build_check_normalize_batch_messages(addresses)
+    record_llm_prompt("check_normalize_address_llm_batch", messages)
+    normalize_batcher.record_tokens(count_message_tokens(messages), sum(
+        count_message_tokens(build_check_normalize_messages({'address': address})) for address in addresses))
+    return messages
+
+
+def _normalize_single_llm(address: Address, fallback: bool = False) -> NormalizeOutputState:
+    """Normalize an address with its own prompt, when it is alone in its batch or the batch call failed it"""
+    messages = build_check_normalize_messages({'address': address})
+    record_llm_prompt("check_normalize_address_llm", messages)
+    tokens = count_message_tokens(messages)
+    # After a failed batch the unbatched cost was already counted with the batch
+    normalize_batcher.record_tokens(tokens, 0 if fallback else tokens)
+    return call_llm("check_normalize_address_llm", LLM_DEPLOYMENT, NormalizeOutputState, messages)
+
+
+async def _anormalize_single_llm(address: Address, fallback: bool = False) -> NormalizeOutputState:
+    """Async version of `_normalize_single_llm`"""
+    messages = build_check_normalize_messages({'address': address})
+    record_llm_prompt("check_normalize_address_llm", messages)
+    tokens = count_message_tokens(messages)
+    normalize_batcher.record_tokens(tokens, 0 if fallback else tokens)
+    return await acall_llm("check_normalize_address_llm", LLM_DEPLOYMENT, NormalizeOutputState, messages)
+
+
+def normalize_addresses_llm(addresses: List[Address]) -> List[NormalizeOutputState]:
+    """Normalize the addresses with one LLM call, one by one if it does not return a result for each"""
+    if len(addresses) == 1:
+        return [_normalize_single_llm(addresses[0])]
+    output = call_llm("check_normalize_address_llm_batch", LLM_DEPLOYMENT, NormalizeBatchOutputState,
+                      _batch_messages(addresses))
+    if len(output['results']) == len(addresses):
+        return output['results']
+    print(f"Batched normalization returned {len(output['results'])} results for {len(addresses)} addresses, "
+          f"normalizing them one by one")
+    return [_normalize_single_llm(address, fallback=True) for address in addresses]
+
+
+async def anormalize_addresses_llm(addresses: List[Address]) -> List[NormalizeOutputState]:
+    """Async version of `normalize_addresses_llm`"""
+    if len(addresses) == 1:
+        return [await _anormalize_single_llm(addresses[0])]
+    output = await acall_llm("check_normalize_address_llm_batch", LLM_DEPLOYMENT, NormalizeBatchOutputState,
+                             _batch_messages(addresses))
+    if len(output['results']) == len(addresses):
+        return output['results']
+    print(f"Batched normalization returned {len(output['results'])} results for {len(addresses)} addresses, "
+          f"normalizing them one by one")
+    return await asyncio.gather(*[_anormalize_single_llm(address, fallback=True) for address in addresses])
+
+
+normalize_batcher = MicroBatcher("check_normalize_address_llm", normalize_addresses_llm, anormalize_addresses_llm,
+                                 NORMALIZE_BATCH_WINDOW_MS / 1000, NORMALIZE_BATCH_MAX_SIZE)
+
+
+def normalize_address(state: CheckNormalizeInputState) -> NormalizeOutputState:
+    """Validate and normalize the address by rules or with the LLM, without saving it"""
+    result = normalize_address_by_rules(state)
+    if result is not None:
+        return result
+    # A batched result is cached under the address's own prompt, like an unbatched one
+    call = (lambda: normalize_batcher.submit(state['address'])) if NORMALIZE_BATCH_ENABLED else None
+    return invoke_structured("check_normalize_address_llm", LLM_DEPLOYMENT, NormalizeOutputState,
+                             check_normalize_address_llm_instructions, build_check_normalize_messages(state), call)
+
+
+async def anormalize_address(state: CheckNormalizeInputState) -> NormalizeOutputState:
+    """Validate and normalize the address by rules or with the LLM, without saving it (async)"""
+    result = normalize_address_by_rules(state, await aget_canonicalizer())
+    if result is not None:
+        return result
+    acall = (lambda: normalize_batcher.asubmit(state['address'])) if NORMALIZE_BATCH_ENABLED else None
+    return await ainvoke_structured("check_normalize_address_llm", LLM_DEPLOYMENT, NormalizeOutputState,
+                                    check_normalize_address_llm_instructions, build_check_normalize_messages(state),
+                                    acall)
+
+
+def normalize_and_save_address(state: CheckNormalizeInputState) -> NormalizeOutputState:
+    """Normalize the address, using its speculative result if there is one, and save it as a new address"""
+    result = speculative_normalizations.take(state.get('speculationId'))
+    if result is None:
+        result = normalize_address(state)
+
+    save_new_address(result['normalizedAddress'], state['address'], bool(result.get('error')))
+    return result
+
+
+async def anormalize_and_save_address(state: CheckNormalizeInputState) -> NormalizeOutputState:
+    """Async version of `normalize_and_save_address`"""
+    result = await speculative_normalizations.atake(state.get('speculationId'))
+    if result is None:
+        result = await anormalize_address(state)
+
+    await asave_new_address(result['normalizedAddress'], state['address'], bool(result.get('error')))
+    return result
+
+
+def check_normalize_address_llm(state: CheckNormalizeInputState):
+    """Check the address for correctness and normalize it if possible"""
+    # Concurrent runs for the same address share one normalization and one saved address
+    key = coalescing_key(state['address'], get_canonicalizer())
+    result, shared = check_normalize_flights.do(key, lambda: normalize_and_save_address(state))
+    if shared:
+        speculative_normalizations.discard(state.get('speculationId'))
+    return result
+
 
-    save_new_address(result['normalizedAddress'])
+async def acheck_normalize_address_llm(state: CheckNormalizeInputState):
+    """Check the address for correctness and normalize it if possible (async)"""
+    key = coalescing_key(state['address'], await aget_canonicalizer())
+    result, shared = await check_normalize_flights.ado(key, lambda: anormalize_and_save_address(state))
+    if shared:
+        speculative_normalizations.discard(state.get('speculationId'))
     return result
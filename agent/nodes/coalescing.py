@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from matching import canonical_key
+from matching.canonicalizer import Canonicalizer
+from metrics import record_coalesced_call
+from models import Address
+
+# Let concurrent runs for the same address share one call per pipeline stage
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def coalescing_key(address: Address, canonicalizer: Canonicalizer) -> str:
+    """Key under which duplicates of the address are coalesced, e.g. "Warsaw, 00001" and "Warszawa, 00-001"."""
+    canonical = canonicalizer.canonicalize(address)['address']
+    return json.dumps([canonical_key(canonical), " ".join((canonical.get('province') or "").lower().split())],
+                      ensure_ascii=False)
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and hands its result to every concurrent caller.
+
+    The first caller of a key (the leader) runs the call; callers arriving
+    while it runs (followers) wait for and share the leader's result or
+    exception. Once the call finishes the key is forgotten, so later callers
+    start a new call. A cancelled async leader does not fail its followers,
+    one of them becomes the new leader instead.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.leaders = 0
+        self.followers = 0
+        self._calls: Dict[Hashable, Future] = {}
+        self._async_calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, shared: bool) -> None:
+        with self._lock:
+            if shared:
+                self.followers += 1
+            else:
+                self.leaders += 1
+        record_coalesced_call(self.name, shared)
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return `func()` or the result of the call already running for the key, and whether it was shared."""
+        if not SINGLE_FLIGHT_ENABLED:
+            return func(), False
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        self._count(not leader)
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key: Hashable, afunc: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Async version of `do` for callers on the same event loop."""
+        if not SINGLE_FLIGHT_ENABLED:
+            return await afunc(), False
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        while True:
+            future = self._async_calls.get(loop_key)
+            if future is None:
+                break
+            try:
+                # Shielded, so a cancelled follower does not cancel the shared call
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+            self._count(True)
+            return result, True
+
+        future = self._async_calls[loop_key] = loop.create_future()
+        self._count(False)
+        try:
+            result = await afunc()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody was waiting for it
+            future.exception()
+            raise
+        finally:
+            self._async_calls.pop(loop_key, None)
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.followers
+        return {
+            'calls': calls,
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'shared_rate': self.followers / calls if calls else 0.0,
+        }
+
+
+web_search_flights = SingleFlight('web_search_address')
+find_address_flights = SingleFlight('find_address_llm')
+check_normalize_flights = SingleFlight('check_normalize_address_llm')
+
+
+def coalescing_stats() -> dict:
+    """Return leader/follower counts of every coalesced stage."""
+    return {flights.name: flights.stats() for flights in (web_search_flights, find_address_flights,
+                                                          check_normalize_flights)}
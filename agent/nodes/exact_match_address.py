@@ -0,0 +1,13 @@
+from matching.indexes import aget_exact_match_index, get_exact_match_index
+from models import ExactMatchInputState, ExactMatchOutputState
+
+
+def exact_match_address(state: ExactMatchInputState) -> ExactMatchOutputState:
+    """ Look the address up by its canonical key, without calling any external service """
+    return ExactMatchOutputState(matchedAddresses=get_exact_match_index().lookup(state['address']))
+
+
+async def aexact_match_address(state: ExactMatchInputState) -> ExactMatchOutputState:
+    """ Look the address up by its canonical key (async) """
+    index = await aget_exact_match_index()
+    return ExactMatchOutputState(matchedAddresses=index.lookup(state['address']))
@@ -1,21 +1,22 @@
-import json
 import os
-from typing import List
+from typing import List, Optional, Tuple
 
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import AzureChatOpenAI
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 
-from models import Address, AddressWithId, FindInputState, FindOutputState
+from matching.indexes import (CandidateIndex, aget_candidate_index, aget_canonicalizer, get_candidate_index,
+                              get_canonicalizer)
+from metrics import record_find_candidates
+from models import AddressWithId, FindInputState, FindOutputState
+from nodes.candidates import format_candidates
+from nodes.coalescing import coalescing_key, find_address_flights
+from stores import ReferenceSnapshot, get_new_address_store, get_reference_store, is_new_address_id
+from stores.llm_cache import ainvoke_structured, invoke_structured
 
-# LLM instance
-llm = AzureChatOpenAI(
-    azure_deployment="gpt-4o",
-    api_version="2024-08-01-preview",
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
+# Upper bound on the number of reference addresses put into the prompt
+MAX_CANDIDATES = int(os.environ.get("FIND_ADDRESS_MAX_CANDIDATES", "20"))
+
+# Azure OpenAI deployment; its shared client is built on the first call
+LLM_DEPLOYMENT = "gpt-4o"
 
 find_address_llm_instructions = """You are provided with a list of addresses and the description about problems with address.
 Check if the provided address matches any of the addresses in the list. Apply fuzzy matching and real-world knowledge to find the best match.
@@ -25,7 +26,8 @@ If no addresses match, return an empty list in this field.
 Given:
 - A target address to find
 - A description about problems with address (if none, the field is empty)
-- A list of candidate addresses to match against
+- A list of candidate addresses to match against, one per line with the columns named in the first line
+  (several address lines of a candidate are separated by "; ")
 
 <address-to-find>
     <city>{city}</city>
@@ -48,58 +50,19 @@ If can not find any matches, return corrected address and empty list of matched
 The matching should be done based on the overall similarity of the address components, not just exact text matches."""
 
 
-def load_addresses_to_match() -> List[AddressWithId]:
-    """Load addresses from the JSON file and add unique IDs."""
-    # Get the path to the JSON file relative to this script's parent directory
-    current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    json_path = os.path.join(current_dir, 'resources', 'addresses-to-match-against.json')
-
-    addresses_with_ids = []
-
-    try:
-        with open(json_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-
-        # Iterate through all countries and their addresses
-        for country_code, addresses in data.items():
-            for idx, address in enumerate(addresses):
-                # Create a unique ID combining country code and index
-                address_with_id = AddressWithId(
-                    id=f"{country_code}_{idx}",
-                    city=address['city'],
-                    zip_code=address['zip_code'],
-                    province=address['province'],
-                    country=address['country'],
-                    address_lines=address['address_lines']
-                )
-                addresses_with_ids.append(address_with_id)
-
-    except FileNotFoundError:
-        print(f"Warning: Address file not found at {json_path}")
-        return []
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON file: {e}")
-        return []
-    except Exception as e:
-        print(f"Error loading addresses: {e}")
-        return []
-
-    return addresses_with_ids
-
-
-def find_address_llm(state: FindInputState):
-    """ Find matching addresses from the database """
-
+def build_find_address_messages(state: FindInputState, candidate_index: Optional[CandidateIndex] = None
+                                ) -> Tuple[List[BaseMessage], List[AddressWithId]]:
+    """Build the prompt with the address to find and its candidate addresses; return it with the candidates."""
     city = state['address']['city']
     zip_code = state['address']['zip_code']
     country = state['address']['country']
     province = state['address']['province']
     address_lines = state['address']['address_lines']
     description = state['description']
-    addresses_to_match_against = load_addresses_to_match()
-
-    # Enforce structured output
-    structured_llm = llm.with_structured_output(FindOutputState)
+    candidate_index = candidate_index or get_candidate_index()
+    scored_candidates = candidate_index.search_with_scores(state['address'], MAX_CANDIDATES)
+    addresses_to_match_against, candidates, candidate_tokens = format_candidates(scored_candidates)
+    record_find_candidates(len(candidates), candidate_tokens)
 
     # System message
     system_message = find_address_llm_instructions.format(city=city,
@@ -109,8 +72,54 @@ def find_address_llm(state: FindInputState):
                                                           address_lines=", ".join(address_lines),
                                                           description=description,
                                                           addresses_to_match_against=addresses_to_match_against)
-    # Generate question
-    result = structured_llm.invoke(
-        [SystemMessage(content=system_message)] + [HumanMessage(content="Find the address based on provided details.")])
+    messages = [SystemMessage(content=system_message)] + [
+        HumanMessage(content="Find the address based on provided details.")]
+    return messages, candidates
+
+
+def resolve_matches(result: FindOutputState, candidates: List[AddressWithId],
+                    snapshot: ReferenceSnapshot) -> FindOutputState:
+    """Replace matches the LLM rebuilt from candidate lines with the records of their IDs.
+
+    IDs that were not among the candidates are looked up in the new address
+    store or the reference snapshot, by their namespace.
+    """
+    by_id = {candidate['id']: candidate for candidate in candidates}
+    matched = []
+    for address in result.get('matchedAddresses') or []:
+        address_id = address.get('id') or ""
+        if address_id in by_id:
+            matched.append(by_id[address_id])
+        elif is_new_address_id(address_id):
+            matched.append(get_new_address_store().get(address_id) or address)
+        else:
+            matched.append(snapshot.get(address_id) or address)
+    return dict(result, matchedAddresses=matched)
+
+
+def find_address(state: FindInputState) -> FindOutputState:
+    """Ask the LLM which candidate addresses match the address."""
+    messages, candidates = build_find_address_messages(state)
+    result = invoke_structured("find_address_llm", LLM_DEPLOYMENT, FindOutputState, find_address_llm_instructions,
+                               messages)
+    return resolve_matches(result, candidates, get_reference_store().snapshot())
+
+
+async def afind_address(state: FindInputState) -> FindOutputState:
+    """Async version of `find_address`."""
+    messages, candidates = build_find_address_messages(state, await aget_candidate_index())
+    result = await ainvoke_structured("find_address_llm", LLM_DEPLOYMENT, FindOutputState,
+                                      find_address_llm_instructions, messages)
+    return resolve_matches(result, candidates, await get_reference_store().asnapshot())
+
+
+def find_address_llm(state: FindInputState):
+    """ Find matching addresses from the database """
+    key = (coalescing_key(state['address'], get_canonicalizer()), state['description'])
+    return find_address_flights.do(key, lambda: find_address(state))[0]
+
 
-    return result
+async def afind_address_llm(state: FindInputState):
+    """ Find matching addresses from the database (async) """
+    key = (coalescing_key(state['address'], await aget_canonicalizer()), state['description'])
+    return (await find_address_flights.ado(key, lambda: afind_address(state)))[0]
@@ -0,0 +1,64 @@
+import os
+import threading
+from typing import Optional
+
+from matching.confidence import is_malformed, rank_by_confidence
+from matching.indexes import CandidateIndex, aget_candidate_index, get_candidate_index
+from metrics import record_confidence_route
+from models import ConfidenceInputState, ConfidenceOutputState
+from stores import is_new_address_id
+
+# At or above this confidence the best reference candidate is taken as the match without any LLM call
+CONFIDENCE_MATCH_THRESHOLD = float(os.environ.get("CONFIDENCE_MATCH_THRESHOLD", "0.95"))
+# At or above this confidence find_address_llm gets the address without a web search first
+CONFIDENCE_FIND_THRESHOLD = float(os.environ.get("CONFIDENCE_FIND_THRESHOLD", "0.7"))
+# Reference candidates scored per address
+CONFIDENCE_CANDIDATES = int(os.environ.get("CONFIDENCE_CANDIDATES", "5"))
+
+# Routes taken after scoring
+MATCH_ROUTE = "match"
+FIND_ROUTE = "find"
+WEB_SEARCH_ROUTE = "web_search"
+
+# How many addresses took each route
+confidence_route_stats = {MATCH_ROUTE: 0, FIND_ROUTE: 0, WEB_SEARCH_ROUTE: 0}
+_confidence_route_stats_lock = threading.Lock()
+
+
+def score_confidence(state: ConfidenceInputState, candidate_index: Optional[CandidateIndex] = None) -> ConfidenceOutputState:
+    """Score the address against its best reference candidates and pick the route"""
+    address = state['address']
+    if is_malformed(address):
+        best, confidence = None, 0.0
+    else:
+        candidates = (candidate_index or get_candidate_index()).search(address, CONFIDENCE_CANDIDATES)
+        ranked = rank_by_confidence(address, candidates)
+        best, confidence = ranked[0] if ranked else (None, 0.0)
+
+    if best is not None and confidence >= CONFIDENCE_MATCH_THRESHOLD:
+        route = MATCH_ROUTE
+    elif confidence >= CONFIDENCE_FIND_THRESHOLD:
+        route = FIND_ROUTE
+    else:
+        route = WEB_SEARCH_ROUTE
+    with _confidence_route_stats_lock:
+        confidence_route_stats[route] += 1
+    record_confidence_route(route)
+
+    if route == MATCH_ROUTE:
+        return ConfidenceOutputState(matchedAddresses=[best], confidence=confidence, confidenceRoute=route,
+                                     description=f"Matched {'new' if is_new_address_id(best['id']) else 'reference'} "
+                                                 f"address {best['id']} "
+                                                 f"with confidence {confidence:.2f}.")
+    # find_address_llm reads the description, which only the web search would otherwise set
+    return ConfidenceOutputState(matchedAddresses=[], confidence=confidence, confidenceRoute=route, description="")
+
+
+def score_address_confidence(state: ConfidenceInputState) -> ConfidenceOutputState:
+    """ Decide from local similarity whether the address needs the web search and the LLM """
+    return score_confidence(state)
+
+
+async def ascore_address_confidence(state: ConfidenceInputState) -> ConfidenceOutputState:
+    """ Decide from local similarity whether the address needs the web search and the LLM (async) """
+    return score_confidence(state, await aget_candidate_index())
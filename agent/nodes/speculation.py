@@ -0,0 +1,206 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from matching import BlockingIndex
+from models import Address, CheckNormalizeInputState, NormalizeOutputState
+
+# "off" - never speculate, "always" - normalize every address that missed the exact match,
+# "predicted" - only when the predicted match probability is below the threshold
+SPECULATIVE_NORMALIZATION = os.environ.get("SPECULATIVE_NORMALIZATION", "off").lower()
+SPECULATIVE_MATCH_PROBABILITY_THRESHOLD = float(os.environ.get("SPECULATIVE_MATCH_PROBABILITY_THRESHOLD", "0.5"))
+# Worker threads for speculative calls of synchronous runs
+SPECULATIVE_MAX_WORKERS = int(os.environ.get("SPECULATIVE_MAX_WORKERS", "8"))
+# Speculations that are neither used nor discarded (e.g. the run failed) are dropped after this many seconds
+SPECULATIVE_TTL_SECONDS = float(os.environ.get("SPECULATIVE_TTL_SECONDS", "300"))
+
+
+class SpeculationStats:
+    """Counters of speculative normalization calls and their effect on latency.
+
+    `saved_seconds` is the part of the used normalization calls that overlapped
+    with matching, `added_seconds` is what speculation put on the critical
+    path: starting the calls and waiting for calls that then failed.
+    `wasted_seconds` is LLM time spent on results that were discarded.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.failed = 0
+        self.used = 0
+        self.wasted = 0
+        self.saved_seconds = 0.0
+        self.added_seconds = 0.0
+        self.wasted_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_started(self, seconds: float) -> None:
+        with self._lock:
+            self.started += 1
+            self.added_seconds += seconds
+
+    def record_failed(self, waited_seconds: float) -> None:
+        """The speculative call failed, so the caller waited for nothing and falls back to a serial call."""
+        with self._lock:
+            self.failed += 1
+            self.added_seconds += waited_seconds
+
+    def record_used(self, seconds: float, waited_seconds: float) -> None:
+        """The address was not matched, so the speculative call replaced a serial one."""
+        with self._lock:
+            self.used += 1
+            self.saved_seconds += max(0.0, seconds - waited_seconds)
+
+    def record_wasted(self, seconds: float) -> None:
+        """The address was matched, so the speculative result is discarded."""
+        with self._lock:
+            self.wasted += 1
+            self.wasted_seconds += seconds
+
+    def stats(self) -> dict:
+        finished = self.used + self.wasted
+        return {
+            'policy': SPECULATIVE_NORMALIZATION,
+            'started': self.started,
+            'failed': self.failed,
+            'used': self.used,
+            'wasted': self.wasted,
+            'waste_rate': self.wasted / finished if finished else 0.0,
+            'saved_seconds': self.saved_seconds,
+            'added_seconds': self.added_seconds,
+            'net_saved_seconds': self.saved_seconds - self.added_seconds,
+            'wasted_seconds': self.wasted_seconds,
+        }
+
+
+speculation_stats = SpeculationStats()
+
+NormalizeResult = Tuple[Optional[NormalizeOutputState], float]
+
+
+def _run(normalize: Callable[[CheckNormalizeInputState], NormalizeOutputState],
+         state: CheckNormalizeInputState) -> NormalizeResult:
+    started = time.perf_counter()
+    try:
+        return normalize(state), time.perf_counter() - started
+    except Exception as e:
+        print(f"Speculative normalization failed: {e}")
+        return None, time.perf_counter() - started
+
+
+async def _arun(anormalize: Callable[[CheckNormalizeInputState], Awaitable[NormalizeOutputState]],
+                state: CheckNormalizeInputState) -> NormalizeResult:
+    started = time.perf_counter()
+    try:
+        return await anormalize(state), time.perf_counter() - started
+    except Exception as e:
+        print(f"Speculative normalization failed: {e}")
+        return None, time.perf_counter() - started
+
+
+class SpeculativeNormalizations:
+    """In-process registry of normalization calls started ahead of time.
+
+    The calls run outside the graph (a thread pool for synchronous runs, an
+    asyncio task for async runs), so they never hold back a superstep; the
+    graph state only carries the speculation ID. The consumer either takes
+    the result or discards it.
+    """
+
+    def __init__(self, max_workers: int = SPECULATIVE_MAX_WORKERS, ttl_seconds: float = SPECULATIVE_TTL_SECONDS):
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        self._pending: Dict[str, Tuple[Any, float]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _register(self, future: Any, started: float) -> str:
+        speculation_id = uuid.uuid4().hex
+        with self._lock:
+            expired = [key for key, (_, registered) in self._pending.items()
+                       if started - registered > self.ttl_seconds]
+            for key in expired:
+                self._pending.pop(key)[0].cancel()
+            self._pending[speculation_id] = (future, started)
+        return speculation_id
+
+    def _pop(self, speculation_id: Optional[str]) -> Optional[Tuple[Any, float]]:
+        if not speculation_id:
+            return None
+        with self._lock:
+            return self._pending.pop(speculation_id, None)
+
+    def start(self, normalize: Callable[[CheckNormalizeInputState], NormalizeOutputState],
+              state: CheckNormalizeInputState) -> str:
+        """Submit `normalize(state)` to the worker threads and return the speculation ID."""
+        started = time.perf_counter()
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='speculative-normalization')
+        speculation_id = self._register(self._executor.submit(_run, normalize, state), started)
+        speculation_stats.record_started(time.perf_counter() - started)
+        return speculation_id
+
+    def astart(self, anormalize: Callable[[CheckNormalizeInputState], Awaitable[NormalizeOutputState]],
+               state: CheckNormalizeInputState) -> str:
+        """Start `anormalize(state)` as a task on the running event loop and return the speculation ID."""
+        started = time.perf_counter()
+        speculation_id = self._register(asyncio.create_task(_arun(anormalize, state)), started)
+        speculation_stats.record_started(time.perf_counter() - started)
+        return speculation_id
+
+    def _finish(self, result: NormalizeResult, waited_seconds: float) -> Optional[NormalizeOutputState]:
+        normalized, seconds = result
+        if normalized is None:
+            speculation_stats.record_failed(waited_seconds)
+        else:
+            speculation_stats.record_used(seconds, waited_seconds)
+        return normalized
+
+    def take(self, speculation_id: Optional[str]) -> Optional[NormalizeOutputState]:
+        """Wait for and return the speculative result, or None if there is none or it failed."""
+        pending = self._pop(speculation_id)
+        if pending is None:
+            return None
+        claimed = time.perf_counter()
+        result = pending[0].result()
+        return self._finish(result, time.perf_counter() - claimed)
+
+    async def atake(self, speculation_id: Optional[str]) -> Optional[NormalizeOutputState]:
+        """Async version of `take`."""
+        pending = self._pop(speculation_id)
+        if pending is None:
+            return None
+        claimed = time.perf_counter()
+        result = await pending[0]
+        return self._finish(result, time.perf_counter() - claimed)
+
+    def discard(self, speculation_id: Optional[str]) -> None:
+        """Drop the speculation because the address was matched, cancelling the call if it still runs."""
+        pending = self._pop(speculation_id)
+        if pending is None:
+            return
+        future, started = pending
+        if future.done() and not future.cancelled():
+            seconds = future.result()[1]
+        else:
+            future.cancel()
+            seconds = time.perf_counter() - started
+        speculation_stats.record_wasted(seconds)
+
+
+speculative_normalizations = SpeculativeNormalizations()
+
+
+def should_speculate(address: Address, blocking_index: BlockingIndex) -> bool:
+    """Decide whether to start normalization before knowing if the address matches."""
+    if SPECULATIVE_NORMALIZATION == "always":
+        return True
+    if SPECULATIVE_NORMALIZATION == "predicted":
+        return blocking_index.match_probability(address) < SPECULATIVE_MATCH_PROBABILITY_THRESHOLD
+    return False
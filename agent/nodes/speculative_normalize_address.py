@@ -0,0 +1,14 @@
+from models import CheckNormalizeInputState, SpeculativeNormalizeOutputState
+from nodes.check_normalize_address import anormalize_address, normalize_address
+from nodes.speculation import speculative_normalizations
+
+
+def speculative_normalize_address(state: CheckNormalizeInputState) -> SpeculativeNormalizeOutputState:
+    """ Start normalizing the address while it is still being matched; the result is only saved if no match is found """
+    # The call runs outside the graph, so this node returns right away and does not delay find_address_llm
+    return SpeculativeNormalizeOutputState(speculationId=speculative_normalizations.start(normalize_address, state))
+
+
+async def aspeculative_normalize_address(state: CheckNormalizeInputState) -> SpeculativeNormalizeOutputState:
+    """ Start normalizing the address while it is still being matched (async) """
+    return SpeculativeNormalizeOutputState(speculationId=speculative_normalizations.astart(anormalize_address, state))
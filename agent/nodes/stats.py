@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from nodes.check_normalize_address import NORMALIZE_BATCH_ENABLED, normalization_stats, normalize_batcher
+from nodes.coalescing import coalescing_stats
+from nodes.score_address_confidence import confidence_route_stats
+from nodes.speculation import speculation_stats
+from nodes.web_search_address import web_search_cache_stats
+from providers import client_setup_stats, scheduler_stats
+from stores import get_reference_store
+from stores.llm_cache import llm_cache_stats
+
+# Seconds between two statistics log lines, 0 disables the periodic log
+STATS_LOG_INTERVAL = float(os.environ.get("STATS_LOG_INTERVAL", "300"))
+
+
+def collect_stats() -> dict:
+    """Gather the statistics of the indexes, caches, routing, normalization, its batching and speculation.
+
+    Structures that were not built or opened yet are reported as None
+    rather than being created for the report.
+    """
+    snapshot = get_reference_store().snapshot()
+    blocking_index = snapshot.cached('blocking_index')
+    similarity_index = snapshot.cached('similarity_index')
+    new_address_index = snapshot.cached('new_address_index')
+    return {
+        'reference_addresses': {'version': snapshot.version, 'records': len(snapshot)},
+        'blocking_index': blocking_index.stats() if blocking_index is not None else None,
+        'similarity_index': similarity_index.stats() if similarity_index is not None else None,
+        'new_address_index': new_address_index.stats() if new_address_index is not None else None,
+        'clients': dict(client_setup_stats),
+        'coalescing': coalescing_stats(),
+        'llm_cache': llm_cache_stats(),
+        'web_search_cache': web_search_cache_stats(),
+        'confidence_routes': dict(confidence_route_stats),
+        'normalization': dict(normalization_stats),
+        'normalize_batching': normalize_batcher.stats() if NORMALIZE_BATCH_ENABLED else None,
+        'scheduler': scheduler_stats(),
+        'speculation': speculation_stats.stats(),
+    }
+
+
+_stats_logger: Optional[threading.Thread] = None
+_stats_logger_lock = threading.Lock()
+
+
+def start_stats_logger(interval: float = STATS_LOG_INTERVAL) -> None:
+    """Print `collect_stats` as one JSON line every `interval` seconds from a daemon thread."""
+    global _stats_logger
+    if interval <= 0:
+        return
+    with _stats_logger_lock:
+        if _stats_logger is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    print(f"Stats: {json.dumps(collect_stats(), sort_keys=True)}")
+                except Exception as e:
+                    print(f"Error collecting stats: {e}")
+
+        _stats_logger = threading.Thread(target=run, name='stats-logger', daemon=True)
+        _stats_logger.start()
@@ -1,20 +1,27 @@
-from typing import List
+import asyncio
+import os
+import threading
+import time
+from typing import List, Optional
 
-from langchain_community.tools import TavilySearchResults
 from langchain_core.messages import SystemMessage
-from langchain_openai import AzureChatOpenAI
 
+from matching import tokenize
+from matching.indexes import aget_canonicalizer, get_canonicalizer
+from metrics import record_cache_lookup, record_external_call
 from models import WebSearchInputState, WebSearchOutputState
+from nodes.coalescing import coalescing_key, web_search_flights
+from providers import ascheduled, get_web_search, scheduled
+from stores import SqliteCache
+from stores.llm_cache import ainvoke_structured, invoke_structured
+from stores.reference_store import RESOURCES_DIR
 
-# LLM instance
-llm = AzureChatOpenAI(
-    azure_deployment="gpt-4o",
-    api_version="2024-08-01-preview",
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
+WEB_SEARCH_CACHE_PATH = os.environ.get("WEB_SEARCH_CACHE_PATH", os.path.join(RESOURCES_DIR, 'cache', 'web-search.sqlite3'))
+WEB_SEARCH_CACHE_TTL_SECONDS = float(os.environ.get("WEB_SEARCH_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("WEB_SEARCH_CACHE_MAX_ENTRIES", "100000"))
+
+# Azure OpenAI deployment; its shared client is built on the first call
+LLM_DEPLOYMENT = "gpt-4o"
 
 web_search_address_instructions = """You are an AI assistant specializing in finding information about the address data.
 
@@ -51,17 +58,91 @@ def build_combined_address(address_lines: List[str], city: str, province: str, z
     return ", ".join(components)
 
 
-def web_search_address(state: WebSearchInputState):
-    """ Retrieve information from web search """
+_web_search_cache: Optional[SqliteCache] = None
+_web_search_cache_lock = threading.Lock()
+
+
+def get_web_search_cache() -> SqliteCache:
+    """Return the persistent cache of Tavily results, opening it on first use."""
+    global _web_search_cache
+    if _web_search_cache is None:
+        with _web_search_cache_lock:
+            if _web_search_cache is None:
+                _web_search_cache = SqliteCache(WEB_SEARCH_CACHE_PATH, 'web_search_results',
+                                                ttl_seconds=WEB_SEARCH_CACHE_TTL_SECONDS,
+                                                max_entries=WEB_SEARCH_CACHE_MAX_ENTRIES)
+    return _web_search_cache
+
+
+async def aget_web_search_cache() -> SqliteCache:
+    """Async version of `get_web_search_cache`, the first open runs in a worker thread."""
+    if _web_search_cache is not None:
+        return _web_search_cache
+    return await asyncio.to_thread(get_web_search_cache)
+
+
+def web_search_cache_stats() -> Optional[dict]:
+    """Return the web search cache statistics, or None if the cache was not opened yet."""
+    return _web_search_cache.stats() if _web_search_cache is not None else None
+
+
+def search_web(combined_address: str):
+    """Search the web for the address, reusing cached results for the same normalized address."""
+    cache = get_web_search_cache()
+    cache_key = " ".join(tokenize(combined_address))
+
+    started = time.perf_counter()
+    cached = cache.get(cache_key)
+    record_cache_lookup('web_search_cache', 'web_search_address', cached is not None)
+    if cached is not None:
+        record_external_call('web_search', 'web_search_address', time.perf_counter() - started, cached=True)
+        return cached
+
+    started = time.perf_counter()
+    web_search_info = scheduled("web_search", lambda: get_web_search().invoke(combined_address))
+    record_external_call('web_search', 'web_search_address', time.perf_counter() - started, cached=False)
+
+    # Only cache well-formed results, errors come back as plain strings
+    if isinstance(web_search_info, list):
+        cache.set(cache_key, web_search_info)
+    return web_search_info
+
+
+async def asearch_web(combined_address: str):
+    """Async version of `search_web`."""
+    cache = await aget_web_search_cache()
+    cache_key = " ".join(tokenize(combined_address))
+
+    started = time.perf_counter()
+    cached = await cache.aget(cache_key)
+    record_cache_lookup('web_search_cache', 'web_search_address', cached is not None)
+    if cached is not None:
+        record_external_call('web_search', 'web_search_address', time.perf_counter() - started, cached=True)
+        return cached
+
+    started = time.perf_counter()
+    web_search_info = await ascheduled("web_search", lambda: get_web_search().ainvoke(combined_address))
+    record_external_call('web_search', 'web_search_address', time.perf_counter() - started, cached=False)
+
+    if isinstance(web_search_info, list):
+        await cache.aset(cache_key, web_search_info)
+    return web_search_info
+
+
+def combined_address_of(state: WebSearchInputState) -> str:
+    """Build the web search query for the address in the state."""
+    address = state['address']
+    return build_combined_address(address['address_lines'], address['city'], address['province'],
+                                  address['zip_code'], address['country'])
+
+
+def build_web_search_messages(state: WebSearchInputState, web_search_info) -> List[SystemMessage]:
+    """Build the prompt that summarizes the web search results for the address."""
     city = state['address']['city']
     zip_code = state['address']['zip_code']
     country = state['address']['country']
     province = state['address']['province']
     address_lines = state['address']['address_lines']
-    combined_address = build_combined_address(address_lines, city, province, zip_code, country)
-
-    tavily_search = TavilySearchResults(max_results=3)
-    web_search_info = tavily_search.invoke(combined_address)
 
     # If web_search_info is not a string or proper list, default to empty string
     if not isinstance(web_search_info, (str, list)):
@@ -84,8 +165,32 @@ def web_search_address(state: WebSearchInputState):
                                                             country=country,
                                                             province=province,
                                                             address_lines=", ".join(address_lines))
+    return [SystemMessage(content=system_message)]
+
+
+def describe_address(state: WebSearchInputState) -> WebSearchOutputState:
+    """Search the web for the address and summarize what is wrong with it."""
+    web_search_info = search_web(combined_address_of(state))
+    messages = build_web_search_messages(state, web_search_info)
+    return invoke_structured("web_search_address", LLM_DEPLOYMENT, WebSearchOutputState,
+                             web_search_address_instructions, messages)
+
+
+async def adescribe_address(state: WebSearchInputState) -> WebSearchOutputState:
+    """Async version of `describe_address`."""
+    web_search_info = await asearch_web(combined_address_of(state))
+    messages = build_web_search_messages(state, web_search_info)
+    return await ainvoke_structured("web_search_address", LLM_DEPLOYMENT, WebSearchOutputState,
+                                    web_search_address_instructions, messages)
+
+
+def web_search_address(state: WebSearchInputState):
+    """ Retrieve information from web search """
+    key = coalescing_key(state['address'], get_canonicalizer())
+    return web_search_flights.do(key, lambda: describe_address(state))[0]
 
-    structured_llm = llm.with_structured_output(WebSearchOutputState)
-    result = structured_llm.invoke([SystemMessage(content=system_message)])
 
-    return result
+async def aweb_search_address(state: WebSearchInputState):
+    """ Retrieve information from web search (async) """
+    key = coalescing_key(state['address'], await aget_canonicalizer())
+    return (await web_search_flights.ado(key, lambda: adescribe_address(state)))[0]
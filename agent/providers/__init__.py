@@ -0,0 +1,32 @@
+from .cassette import Cassette, CassetteMissError
+from .chat_model import ProviderChatModel, synthetic_output
+from .factory import PROVIDER_MODE, client_setup_stats, get_chat_model, get_structured_model, get_web_search
+from .faults import FaultInjector, InjectedProviderError
+from .scheduler import BULK, INTERACTIVE, AdaptiveLimiter, ascheduled, get_limiter, scheduled, scheduler_stats
+from .tokens import count_message_tokens, count_tokens
+from .web_search import ProviderWebSearch, synthetic_results
+
+__all__ = [
+    'AdaptiveLimiter',
+    'BULK',
+    'Cassette',
+    'CassetteMissError',
+    'FaultInjector',
+    'INTERACTIVE',
+    'InjectedProviderError',
+    'PROVIDER_MODE',
+    'ProviderChatModel',
+    'ProviderWebSearch',
+    'ascheduled',
+    'client_setup_stats',
+    'count_message_tokens',
+    'count_tokens',
+    'get_chat_model',
+    'get_limiter',
+    'get_structured_model',
+    'get_web_search',
+    'scheduled',
+    'scheduler_stats',
+    'synthetic_output',
+    'synthetic_results'
+]
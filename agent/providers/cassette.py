@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+
+def request_key(request: Any) -> str:
+    """Hash a JSON-serializable request description into a cassette key."""
+    return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class CassetteMissError(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+class Cassette:
+    """Recorded responses of one provider, stored as JSON lines of {key, request, response}.
+
+    Recording appends to the file, so several processes can record into the
+    same cassette; on replay the last response recorded for a key wins.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._responses: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Any]:
+        if self._responses is None:
+            with self._lock:
+                if self._responses is None:
+                    responses = {}
+                    try:
+                        with open(self.path, 'r', encoding='utf-8') as file:
+                            for line in file:
+                                if line.strip():
+                                    entry = json.loads(line)
+                                    responses[entry['key']] = entry['response']
+                    except FileNotFoundError:
+                        pass
+                    self._responses = responses
+        return self._responses
+
+    def get(self, key: str) -> Any:
+        """Return the recorded response for the key."""
+        responses = self._load()
+        if key not in responses:
+            raise CassetteMissError(f"No recorded response for {key} in {self.path}")
+        return responses[key]
+
+    def record(self, key: str, request: Any, response: Any) -> None:
+        """Append a response to the cassette file."""
+        line = json.dumps({'key': key, 'request': request, 'response': response}, ensure_ascii=False)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line + "\n")
+            if self._responses is not None:
+                self._responses[key] = response
+
+    def __len__(self) -> int:
+        return len(self._load())
@@ -0,0 +1,128 @@
+import json
+import re
+from typing import Any, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from providers.cassette import Cassette, request_key
+from providers.faults import FaultInjector
+
+_TAG_RE = re.compile(r"<([a-z_]+)>\s*([^<]*?)\s*</\1>")
+_ADDRESS_BLOCK_RE = re.compile(r"<address index=\"\d+\">(.*?)</address>", re.S)
+
+
+def structured_request(deployment: str, schema: Any, messages: List[BaseMessage]) -> dict:
+    """Describe a structured-output call; recordings are keyed by its hash."""
+    return {
+        'deployment': deployment,
+        'schema': convert_to_openai_tool(schema)['function'],
+        'messages': [[message.type, message.content] for message in messages],
+    }
+
+
+def _synthetic_value(json_schema: dict, name: str, tags: dict, blocks: List[dict]) -> Any:
+    kind = json_schema.get('type')
+    if kind == 'object':
+        return {key: _synthetic_value(value, key, tags, blocks)
+                for key, value in (json_schema.get('properties') or {}).items()}
+    if kind == 'array':
+        items = json_schema.get('items') or {}
+        if items.get('type') == 'object':
+            return [_synthetic_value(items, name, block, []) for block in blocks]
+        if name in tags:
+            return [part for part in tags[name].split(", ") if part]
+        return []
+    if kind == 'boolean':
+        return False
+    if kind in ('integer', 'number'):
+        return 0
+    return tags.get(name, "")
+
+
+def synthetic_output(schema: Any, messages: List[BaseMessage]) -> Any:
+    """Build a schema-shaped response without calling a model.
+
+    Fields named like a `<tag>` of the prompt (city, zip_code, address_lines, ...)
+    echo the tag content, so a normalized address equals the input address;
+    every other field gets an empty value (no matches, no description, no error).
+    A list of objects gets one item per numbered `<address index="n">` block.
+    """
+    tags, blocks = {}, []
+    for message in messages:
+        if isinstance(message.content, str):
+            for tag, content in _TAG_RE.findall(message.content):
+                tags.setdefault(tag, content)
+            blocks.extend(dict(_TAG_RE.findall(block)) for block in _ADDRESS_BLOCK_RE.findall(message.content))
+    return _synthetic_value(convert_to_openai_tool(schema)['function']['parameters'], "", tags, blocks)
+
+
+def estimated_usage(messages: List[BaseMessage], output: Any) -> dict:
+    """Approximate token usage of a synthetic call at four characters per token."""
+    input_tokens = sum(len(str(message.content)) for message in messages) // 4
+    output_tokens = len(json.dumps(output, ensure_ascii=False)) // 4
+    return {'input_tokens': input_tokens, 'output_tokens': output_tokens, 'total_tokens': input_tokens + output_tokens}
+
+
+def _structured_result(parsed: Any, usage: Optional[dict], include_raw: bool) -> Any:
+    if not include_raw:
+        return parsed
+    return {'raw': AIMessage(content="", usage_metadata=usage), 'parsed': parsed, 'parsing_error': None}
+
+
+class ProviderChatModel:
+    """Offline stand-in for `AzureChatOpenAI` that supports `with_structured_output`.
+
+    In "record" mode calls go to the live model and the responses are appended
+    to the cassette together with their token usage, in "replay" mode they are
+    served from the cassette and in "synthetic" mode they are generated from
+    the output schema. Replayed and synthetic calls go through the fault
+    injector.
+    """
+
+    def __init__(self, deployment_name: str, mode: str, cassette: Cassette, faults: FaultInjector,
+                 live: Optional[Any] = None):
+        self.deployment_name = deployment_name
+        self.mode = mode
+        self.cassette = cassette
+        self.faults = faults
+        self.live = live
+
+    def _offline(self, schema: Any, messages: List[BaseMessage], include_raw: bool) -> Any:
+        if self.mode == "synthetic":
+            parsed = synthetic_output(schema, messages)
+            return _structured_result(parsed, estimated_usage(messages, parsed), include_raw)
+        entry = self.cassette.get(request_key(structured_request(self.deployment_name, schema, messages)))
+        return _structured_result(entry['parsed'], entry.get('usage'), include_raw)
+
+    def _record(self, schema: Any, messages: List[BaseMessage], output: dict, include_raw: bool) -> Any:
+        if output.get('parsing_error') is not None and not include_raw:
+            raise output['parsing_error']
+        usage = getattr(output.get('raw'), 'usage_metadata', None)
+        request = structured_request(self.deployment_name, schema, messages)
+        response = {'parsed': json.loads(json.dumps(output.get('parsed'), default=dict)),
+                    'usage': dict(usage) if usage else None}
+        self.cassette.record(request_key(request), request, response)
+        return output if include_raw else output['parsed']
+
+    def with_structured_output(self, schema: Any, include_raw: bool = False, **kwargs) -> Runnable:
+        """Return a runnable that maps messages to a structured output of the schema."""
+
+        live = self.live.with_structured_output(schema, include_raw=True, **kwargs) if self.mode == "record" else None
+
+        def invoke(messages: List[BaseMessage]) -> Any:
+            if self.mode == "record":
+                output = live.invoke(messages)
+                return self._record(schema, messages, output, include_raw)
+            self.faults.apply(f"{self.deployment_name} chat model")
+            return self._offline(schema, messages, include_raw)
+
+        async def ainvoke(messages: List[BaseMessage]) -> Any:
+            if self.mode == "record":
+                output = await live.ainvoke(messages)
+                return self._record(schema, messages, output, include_raw)
+            await self.faults.aapply(f"{self.deployment_name} chat model")
+            return self._offline(schema, messages, include_raw)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=f"{self.mode}_{self.deployment_name}")
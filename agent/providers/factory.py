@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from metrics import record_client_setup
+from providers.cassette import Cassette
+from providers.chat_model import ProviderChatModel
+from providers.faults import FaultInjector
+from providers.scheduler import SCHEDULER_ENABLED
+from providers.web_search import ProviderWebSearch
+from stores.reference_store import RESOURCES_DIR
+
+# "live" - call Azure OpenAI and Tavily, "record" - call them and append the responses to cassettes,
+# "replay" - answer from the cassettes, "synthetic" - answer with generated schema-shaped responses
+PROVIDER_MODE = os.environ.get("PROVIDER_MODE", "live").lower()
+PROVIDER_CASSETTE_DIR = os.environ.get("PROVIDER_CASSETTE_DIR", os.path.join(RESOURCES_DIR, 'cassettes'))
+# Latency and errors injected into replayed and synthetic calls
+PROVIDER_LATENCY_MS = float(os.environ.get("PROVIDER_LATENCY_MS", "0"))
+PROVIDER_LATENCY_JITTER_MS = float(os.environ.get("PROVIDER_LATENCY_JITTER_MS", "0"))
+PROVIDER_ERROR_RATE = float(os.environ.get("PROVIDER_ERROR_RATE", "0"))
+PROVIDER_SEED = os.environ.get("PROVIDER_SEED")
+# Connections the live chat models share per process, kept alive between calls
+PROVIDER_MAX_CONNECTIONS = int(os.environ.get("PROVIDER_MAX_CONNECTIONS", "100"))
+PROVIDER_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("PROVIDER_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Per-attempt timeout of live LLM calls; retries are left to the scheduler, which backs off and adapts to 429s
+PROVIDER_TIMEOUT_SECONDS = float(os.environ.get("PROVIDER_TIMEOUT_SECONDS", "120"))
+
+PROVIDER_MODES = ("live", "record", "replay", "synthetic")
+
+_chat_models: Dict[str, Any] = {}
+_structured_models: Dict[Tuple[str, Any], Any] = {}
+_web_search: Optional[Any] = None
+_http_clients: Optional[Tuple[Any, Any]] = None
+_faults: Optional[FaultInjector] = None
+_providers_lock = threading.RLock()
+
+# Seconds spent building each client, including the imports it needed on first use
+client_setup_stats: Dict[str, float] = {}
+
+
+def _timed_setup(name: str, build) -> Any:
+    started = time.perf_counter()
+    client = build()
+    seconds = time.perf_counter() - started
+    client_setup_stats[name] = seconds
+    record_client_setup(name, seconds)
+    return client
+
+
+def _provider_mode() -> str:
+    if PROVIDER_MODE not in PROVIDER_MODES:
+        raise ValueError(f"Unknown PROVIDER_MODE {PROVIDER_MODE!r}, expected one of {', '.join(PROVIDER_MODES)}")
+    return PROVIDER_MODE
+
+
+def _fault_injector() -> FaultInjector:
+    global _faults
+    if _faults is None:
+        _faults = FaultInjector(PROVIDER_LATENCY_MS, PROVIDER_LATENCY_JITTER_MS, PROVIDER_ERROR_RATE,
+                                int(PROVIDER_SEED) if PROVIDER_SEED else None)
+    return _faults
+
+
+def _pooled_http_clients() -> Tuple[Any, Any]:
+    """Sync and async httpx clients shared by all live chat models; the caller holds `_providers_lock`."""
+    global _http_clients
+    if _http_clients is None:
+        import httpx
+
+        limits = httpx.Limits(max_connections=PROVIDER_MAX_CONNECTIONS,
+                              max_keepalive_connections=PROVIDER_MAX_KEEPALIVE_CONNECTIONS)
+        _http_clients = httpx.Client(limits=limits, timeout=None), httpx.AsyncClient(limits=limits, timeout=None)
+    return _http_clients
+
+
+def _live_chat_model(deployment: str) -> Any:
+    from langchain_openai import AzureChatOpenAI
+
+    http_client, http_async_client = _pooled_http_clients()
+    return AzureChatOpenAI(
+        azure_deployment=deployment,
+        api_version="2024-08-01-preview",
+        temperature=0,
+        max_tokens=None,
+        timeout=PROVIDER_TIMEOUT_SECONDS,
+        max_retries=0 if SCHEDULER_ENABLED else 2,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+def _live_web_search() -> Any:
+    from langchain_community.tools import TavilySearchResults
+
+    return TavilySearchResults(max_results=3)
+
+
+def get_chat_model(deployment: str = "gpt-4o") -> Any:
+    """Return the shared chat model for the deployment according to PROVIDER_MODE."""
+    model = _chat_models.get(deployment)
+    if model is None:
+        with _providers_lock:
+            model = _chat_models.get(deployment)
+            if model is None:
+                mode = _provider_mode()
+                if mode == "live":
+                    model = _timed_setup(f"chat_model:{deployment}", lambda: _live_chat_model(deployment))
+                else:
+                    model = _timed_setup(f"chat_model:{deployment}", lambda: ProviderChatModel(
+                        deployment, mode, Cassette(os.path.join(PROVIDER_CASSETTE_DIR, f"{deployment}.jsonl")),
+                        _fault_injector(), live=_live_chat_model(deployment) if mode == "record" else None))
+                _chat_models[deployment] = model
+    return model
+
+
+def get_structured_model(deployment: str, schema: Any) -> Any:
+    """Return the shared `with_structured_output(schema, include_raw=True)` runnable of the deployment.
+
+    Building the runnable converts the schema to a tool definition, so it is
+    done once per deployment and schema instead of on every call.
+    """
+    model = _structured_models.get((deployment, schema))
+    if model is None:
+        with _providers_lock:
+            model = _structured_models.get((deployment, schema))
+            if model is None:
+                chat_model = get_chat_model(deployment)
+                model = _timed_setup(f"structured_output:{deployment}:{getattr(schema, '__name__', schema)}",
+                                     lambda: chat_model.with_structured_output(schema, include_raw=True))
+                _structured_models[(deployment, schema)] = model
+    return model
+
+
+def get_web_search() -> Any:
+    """Return the shared web search tool according to PROVIDER_MODE."""
+    global _web_search
+    if _web_search is None:
+        with _providers_lock:
+            if _web_search is None:
+                mode = _provider_mode()
+                if mode == "live":
+                    _web_search = _timed_setup("web_search", _live_web_search)
+                else:
+                    _web_search = _timed_setup("web_search", lambda: ProviderWebSearch(
+                        mode, Cassette(os.path.join(PROVIDER_CASSETTE_DIR, 'tavily.jsonl')), _fault_injector(),
+                        live=_live_web_search() if mode == "record" else None))
+    return _web_search
@@ -0,0 +1,45 @@
+import asyncio
+import random
+import threading
+import time
+
+
+class InjectedProviderError(RuntimeError):
+    """Raised by replayed or synthetic providers to simulate a failing service."""
+
+
+class FaultInjector:
+    """Adds latency and random errors to offline providers.
+
+    Latency is `latency_ms` plus a uniform jitter of up to `jitter_ms`; every
+    call fails with probability `error_rate`. A fixed seed makes a run
+    reproducible.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, name: str):
+        with self._lock:
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+            failed = self._random.random() < self.error_rate
+        error = InjectedProviderError(f"Injected {name} error") if failed else None
+        return delay, error
+
+    def apply(self, name: str) -> None:
+        delay, error = self._draw(name)
+        if delay > 0:
+            time.sleep(delay)
+        if error is not None:
+            raise error
+
+    async def aapply(self, name: str) -> None:
+        delay, error = self._draw(name)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if error is not None:
+            raise error
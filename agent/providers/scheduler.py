@@ -0,0 +1,369 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.runnables.config import var_child_runnable_config
+
+from metrics import record_scheduler_throttle, record_scheduler_wait
+
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Quotas per LLM deployment and for the web search, 0 means unlimited
+LLM_RPM_LIMIT = float(os.environ.get("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = float(os.environ.get("LLM_TPM_LIMIT", "0"))
+WEB_SEARCH_RPM_LIMIT = float(os.environ.get("WEB_SEARCH_RPM_LIMIT", "0"))
+# Completion tokens reserved per LLM call until the real usage is known
+LLM_OUTPUT_TOKENS_ESTIMATE = int(os.environ.get("LLM_OUTPUT_TOKENS_ESTIMATE", "300"))
+# Calls slower than the target make the concurrency limit shrink
+LLM_LATENCY_TARGET_SECONDS = float(os.environ.get("LLM_LATENCY_TARGET_SECONDS", "30"))
+WEB_SEARCH_LATENCY_TARGET_SECONDS = float(os.environ.get("WEB_SEARCH_LATENCY_TARGET_SECONDS", "10"))
+# Adaptive concurrency limit per resource
+SCHEDULER_INITIAL_CONCURRENCY = float(os.environ.get("SCHEDULER_INITIAL_CONCURRENCY", "8"))
+SCHEDULER_MIN_CONCURRENCY = float(os.environ.get("SCHEDULER_MIN_CONCURRENCY", "1"))
+SCHEDULER_MAX_CONCURRENCY = float(os.environ.get("SCHEDULER_MAX_CONCURRENCY", "64"))
+# Share of the concurrency limit bulk calls may use, the rest is kept for interactive calls
+SCHEDULER_BULK_SHARE = float(os.environ.get("SCHEDULER_BULK_SHARE", "0.75"))
+# Retries of throttled or failed calls, each one queued again behind the limits
+SCHEDULER_MAX_RETRIES = int(os.environ.get("SCHEDULER_MAX_RETRIES", "3"))
+SCHEDULER_RETRY_BASE_SECONDS = float(os.environ.get("SCHEDULER_RETRY_BASE_SECONDS", "1"))
+
+# Priority lanes, set per run with {"configurable": {"priority": "bulk"}}
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = {INTERACTIVE: 0, BULK: 1}
+
+# Multiplicative decrease on a 429 and on a call slower than the latency target
+THROTTLE_DECREASE = 0.5
+LATENCY_DECREASE = 0.9
+
+
+def current_lane() -> str:
+    """Priority lane of the run the caller belongs to, interactive unless the run asked for bulk."""
+    config = var_child_runnable_config.get() or {}
+    priority = (config.get('configurable') or {}).get('priority')
+    return priority if priority in LANES else INTERACTIVE
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def is_throttled(error: BaseException) -> bool:
+    """True for a 429 (quota exceeded) response."""
+    return _status_code(error) == 429 or type(error).__name__ == 'RateLimitError'
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for throttling, server errors, timeouts and connection failures."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ('APIConnectionError', 'APITimeoutError', 'ConnectError', 'ReadTimeout',
+                                    'TimeoutException', 'TimeoutError', 'ConnectionError')
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the service asked to wait, from the Retry-After header."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills `per_minute` units evenly over a minute, holding at most a minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_seconds(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available; requests larger than the bucket wait for a full one."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Charge (or refund, if negative) the difference between the estimated and the real cost."""
+        if self.capacity > 0:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class _Waiter:
+    def __init__(self, lane: str, sequence: int, tokens: float):
+        self.lane = lane
+        self.sequence = sequence
+        self.tokens = tokens
+        self.granted = False
+        self.cancelled = False
+        self.queued_at = time.perf_counter()
+        self.wake: Callable[[], None] = lambda: None
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (LANES[self.lane], self.sequence) < (LANES[other.lane], other.sequence)
+
+
+class AdaptiveLimiter:
+    """Admits calls to one external resource within its quotas and an adaptive concurrency limit.
+
+    A call is admitted when a request and its estimated tokens are available
+    in the per-minute token buckets and fewer calls than the current limit are
+    in flight. The limit grows by 1/limit per successful call (about one per
+    round of calls), is halved on a 429 and shrinks by 10% on a call slower
+    than the latency target (AIMD). Waiting calls are served interactive lane
+    first, and bulk calls may only use `bulk_share` of the limit, so
+    interactive requests are not starved by bulk jobs.
+    """
+
+    def __init__(self, name: str, rpm: float = 0.0, tpm: float = 0.0, latency_target: float = 30.0,
+                 initial_limit: float = SCHEDULER_INITIAL_CONCURRENCY, min_limit: float = SCHEDULER_MIN_CONCURRENCY,
+                 max_limit: float = SCHEDULER_MAX_CONCURRENCY, bulk_share: float = SCHEDULER_BULK_SHARE):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.latency_target = latency_target
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.bulk_share = bulk_share
+        self.limit = max(min_limit, min(max_limit, initial_limit))
+        self.inflight = 0
+        self.paused_until = 0.0
+        self._queue: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+        self.admitted = {lane: 0 for lane in LANES}
+        self.waited_seconds = {lane: 0.0 for lane in LANES}
+        self.throttled = 0
+        self.retries = 0
+        self.slow_calls = 0
+
+    def _capacity(self, lane: str) -> int:
+        limit = self.limit if lane == INTERACTIVE else self.limit * self.bulk_share
+        return max(1, int(limit))
+
+    def _dispatch(self) -> Optional[float]:
+        """Admit queued calls in lane order; return seconds until the head may be admitted, None if it waits
+        for a call to finish. The caller holds `_lock`."""
+        now = time.monotonic()
+        while self._queue:
+            waiter = self._queue[0]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self.inflight >= self._capacity(waiter.lane):
+                return None
+            wait = max(self.paused_until - now, self.requests.wait_seconds(1, now),
+                       self.tokens.wait_seconds(waiter.tokens, now))
+            if wait > 0:
+                return wait
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.inflight += 1
+            self.admitted[waiter.lane] += 1
+            waiter.granted = True
+            waited = time.perf_counter() - waiter.queued_at
+            self.waited_seconds[waiter.lane] += waited
+            record_scheduler_wait(self.name, waiter.lane, waited)
+            waiter.wake()
+        return None
+
+    def _enqueue(self, tokens: float, lane: str) -> _Waiter:
+        waiter = _Waiter(lane, next(self._sequence), tokens)
+        heapq.heappush(self._queue, waiter)
+        return waiter
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if waiter.granted:
+                self.inflight -= 1
+            waiter.cancelled = True
+            self._dispatch()
+
+    def acquire(self, tokens: float = 0.0, lane: str = INTERACTIVE) -> _Waiter:
+        """Block until the call may start."""
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(tokens, lane)
+            waiter.wake = event.set
+        try:
+            while True:
+                with self._lock:
+                    wait = self._dispatch()
+                    if waiter.granted:
+                        return waiter
+                event.wait(wait)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    async def aacquire(self, tokens: float = 0.0, lane: str = INTERACTIVE) -> _Waiter:
+        """Async version of `acquire`."""
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        with self._lock:
+            waiter = self._enqueue(tokens, lane)
+            waiter.wake = lambda: loop.call_soon_threadsafe(woken.set)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._dispatch()
+                    if waiter.granted:
+                        return waiter
+                try:
+                    await asyncio.wait_for(woken.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                woken.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    def release(self, waiter: _Waiter, seconds: float, throttled: bool = False, failed: bool = False,
+                used_tokens: Optional[float] = None, pause_seconds: Optional[float] = None) -> None:
+        """Finish an admitted call and adapt the limit to its outcome; other failures leave the limit as is."""
+        with self._lock:
+            self.inflight -= 1
+            if throttled:
+                self.throttled += 1
+                self.limit = max(self.min_limit, self.limit * THROTTLE_DECREASE)
+                if pause_seconds:
+                    self.paused_until = max(self.paused_until, time.monotonic() + pause_seconds)
+            elif failed:
+                pass
+            elif seconds > self.latency_target:
+                self.slow_calls += 1
+                self.limit = max(self.min_limit, self.limit * LATENCY_DECREASE)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if used_tokens is not None:
+                self.tokens.adjust(used_tokens - waiter.tokens)
+            self._dispatch()
+        if throttled:
+            record_scheduler_throttle(self.name)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        with self._lock:
+            self.retries += 1
+        return retry_after(error) or SCHEDULER_RETRY_BASE_SECONDS * 2 ** attempt
+
+    def call(self, func: Callable[[], Any], tokens: float = 0.0, usage: Optional[Callable[[Any], Optional[float]]] = None,
+             lane: Optional[str] = None) -> Any:
+        """Run `func()` once admitted, retrying throttled and transient failures."""
+        lane = lane or current_lane()
+        for attempt in itertools.count():
+            waiter = self.acquire(tokens, lane)
+            started = time.perf_counter()
+            try:
+                result = func()
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.release(waiter, time.perf_counter() - started, throttled, failed=True,
+                             pause_seconds=retry_after(e))
+                if attempt >= SCHEDULER_MAX_RETRIES or not is_retryable(e):
+                    raise
+                time.sleep(self._backoff(attempt, e))
+                continue
+            self.release(waiter, time.perf_counter() - started, used_tokens=usage(result) if usage else None)
+            return result
+
+    async def acall(self, afunc: Callable[[], Awaitable[Any]], tokens: float = 0.0,
+                    usage: Optional[Callable[[Any], Optional[float]]] = None, lane: Optional[str] = None) -> Any:
+        """Async version of `call`."""
+        lane = lane or current_lane()
+        for attempt in itertools.count():
+            waiter = await self.aacquire(tokens, lane)
+            started = time.perf_counter()
+            try:
+                result = await afunc()
+            except asyncio.CancelledError:
+                self.release(waiter, time.perf_counter() - started, failed=True)
+                raise
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.release(waiter, time.perf_counter() - started, throttled, failed=True,
+                             pause_seconds=retry_after(e))
+                if attempt >= SCHEDULER_MAX_RETRIES or not is_retryable(e):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            self.release(waiter, time.perf_counter() - started, used_tokens=usage(result) if usage else None)
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = {lane: 0 for lane in LANES}
+            for waiter in self._queue:
+                if not waiter.cancelled:
+                    queued[waiter.lane] += 1
+            return {
+                'limit': self.limit,
+                'inflight': self.inflight,
+                'queued': queued,
+                'admitted': dict(self.admitted),
+                'avg_wait_ms': {lane: self.waited_seconds[lane] / self.admitted[lane] * 1000
+                                if self.admitted[lane] else 0.0 for lane in LANES},
+                'throttled': self.throttled,
+                'slow_calls': self.slow_calls,
+                'retries': self.retries,
+            }
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(resource: str) -> AdaptiveLimiter:
+    """Return the shared limiter of "llm:<deployment>" or "web_search"."""
+    limiter = _limiters.get(resource)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(resource)
+            if limiter is None:
+                if resource.startswith("llm:"):
+                    limiter = AdaptiveLimiter(resource, LLM_RPM_LIMIT, LLM_TPM_LIMIT, LLM_LATENCY_TARGET_SECONDS)
+                else:
+                    limiter = AdaptiveLimiter(resource, WEB_SEARCH_RPM_LIMIT, 0, WEB_SEARCH_LATENCY_TARGET_SECONDS)
+                _limiters[resource] = limiter
+    return limiter
+
+
+def scheduled(resource: str, func: Callable[[], Any], tokens: float = 0.0,
+              usage: Optional[Callable[[Any], Optional[float]]] = None) -> Any:
+    """Run `func()` through the resource's limiter, or directly when the scheduler is disabled."""
+    if not SCHEDULER_ENABLED:
+        return func()
+    return get_limiter(resource).call(func, tokens, usage)
+
+
+async def ascheduled(resource: str, afunc: Callable[[], Awaitable[Any]], tokens: float = 0.0,
+                     usage: Optional[Callable[[Any], Optional[float]]] = None) -> Any:
+    """Async version of `scheduled`."""
+    if not SCHEDULER_ENABLED:
+        return await afunc()
+    return await get_limiter(resource).acall(afunc, tokens, usage)
+
+
+def scheduler_stats() -> Dict[str, dict]:
+    """Return the state and counters of every limiter created so far."""
+    return {name: limiter.stats() for name, limiter in list(_limiters.items())}
@@ -0,0 +1,69 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# Measures what a cold worker pays before it can serve its first request:
+# module imports, graph compilation and building the shared clients, and
+# compares per-call structured output setup with the prebuilt runnables.
+# Run from the agent directory: python -m providers.startup [calls]
+
+GRAPH_MODULE = "address_data_processing"
+
+
+def import_costs(module: str = GRAPH_MODULE, top: int = 15) -> dict:
+    """Import the module in a fresh interpreter with `-X importtime` and sum the cost per top-level package."""
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+    wall_seconds = time.perf_counter() - started
+    packages = defaultdict(int)
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if self_us.strip().isdigit():
+            packages[name.strip().split(".")[0]] += int(self_us)
+    ranked = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {
+        'process_seconds': wall_seconds,
+        'import_seconds': sum(packages.values()) / 1e6,
+        'top_packages_seconds': {name: us / 1e6 for name, us in ranked},
+        'error': process.stderr.strip().splitlines()[-1] if process.returncode else None,
+    }
+
+
+def structured_setup_costs(calls: int) -> dict:
+    """Time building the shared clients, then per-call `with_structured_output` against the prebuilt runnable."""
+    from models import FindOutputState, NormalizeOutputState, WebSearchOutputState
+    from providers import client_setup_stats, get_chat_model, get_structured_model
+
+    schemas = (WebSearchOutputState, FindOutputState, NormalizeOutputState)
+    for schema in schemas:
+        get_structured_model("gpt-4o", schema)
+
+    chat_model = get_chat_model("gpt-4o")
+    started = time.perf_counter()
+    for _ in range(calls):
+        for schema in schemas:
+            chat_model.with_structured_output(schema, include_raw=True)
+    per_call_build = (time.perf_counter() - started) / (calls * len(schemas))
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        for schema in schemas:
+            get_structured_model("gpt-4o", schema)
+    per_call_shared = (time.perf_counter() - started) / (calls * len(schemas))
+
+    return {
+        'client_setup_seconds': dict(client_setup_stats),
+        'per_call_build_ms': per_call_build * 1000,
+        'per_call_shared_ms': per_call_shared * 1000,
+    }
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print(json.dumps({'imports': import_costs(), 'clients': structured_setup_costs(calls)}, indent=2))
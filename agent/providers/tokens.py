@@ -0,0 +1,42 @@
+import math
+import os
+import threading
+from typing import List
+
+from langchain_core.messages import BaseMessage
+
+# "estimate" - about 4 UTF-8 bytes per token, "tiktoken" - exact o200k_base counts (downloads the encoding once)
+PROMPT_TOKENIZER = os.environ.get("PROMPT_TOKENIZER", "estimate").lower()
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _tiktoken_encoding():
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+
+                    _encoding = tiktoken.get_encoding('o200k_base')
+                except Exception as e:
+                    print(f"Error loading tiktoken encoding, estimating tokens instead: {e}")
+                    _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count (or estimate) the prompt tokens of the text."""
+    if PROMPT_TOKENIZER == "tiktoken":
+        encoding = _tiktoken_encoding()
+        if encoding:
+            return len(encoding.encode(text))
+    return math.ceil(len(text.encode('utf-8')) / 4)
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    """Count (or estimate) the prompt tokens of chat messages."""
+    return sum(count_tokens(message.content if isinstance(message.content, str) else str(message.content))
+               for message in messages)
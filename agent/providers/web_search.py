@@ -0,0 +1,49 @@
+from typing import Any, List, Optional
+from urllib.parse import quote_plus
+
+from providers.cassette import Cassette, request_key
+from providers.faults import FaultInjector
+
+
+def synthetic_results(query: str) -> List[dict]:
+    """Build a Tavily-shaped result list that only restates the query."""
+    return [{'url': f"https://example.com/search?q={quote_plus(query)}",
+             'content': f"Synthetic search result for {query}"}]
+
+
+class ProviderWebSearch:
+    """Offline stand-in for `TavilySearchResults` with the same `invoke`/`ainvoke` interface.
+
+    Modes work like `ProviderChatModel`: "record" calls the live tool and
+    appends to the cassette, "replay" serves the cassette and "synthetic"
+    answers every query with `synthetic_results`.
+    """
+
+    def __init__(self, mode: str, cassette: Cassette, faults: FaultInjector, live: Optional[Any] = None):
+        self.mode = mode
+        self.cassette = cassette
+        self.faults = faults
+        self.live = live
+
+    def _offline(self, query: str) -> Any:
+        if self.mode == "synthetic":
+            return synthetic_results(query)
+        return self.cassette.get(request_key({'query': query}))
+
+    def invoke(self, query: str) -> Any:
+        """Search the web for the query."""
+        if self.mode == "record":
+            result = self.live.invoke(query)
+            self.cassette.record(request_key({'query': query}), {'query': query}, result)
+            return result
+        self.faults.apply("web search")
+        return self._offline(query)
+
+    async def ainvoke(self, query: str) -> Any:
+        """Async version of `invoke`."""
+        if self.mode == "record":
+            result = await self.live.ainvoke(query)
+            self.cassette.record(request_key({'query': query}), {'query': query}, result)
+            return result
+        await self.faults.aapply("web search")
+        return self._offline(query)
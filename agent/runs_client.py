@@ -0,0 +1,165 @@
+import asyncio
+import os
+import random
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from langgraph_sdk.client import LangGraphClient
+from langgraph_sdk.errors import APIStatusError
+
+# Async client for the /runs API of the LangGraph server, for services that drive
+# the address graph at high throughput. It keeps one pool of keep-alive
+# connections, bounds the runs in flight, retries throttled, failing and
+# unreachable calls with exponential backoff, and offers one run per address,
+# one run of the batch graph for many addresses, background runs that are
+# joined later, and streaming of a run's node updates.
+#
+#   async with AddressRunsClient() as client:
+#       results = await client.process_many(addresses, priority="bulk")
+
+RUNS_API_URL = os.environ.get("RUNS_API_URL", "http://127.0.0.1:2024")
+# Sent as x-api-key, e.g. for a deployment behind authentication
+RUNS_API_KEY = os.environ.get("RUNS_API_KEY", "")
+# Pooled connections to the server, kept alive between runs
+RUNS_CLIENT_MAX_CONNECTIONS = int(os.environ.get("RUNS_CLIENT_MAX_CONNECTIONS", "32"))
+# Calls in flight at the same time
+RUNS_CLIENT_MAX_CONCURRENCY = int(os.environ.get("RUNS_CLIENT_MAX_CONCURRENCY", "16"))
+# Read timeout of a call; a /runs/wait call lasts as long as the run
+RUNS_CLIENT_TIMEOUT_SECONDS = float(os.environ.get("RUNS_CLIENT_TIMEOUT_SECONDS", "300"))
+# Retries of a call after a 429, a 5xx or a connection error, backing off exponentially from the base
+RUNS_CLIENT_RETRIES = int(os.environ.get("RUNS_CLIENT_RETRIES", "3"))
+RUNS_CLIENT_RETRY_BASE_SECONDS = float(os.environ.get("RUNS_CLIENT_RETRY_BASE_SECONDS", "0.5"))
+
+ADDRESS_ASSISTANT = "address_data_processing"
+BATCH_ASSISTANT = "address_batch_processing"
+
+# (result, error message): exactly one of them is None
+RunOutcome = Tuple[Optional[dict], Optional[str]]
+
+
+def build_config(priority=None):
+    """Run config of the address graphs; bulk jobs pass priority "bulk" for the provider scheduler's bulk lane"""
+    return {
+        "tags": [""],
+        "recursion_limit": 10,
+        "configurable": {"priority": priority} if priority else {}
+    }
+
+
+def is_retryable(error):
+    """Whether a failed call may succeed when repeated"""
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def retry_delay(attempt, error, base_seconds=RUNS_CLIENT_RETRY_BASE_SECONDS):
+    """Seconds to wait before the retry `attempt` (from 0), honouring a Retry-After header"""
+    if isinstance(error, APIStatusError):
+        retry_after = error.response.headers.get('retry-after', "")
+        if retry_after.replace('.', '', 1).isdigit():
+            return min(60.0, float(retry_after))
+    return min(30.0, base_seconds * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+class AddressRunsClient:
+    """Pooled, concurrency-bounded client of the address graphs on a LangGraph server."""
+
+    def __init__(self, url: str = RUNS_API_URL, max_connections: int = RUNS_CLIENT_MAX_CONNECTIONS,
+                 max_concurrency: int = RUNS_CLIENT_MAX_CONCURRENCY, timeout: float = RUNS_CLIENT_TIMEOUT_SECONDS,
+                 retries: int = RUNS_CLIENT_RETRIES, retry_base_seconds: float = RUNS_CLIENT_RETRY_BASE_SECONDS,
+                 api_key: str = RUNS_API_KEY):
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._http = httpx.AsyncClient(
+            base_url=url,
+            transport=httpx.AsyncHTTPTransport(limits=limits),
+            timeout=httpx.Timeout(timeout, connect=5.0, pool=None),
+            headers={'x-api-key': api_key} if api_key else None,
+        )
+        self.client = LangGraphClient(self._http)
+        self.retries = retries
+        self.retry_base_seconds = retry_base_seconds
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.calls = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def __aenter__(self) -> 'AddressRunsClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    async def _call(self, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run the call within the concurrency bound, retrying it on retryable errors."""
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                self.calls += 1
+                try:
+                    return await make_call()
+                except Exception as e:
+                    if attempt == self.retries or not is_retryable(e):
+                        self.failed += 1
+                        raise
+                    self.retried += 1
+                    delay = retry_delay(attempt, e, self.retry_base_seconds)
+                # Back off without holding a slot, so the other calls keep going
+                self._semaphore.release()
+                try:
+                    await asyncio.sleep(delay)
+                finally:
+                    await self._semaphore.acquire()
+
+    async def process(self, address: dict, priority: Optional[str] = None) -> dict:
+        """Run the address graph for one address and return its final state"""
+        return await self._call(lambda: self.client.runs.wait(
+            None, ADDRESS_ASSISTANT, input={'address': address}, config=build_config(priority)))
+
+    async def process_many(self, addresses: Sequence[dict], priority: Optional[str] = None) -> List[RunOutcome]:
+        """Run every address as its own run, concurrently up to the bound; outcomes are in input order"""
+        return await asyncio.gather(*[_outcome(self.process(address, priority)) for address in addresses])
+
+    async def process_batch(self, addresses: Sequence[dict], priority: Optional[str] = None) -> List[dict]:
+        """Process the addresses in one run of the batch graph, which fans them out on the server"""
+        result = await self._call(lambda: self.client.runs.wait(
+            None, BATCH_ASSISTANT, input={'addresses': list(addresses)}, config=build_config(priority)))
+        return result['results']
+
+    async def submit(self, addresses: Sequence[dict], priority: Optional[str] = None) -> List[dict]:
+        """Start one background run per address with a single request; join the returned runs for the results"""
+        payloads = [{'assistant_id': ADDRESS_ASSISTANT, 'input': {'address': address},
+                     'config': build_config(priority), 'on_completion': "keep"} for address in addresses]
+        return await self._call(lambda: self.client.runs.create_batch(payloads))
+
+    async def join(self, run: dict) -> dict:
+        """Wait for a background run from `submit` and return its final state"""
+        return await self._call(lambda: self.client.runs.join(run['thread_id'], run['run_id']))
+
+    async def join_many(self, runs: Sequence[dict]) -> List[RunOutcome]:
+        """Join the background runs; outcomes are in the order of `runs`"""
+        return await asyncio.gather(*[_outcome(self.join(run)) for run in runs])
+
+    async def stream(self, address: dict, priority: Optional[str] = None,
+                     stream_mode: str = "updates") -> AsyncIterator[Tuple[str, Any]]:
+        """Yield (event, data) parts of one run as it progresses, e.g. the output of each node.
+
+        The run holds a concurrency slot while it streams and is not retried.
+        """
+        async with self._semaphore:
+            self.calls += 1
+            async for part in self.client.runs.stream(None, ADDRESS_ASSISTANT, input={'address': address},
+                                                      config=build_config(priority), stream_mode=stream_mode):
+                yield part.event, part.data
+
+    def stats(self) -> Dict[str, int]:
+        return {'calls': self.calls, 'retried': self.retried, 'failed': self.failed}
+
+
+async def _outcome(call: Awaitable[dict]) -> RunOutcome:
+    try:
+        return await call, None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
@@ -1,7 +1,21 @@
+import argparse
+import asyncio
 import http.client
 import json
+import math
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from runs_client import ADDRESS_ASSISTANT, AddressRunsClient, build_config
+
+CATEGORIES = ['exact_matches', 'fuzzy_matches', 'no_matches', 'problematic_addresses']
+
+# Whether addresses of a category are expected to match a reference address; problematic
+# addresses have no single right answer and only get their match and error rates reported
+EXPECTED_MATCH = {'exact_matches': True, 'fuzzy_matches': True, 'no_matches': False}
 
 
 def load_addresses(file_path):
@@ -77,35 +91,159 @@ def prettify_response(response_text):
         return f"Raw Response:\n{'-' * 30}\n{response_text}\n{'-' * 30}"
 
 
-def send_address_request(address_data):
-    """Send POST request for a single address"""
-    conn = http.client.HTTPConnection("127.0.0.1:2024")
-
-    payload = {
-        "assistant_id": "address_data_processing",
+def build_payload(address_data, priority=None):
+    """Build the /runs/wait request body for a single address; bulk jobs pass priority "bulk"."""
+    return {
+        "assistant_id": ADDRESS_ASSISTANT,
         "input": {
             "address": address_data
         },
-        "config": {
-            "tags": [""],
-            "recursion_limit": 10,
-            "configurable": {}
-        }
+        "config": build_config(priority)
     }
 
-    headers = {'content-type': "application/json"}
 
+def send_address_requests(addresses):
+    """Send the addresses concurrently over pooled connections and return the responses in order"""
+
+    async def send_all():
+        async with AddressRunsClient() as client:
+            return await client.process_many(addresses)
+
+    return [json.dumps(result) if error is None else f"Error sending request: {error}"
+            for result, error in asyncio.run(send_all())]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(latencies):
+    """Summarize latencies in seconds as p50/p95/p99/mean/max in milliseconds"""
+    values = sorted(latencies)
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+    return {
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'mean_ms': sum(values) / len(values) * 1000,
+        'max_ms': values[-1] * 1000,
+    }
+
+
+def benchmark_request(host, address_data, timeout):
+    """Send one address and return (latency in seconds, parsed response or None, error message or None)"""
+    conn = http.client.HTTPConnection(host, timeout=timeout)
+    started = time.perf_counter()
     try:
-        conn.request("POST", "/runs/wait", json.dumps(payload), headers)
+        conn.request("POST", "/runs/wait", json.dumps(build_payload(address_data)), {'content-type': "application/json"})
         res = conn.getresponse()
         data = res.read()
-        return data.decode("utf-8")
+        latency = time.perf_counter() - started
+        if res.status != 200:
+            return latency, None, f"HTTP {res.status}"
+        return latency, json.loads(data.decode("utf-8")), None
     except Exception as e:
-        return f"Error sending request: {e}"
+        return time.perf_counter() - started, None, str(e)
     finally:
         conn.close()
 
 
+def run_benchmark(addresses_data, host, concurrency, rate, repeat, categories, timeout):
+    """Replay the address categories against the server and return the report as a dict"""
+    requests = [(category, address)
+                for _ in range(repeat)
+                for category in categories
+                for address in addresses_data.get(category, [])]
+    results = [None] * len(requests)
+    started = time.perf_counter()
+    schedule_lock = threading.Lock()
+    next_slot = [started]
+
+    def run(position):
+        if rate > 0:
+            # Open-loop pacing: request N is not sent before started + N / rate
+            with schedule_lock:
+                slot = next_slot[0]
+                next_slot[0] += 1.0 / rate
+            delay = slot - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        _, address = requests[position]
+        results[position] = benchmark_request(host, address, timeout)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, range(len(requests))))
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'config': {'host': host, 'concurrency': concurrency, 'rate': rate, 'repeat': repeat,
+                   'categories': categories, 'timeout': timeout},
+        'requests': len(requests),
+        'errors': sum(1 for _, _, error in results if error),
+        'elapsed_s': elapsed,
+        'rps': len(requests) / elapsed if elapsed > 0 else 0.0,
+        'latency': latency_summary([latency for latency, _, error in results if not error]),
+        'categories': {},
+    }
+
+    for category in categories:
+        category_results = [result for (request_category, _), result in zip(requests, results)
+                            if request_category == category]
+        responses = [response for _, response, error in category_results if not error]
+        matched = [bool(response.get('matchedAddresses')) for response in responses]
+        summary = {
+            'requests': len(category_results),
+            'errors': len(category_results) - len(responses),
+            'latency': latency_summary([latency for latency, _, error in category_results if not error]),
+            'match_rate': sum(matched) / len(matched) if matched else None,
+            'error_flag_rate': (sum(1 for response in responses if response.get('error')) / len(responses)
+                                if responses else None),
+        }
+        if category in EXPECTED_MATCH:
+            correct = sum(1 for found in matched if found == EXPECTED_MATCH[category])
+            summary['accuracy'] = correct / len(category_results) if category_results else None
+        report['categories'][category] = summary
+
+    return report
+
+
+def parse_args(argv):
+    """Parse the command line; without --benchmark the interactive menu is shown"""
+    parser = argparse.ArgumentParser(description="Send request addresses to the address processing server")
+    parser.add_argument('--benchmark', action='store_true', help="run headless and print a JSON report")
+    parser.add_argument('--host', default="127.0.0.1:2024", help="server host:port")
+    parser.add_argument('--concurrency', type=int, default=4, help="requests in flight at the same time")
+    parser.add_argument('--rate', type=float, default=0.0, help="requests per second to send, 0 for as fast as possible")
+    parser.add_argument('--repeat', type=int, default=1, help="how many times to replay the addresses")
+    parser.add_argument('--categories', default=",".join(CATEGORIES), help="comma-separated categories to replay")
+    parser.add_argument('--timeout', type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument('--addresses', help="addresses file, defaults to resources/request-addresses.json")
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def benchmark_main(args, addresses_data):
+    """Run the headless benchmark and print the report"""
+    categories = [category.strip() for category in args.categories.split(',') if category.strip()]
+    unknown = [category for category in categories if category not in CATEGORIES]
+    if unknown:
+        print(f"Unknown categories: {', '.join(unknown)}", file=sys.stderr)
+        sys.exit(2)
+
+    report = run_benchmark(addresses_data, args.host, max(1, args.concurrency), args.rate, max(1, args.repeat),
+                           categories, args.timeout)
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report_json + "\n")
+    print(report_json)
+
+
 def get_user_choice():
     """Get user's choice for which addresses to test"""
     print("🏠 Address Testing Options:")
@@ -181,14 +319,22 @@ def select_specific_address(addresses_data):
             sys.exit(0)
 
 
-def main():
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
     # Get the script directory to find request-addresses.json in resources folder
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    addresses_file = os.path.join(script_dir, 'resources', 'request-addresses.json')
+    addresses_file = args.addresses or os.path.join(script_dir, 'resources', 'request-addresses.json')
 
     # Load addresses from JSON file
     addresses_data = load_addresses(addresses_file)
 
+    if args.benchmark:
+        if not addresses_data:
+            sys.exit(1)
+        benchmark_main(args, addresses_data)
+        return
+
     if not addresses_data:
         print("❌ No addresses found or error loading file")
         return
@@ -247,14 +393,12 @@ def main():
         print(f"\n🚀 Testing {len(addresses_to_test)} {test_type} address(es)...")
         print("=" * 70)
 
-        # Process each address
-        for i, address in enumerate(addresses_to_test, 1):
+        # Send all addresses at once, then display each response
+        responses = send_address_requests(addresses_to_test)
+        for i, response in enumerate(responses, 1):
             print(f"\n🏠 Processing address {i}/{len(addresses_to_test)}")
             print("=" * 70)
 
-            # Send request
-            response = send_address_request(address)
-
             # Prettify and display response
             formatted_response = prettify_response(response)
             print(formatted_response)
@@ -0,0 +1,20 @@
+from .columnar import ColumnarAddresses
+from .new_address_store import NEW_ADDRESS_ID_PREFIX, NewAddressStore, get_new_address_store, is_new_address_id
+from .reference_store import ReferenceSnapshot, ReferenceStore, get_reference_store
+from .snapshot_file import SnapshotFile, SnapshotFormatError, write_snapshot
+from .sqlite_cache import SqliteCache
+
+__all__ = [
+    'NEW_ADDRESS_ID_PREFIX',
+    'ColumnarAddresses',
+    'NewAddressStore',
+    'ReferenceSnapshot',
+    'ReferenceStore',
+    'SnapshotFile',
+    'SnapshotFormatError',
+    'SqliteCache',
+    'get_new_address_store',
+    'get_reference_store',
+    'is_new_address_id',
+    'write_snapshot'
+]
@@ -0,0 +1,176 @@
+import bisect
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from models import AddressWithId
+
+
+class StringTable:
+    """Interned strings: each distinct value is stored once and referenced by an integer code."""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = list(values)
+        self._codes: Dict[str, int] = {value: code for code, value in enumerate(self.values)}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: str) -> Optional[int]:
+        return self._codes.get(value)
+
+    def nbytes(self) -> int:
+        return sum(len(value.encode('utf-8')) + 8 for value in self.values)
+
+
+class _Blob:
+    """Variable-length UTF-8 strings packed into one byte array with an offsets array."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, values: Iterable[str]) -> '_Blob':
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> str:
+        return self.data[self.offsets[position]:self.offsets[position + 1]].tobytes().decode('utf-8')
+
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.offsets.nbytes
+
+
+class ColumnarAddresses(Sequence):
+    """Read-only sequence of addresses kept in columns instead of one dict per record.
+
+    Country, province, city and zip code are integer codes into interned
+    string tables; IDs and address lines are packed UTF-8 blobs, and each
+    record's lines are a range of the line blob given by `line_offsets`. IDs
+    are found by binary search over the positions sorted by ID. `AddressWithId`
+    dicts are only built for the records that are accessed, e.g. returned
+    candidates.
+    """
+
+    COLUMNS = ('country_codes', 'province_codes', 'city_codes', 'zip_code_codes', 'line_offsets', '_id_order')
+    TABLES = ('countries', 'provinces', 'cities', 'zip_codes')
+
+    def __init__(self, addresses: Iterable[AddressWithId]):
+        self.countries = StringTable()
+        self.provinces = StringTable()
+        self.cities = StringTable()
+        self.zip_codes = StringTable()
+        country_codes, province_codes, city_codes, zip_code_codes = [], [], [], []
+        ids, lines, line_counts = [], [], []
+
+        for address in addresses:
+            ids.append(address['id'])
+            country_codes.append(self.countries.code(address['country']))
+            province_codes.append(self.provinces.code(address['province']))
+            city_codes.append(self.cities.code(address['city']))
+            zip_code_codes.append(self.zip_codes.code(address['zip_code']))
+            lines.extend(address['address_lines'])
+            line_counts.append(len(address['address_lines']))
+
+        self.country_codes = np.asarray(country_codes, dtype=_code_dtype(self.countries))
+        self.province_codes = np.asarray(province_codes, dtype=_code_dtype(self.provinces))
+        self.city_codes = np.asarray(city_codes, dtype=_code_dtype(self.cities))
+        self.zip_code_codes = np.asarray(zip_code_codes, dtype=_code_dtype(self.zip_codes))
+        self.line_offsets = np.zeros(len(line_counts) + 1, dtype=np.int64)
+        np.cumsum(line_counts, out=self.line_offsets[1:])
+        self.lines = _Blob.pack(lines)
+        self.ids = _Blob.pack(ids)
+
+        self._id_order = np.asarray(sorted(range(len(ids)), key=ids.__getitem__), dtype=np.int32)
+
+    def to_arrays(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """Return the string tables and the columns, e.g. for `stores.snapshot_file.write_snapshot`."""
+        arrays = {name: getattr(self, name) for name in self.COLUMNS}
+        arrays.update({'lines': self.lines.data, 'line_text_offsets': self.lines.offsets,
+                       'ids': self.ids.data, 'id_offsets': self.ids.offsets})
+        return {name: getattr(self, name).values for name in self.TABLES}, arrays
+
+    @classmethod
+    def from_arrays(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> 'ColumnarAddresses':
+        """Rebuild the store around the arrays of `to_arrays` without copying them."""
+        columns = cls.__new__(cls)
+        for name in cls.TABLES:
+            setattr(columns, name, StringTable(meta[name]))
+        for name in cls.COLUMNS:
+            setattr(columns, name, arrays[name])
+        columns.lines = _Blob(arrays['lines'], arrays['line_text_offsets'])
+        columns.ids = _Blob(arrays['ids'], arrays['id_offsets'])
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[index] for index in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        start, end = self.line_offsets[position], self.line_offsets[position + 1]
+        return AddressWithId(
+            id=self.ids[position],
+            city=self.cities.values[self.city_codes[position]],
+            zip_code=self.zip_codes.values[self.zip_code_codes[position]],
+            province=self.provinces.values[self.province_codes[position]],
+            country=self.countries.values[self.country_codes[position]],
+            address_lines=[self.lines[line] for line in range(start, end)],
+        )
+
+    def __iter__(self) -> Iterator[AddressWithId]:
+        for position in range(len(self)):
+            yield self[position]
+
+    def position(self, address_id: str) -> Optional[int]:
+        """Return the position of the record with the ID, or None."""
+        if not isinstance(address_id, str):
+            return None
+        index = bisect.bisect_left(self._id_order, address_id, key=lambda position: self.ids[position])
+        if index < len(self._id_order) and self.ids[self._id_order[index]] == address_id:
+            return int(self._id_order[index])
+        return None
+
+    def get(self, address_id: str) -> Optional[AddressWithId]:
+        """Materialize the record with the ID, or None."""
+        position = self.position(address_id)
+        return self[position] if position is not None else None
+
+    def by_country(self, country: str) -> List[AddressWithId]:
+        """Materialize the records whose country code matches case-insensitively."""
+        codes = [code for code, value in enumerate(self.countries.values) if value.upper() == country.upper()]
+        positions = np.flatnonzero(np.isin(self.country_codes, codes))
+        return [self[int(position)] for position in positions]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns and string tables."""
+        return (sum(getattr(self, name).nbytes for name in self.COLUMNS)
+                + sum(getattr(self, name).nbytes() for name in self.TABLES)
+                + self.lines.nbytes() + self.ids.nbytes())
+
+
+def _code_dtype(table: StringTable):
+    if len(table) <= np.iinfo(np.uint8).max:
+        return np.uint8
+    if len(table) <= np.iinfo(np.uint16).max:
+        return np.uint16
+    return np.uint32
+
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from metrics import record_cache_lookup, record_external_call, record_llm_prompt, record_llm_usage
+from providers import ascheduled, count_message_tokens, get_structured_model, scheduled
+from providers.scheduler import LLM_OUTPUT_TOKENS_ESTIMATE
+from stores.reference_store import RESOURCES_DIR
+from stores.sqlite_cache import SqliteCache
+
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(RESOURCES_DIR, 'cache', 'llm-outputs.sqlite3'))
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "100000"))
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def _parsed(node: str, output: dict) -> Any:
+    """Unwrap an `include_raw=True` structured output, recording its token usage."""
+    if output.get('parsing_error') is not None:
+        raise output['parsing_error']
+    record_llm_usage(node, getattr(output.get('raw'), 'usage_metadata', None))
+    return output['parsed']
+
+
+def _used_tokens(output: Any) -> Optional[int]:
+    usage = getattr(output.get('raw'), 'usage_metadata', None) if isinstance(output, dict) else None
+    return usage.get('total_tokens') if usage else None
+
+
+def _estimated_tokens(messages: List[BaseMessage]) -> int:
+    return count_message_tokens(messages) + LLM_OUTPUT_TOKENS_ESTIMATE
+
+
+def call_llm(node: str, deployment: str, schema: Any, messages: List[BaseMessage]) -> Any:
+    """Call the deployment with structured output through the scheduler, recording latency and token usage."""
+    model = get_structured_model(deployment, schema)
+    started = time.perf_counter()
+    output = scheduled(f"llm:{deployment}", lambda: model.invoke(messages), _estimated_tokens(messages), _used_tokens)
+    record_external_call('llm', node, time.perf_counter() - started, cached=False)
+    return _parsed(node, output)
+
+
+async def acall_llm(node: str, deployment: str, schema: Any, messages: List[BaseMessage]) -> Any:
+    """Async version of `call_llm`."""
+    model = get_structured_model(deployment, schema)
+    started = time.perf_counter()
+    output = await ascheduled(f"llm:{deployment}", lambda: model.ainvoke(messages), _estimated_tokens(messages),
+                              _used_tokens)
+    record_external_call('llm', node, time.perf_counter() - started, cached=False)
+    return _parsed(node, output)
+
+
+class StructuredOutputCache:
+    """Content-addressed cache for `with_structured_output(...).invoke` results.
+
+    Keys are `{node}:{template hash}:{request hash}`, where the request hash
+    covers the deployment, the rendered messages and the output schema. When a
+    node registers a new prompt template, its entries for older templates are
+    dropped.
+    """
+
+    def __init__(self, cache: SqliteCache):
+        self.cache = cache
+        self.node_stats: Dict[str, Dict[str, int]] = {}
+        self._templates: Dict[str, str] = {}
+        self._schemas: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+
+    def _template_hash(self, node: str, template: str) -> str:
+        template_hash = _digest(template)[:16]
+        if self._templates.get(node) != template_hash:
+            with self._lock:
+                if self._templates.get(node) != template_hash:
+                    self.cache.invalidate(f"{node}:", keep_prefix=f"{node}:{template_hash}:")
+                    self._templates[node] = template_hash
+        return template_hash
+
+    def _schema_json(self, schema: Any) -> str:
+        schema_json = self._schemas.get(schema)
+        if schema_json is None:
+            schema_json = json.dumps(convert_to_openai_tool(schema), sort_keys=True)
+            self._schemas[schema] = schema_json
+        return schema_json
+
+    def _count(self, node: str, outcome: str) -> None:
+        with self._lock:
+            stats = self.node_stats.setdefault(node, {'hits': 0, 'misses': 0})
+            stats[outcome] += 1
+        record_cache_lookup('llm_cache', node, outcome == 'hits')
+
+    def _key(self, node: str, deployment: str, schema: Any, template_hash: str, messages: List[BaseMessage]) -> str:
+        request = json.dumps({
+            'deployment': deployment,
+            'messages': [[message.type, message.content] for message in messages],
+            'schema': self._schema_json(schema),
+        }, sort_keys=True, ensure_ascii=False)
+        return f"{node}:{template_hash}:{_digest(request)}"
+
+    def lookup(self, node: str, deployment: str, schema: Any, template: str,
+               messages: List[BaseMessage]) -> Tuple[str, Optional[Any]]:
+        """Return the cache key of the request and its cached output, None on a miss."""
+        key = self._key(node, deployment, schema, self._template_hash(node, template), messages)
+        started = time.perf_counter()
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count(node, 'hits')
+            record_external_call('llm', node, time.perf_counter() - started, cached=True)
+        else:
+            self._count(node, 'misses')
+        return key, cached
+
+    async def alookup(self, node: str, deployment: str, schema: Any, template: str,
+                      messages: List[BaseMessage]) -> Tuple[str, Optional[Any]]:
+        """Async version of `lookup`."""
+        template_hash = _digest(template)[:16]
+        if self._templates.get(node) != template_hash:
+            # A new template invalidates older entries with a DELETE, keep it off the event loop
+            template_hash = await asyncio.to_thread(self._template_hash, node, template)
+        key = self._key(node, deployment, schema, template_hash, messages)
+        started = time.perf_counter()
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            self._count(node, 'hits')
+            record_external_call('llm', node, time.perf_counter() - started, cached=True)
+        else:
+            self._count(node, 'misses')
+        return key, cached
+
+    def invoke(self, node: str, deployment: str, schema: Any, template: str, messages: List[BaseMessage],
+               call: Optional[Callable[[], Any]] = None) -> Any:
+        """Return the structured output for the messages, calling the LLM (or `call`) only on a cache miss."""
+        key, cached = self.lookup(node, deployment, schema, template, messages)
+        if cached is not None:
+            return cached
+        result = call() if call is not None else call_llm(node, deployment, schema, messages)
+        self.cache.set(key, result)
+        return result
+
+    async def ainvoke(self, node: str, deployment: str, schema: Any, template: str, messages: List[BaseMessage],
+                      acall: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """Async version of `invoke`."""
+        key, cached = await self.alookup(node, deployment, schema, template, messages)
+        if cached is not None:
+            return cached
+        result = await acall() if acall is not None else await acall_llm(node, deployment, schema, messages)
+        await self.cache.aset(key, result)
+        return result
+
+    def stats(self) -> dict:
+        """Return per-node hit rates plus the backing cache counters."""
+        nodes = {}
+        for node, stats in self.node_stats.items():
+            lookups = stats['hits'] + stats['misses']
+            nodes[node] = dict(stats, hit_rate=stats['hits'] / lookups if lookups else 0.0)
+        return {'nodes': nodes, 'cache': self.cache.stats()}
+
+
+_llm_cache: Optional[StructuredOutputCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> StructuredOutputCache:
+    """Return the shared structured-output cache, opening it on first use."""
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = StructuredOutputCache(SqliteCache(LLM_CACHE_PATH, 'structured_outputs',
+                                                               ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                                                               max_entries=LLM_CACHE_MAX_ENTRIES))
+    return _llm_cache
+
+
+async def aget_llm_cache() -> StructuredOutputCache:
+    """Async version of `get_llm_cache`, the first open runs in a worker thread."""
+    if _llm_cache is not None:
+        return _llm_cache
+    return await asyncio.to_thread(get_llm_cache)
+
+
+def llm_cache_stats() -> Optional[dict]:
+    """Return the shared cache statistics, or None if the cache was not opened yet."""
+    return _llm_cache.stats() if _llm_cache is not None else None
+
+
+def invoke_structured(node: str, deployment: str, schema: Any, template: str, messages: List[BaseMessage],
+                      call: Optional[Callable[[], Any]] = None) -> Any:
+    """Call the deployment with structured output, going through the shared cache when it is enabled.
+
+    With `call`, a cache miss is computed by it instead of sending the messages, e.g. within a batch.
+    """
+    if call is None:
+        record_llm_prompt(node, messages)
+        call = lambda: call_llm(node, deployment, schema, messages)
+    if not LLM_CACHE_ENABLED:
+        return call()
+    return get_llm_cache().invoke(node, deployment, schema, template, messages, call)
+
+
+async def ainvoke_structured(node: str, deployment: str, schema: Any, template: str, messages: List[BaseMessage],
+                             acall: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+    """Async version of `invoke_structured`."""
+    if acall is None:
+        record_llm_prompt(node, messages)
+        acall = lambda: acall_llm(node, deployment, schema, messages)
+    if not LLM_CACHE_ENABLED:
+        return await acall()
+    cache = await aget_llm_cache()
+    return await cache.ainvoke(node, deployment, schema, template, messages, acall)
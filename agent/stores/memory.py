@@ -0,0 +1,73 @@
+import json
+import sys
+import time
+import tracemalloc
+from typing import Callable, Iterator, List, Tuple
+
+from models import AddressWithId
+from stores.columnar import ColumnarAddresses
+from stores.reference_store import REFERENCE_ADDRESSES_PATH, parse_reference_addresses
+
+# Compares the memory per record of the reference addresses held as one dict
+# per record and as a ColumnarAddresses store. The reference file is scaled up
+# to N records by renumbering IDs and house numbers.
+# Run from the agent directory: python -m stores.memory [records]
+
+
+def scaled_addresses(reference: List[AddressWithId], count: int) -> Iterator[AddressWithId]:
+    """Yield `count` addresses cycling through the reference, each copy with distinct IDs and lines."""
+    for position in range(count):
+        address = reference[position % len(reference)]
+        copy = position // len(reference)
+        yield AddressWithId(
+            id=f"{address['country']}_{position}",
+            city=address['city'],
+            zip_code=address['zip_code'],
+            province=address['province'],
+            country=address['country'],
+            address_lines=[f"{line} {copy}" if copy else line for line in address['address_lines']]
+        )
+
+
+def measure(build: Callable[[], object]) -> Tuple[object, int, float]:
+    """Return the built value, the bytes it still holds and the build time."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+def memory_per_record(records: int) -> dict:
+    """Measure dicts against the columnar store for `records` scaled reference addresses."""
+    with open(REFERENCE_ADDRESSES_PATH, 'r', encoding='utf-8') as file:
+        reference = parse_reference_addresses(json.load(file))
+
+    # Round-trip through JSON so every record owns its strings, as after json.load
+    dicts, dict_bytes, _ = measure(
+        lambda: [json.loads(json.dumps(address)) for address in scaled_addresses(reference, records)])
+    del dicts
+    columns, column_bytes, build_seconds = measure(
+        lambda: ColumnarAddresses(scaled_addresses(reference, records)))
+
+    started = time.perf_counter()
+    for position in range(0, records, max(1, records // 10000)):
+        columns.get(columns.ids[position])
+    lookups = len(range(0, records, max(1, records // 10000)))
+    lookup_seconds = (time.perf_counter() - started) / lookups
+
+    return {
+        'records': records,
+        'dict_bytes_per_record': dict_bytes / records,
+        'columnar_bytes_per_record': column_bytes / records,
+        'ratio': dict_bytes / column_bytes if column_bytes else 0.0,
+        'columnar_build_seconds': build_seconds,
+        'get_by_id_us': lookup_seconds * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(json.dumps(memory_per_record(records), indent=2))
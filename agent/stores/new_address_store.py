@@ -0,0 +1,248 @@
+import asyncio
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+from models import Address, AddressWithId
+from stores.reference_store import NEW_ADDRESSES_PATH, RESOURCES_DIR
+
+NEW_ADDRESS_DB_PATH = os.environ.get("NEW_ADDRESS_DB_PATH", os.path.join(RESOURCES_DIR, 'new-addresses.sqlite3'))
+# The JSON export is compacted in the background at most this many seconds after an append
+NEW_ADDRESS_COMPACT_INTERVAL = float(os.environ.get("NEW_ADDRESS_COMPACT_INTERVAL", "5"))
+# New address IDs are `NEW_{country}_{n}`, apart from the `{country}_{n}` IDs of the reference addresses
+NEW_ADDRESS_ID_PREFIX = "NEW_"
+
+
+def is_new_address_id(address_id: str) -> bool:
+    """Whether the ID belongs to a new address rather than a reference address."""
+    return address_id.startswith(NEW_ADDRESS_ID_PREFIX)
+
+
+def _row_to_address(row) -> AddressWithId:
+    return AddressWithId(id=row[0], **json.loads(row[1]))
+
+
+class NewAddressStore:
+    """Append-only store for newly normalized addresses.
+
+    Addresses live in SQLite, which serializes writers across threads and
+    processes. Each append allocates the next per-country sequence number and
+    inserts one row inside a single `BEGIN IMMEDIATE` transaction, so IDs are
+    unique and the cost of a write does not depend on the table size. The
+    address the new one was normalized from is kept as its `source`, so
+    matching can recognize a repeat of the same input, and addresses the
+    normalization flagged as erroneous are kept but never matched against.
+    `new-addresses.json` is kept as an export that a background thread
+    compacts every `compact_interval` seconds after new appends, and that is
+    flushed once more at interpreter exit.
+    """
+
+    def __init__(self, path: str = NEW_ADDRESS_DB_PATH, export_path: str = NEW_ADDRESSES_PATH,
+                 compact_interval: float = NEW_ADDRESS_COMPACT_INTERVAL):
+        self.path = path
+        self.export_path = export_path
+        self.compact_interval = compact_interval
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS addresses ("
+            "id TEXT PRIMARY KEY, address TEXT NOT NULL, country TEXT NOT NULL, seq INTEGER NOT NULL)"
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(addresses)")}
+        for column, definition in (('source', "TEXT"), ('error', "INTEGER NOT NULL DEFAULT 0")):
+            if column not in columns:
+                try:
+                    self._connection.execute(f"ALTER TABLE addresses ADD COLUMN {column} {definition}")
+                except sqlite3.OperationalError:
+                    # Added by another process in the meantime
+                    pass
+        # Rows of earlier versions have IDs in the namespace of the reference addresses
+        self._connection.execute("UPDATE addresses SET id = ? || id WHERE substr(id, 1, ?) != ?",
+                                 (NEW_ADDRESS_ID_PREFIX, len(NEW_ADDRESS_ID_PREFIX), NEW_ADDRESS_ID_PREFIX))
+        self._connection.execute("CREATE INDEX IF NOT EXISTS addresses_country ON addresses (country, seq)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS sequences (country TEXT PRIMARY KEY, next INTEGER NOT NULL)")
+        self._import_json_export()
+        atexit.register(self.flush)
+
+    def _import_json_export(self) -> None:
+        """Seed an empty database with the addresses from the legacy JSON file."""
+        if self._connection.execute("SELECT 1 FROM addresses LIMIT 1").fetchone() is not None:
+            return
+        try:
+            with open(self.export_path, 'r', encoding='utf-8') as file:
+                content = file.read()
+            addresses = json.loads(content) if content.strip() else []
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError as e:
+            print(f"Error parsing new addresses JSON file: {e}")
+            return
+
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                for address in addresses:
+                    address_id = address['id']
+                    if is_new_address_id(address_id):
+                        address_id = address_id[len(NEW_ADDRESS_ID_PREFIX):]
+                    country, _, seq = address_id.rpartition('_')
+                    seq = int(seq) if seq.isdigit() else 0
+                    fields = {key: value for key, value in address.items() if key != 'id'}
+                    self._connection.execute(
+                        "INSERT OR IGNORE INTO addresses (id, address, country, seq) VALUES (?, ?, ?, ?)",
+                        (NEW_ADDRESS_ID_PREFIX + address_id, json.dumps(fields, ensure_ascii=False), country, seq)
+                    )
+                    self._connection.execute(
+                        "INSERT INTO sequences (country, next) VALUES (?, ?) "
+                        "ON CONFLICT (country) DO UPDATE SET next = max(next, excluded.next)",
+                        (country, seq + 1)
+                    )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def append(self, new_address: Address, source: Optional[Address] = None, error: bool = False) -> AddressWithId:
+        """Store a new address under the next free `NEW_{country}_{n}` ID and return it.
+
+        `source` is the input address it was normalized from, if known; `error`
+        is the flag of the normalization, such addresses are not matched against.
+        """
+        country_code = new_address['country'].upper()
+        fields = {
+            'city': new_address['city'],
+            'zip_code': new_address['zip_code'],
+            'province': new_address['province'],
+            'country': new_address['country'],
+            'address_lines': new_address['address_lines'],
+        }
+
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._connection.execute(
+                    "INSERT INTO sequences (country, next) VALUES (?, 1) "
+                    "ON CONFLICT (country) DO UPDATE SET next = next + 1 RETURNING next - 1",
+                    (country_code,)
+                ).fetchone()[0]
+                new_id = f"{NEW_ADDRESS_ID_PREFIX}{country_code}_{seq}"
+                self._connection.execute(
+                    "INSERT INTO addresses (id, address, country, seq, source, error) VALUES (?, ?, ?, ?, ?, ?)",
+                    (new_id, json.dumps(fields, ensure_ascii=False), country_code, seq,
+                     json.dumps(source, ensure_ascii=False) if source is not None else None, int(bool(error)))
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._dirty = True
+            self._start_compaction_thread()
+        return AddressWithId(id=new_id, **fields)
+
+    async def aappend(self, new_address: Address, source: Optional[Address] = None,
+                      error: bool = False) -> AddressWithId:
+        """Async version of `append`, the SQLite write runs in a worker thread."""
+        return await asyncio.to_thread(self.append, new_address, source, error)
+
+    def since(self, cursor: int) -> Tuple[List[Tuple[AddressWithId, Optional[Address]]], int]:
+        """Return the addresses with their sources appended after `cursor`, and the cursor to continue from.
+
+        Cursor 0 returns every address; the rows of other processes are included
+        and addresses flagged as erroneous are skipped.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT rowid, id, address, source, error FROM addresses WHERE rowid > ? ORDER BY rowid", (cursor,)
+            ).fetchall()
+        if not rows:
+            return [], cursor
+        entries = [(_row_to_address(row[1:3]), json.loads(row[3]) if row[3] else None) for row in rows if not row[4]]
+        return entries, rows[-1][0]
+
+    def get(self, address_id: str) -> Optional[AddressWithId]:
+        """Look up an address by its ID."""
+        with self._lock:
+            row = self._connection.execute("SELECT id, address FROM addresses WHERE id = ?", (address_id,)).fetchone()
+        return _row_to_address(row) if row is not None else None
+
+    def by_country(self, country: str) -> List[AddressWithId]:
+        """Return all addresses of the given country code."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, address FROM addresses WHERE country = ? ORDER BY seq", (country.upper(),)
+            ).fetchall()
+        return [_row_to_address(row) for row in rows]
+
+    def all(self) -> List[AddressWithId]:
+        """Return all stored addresses in insertion order."""
+        with self._lock:
+            rows = self._connection.execute("SELECT id, address FROM addresses ORDER BY rowid").fetchall()
+        return [_row_to_address(row) for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM addresses").fetchone()[0]
+
+    def compact(self) -> None:
+        """Checkpoint the write-ahead log and rewrite the JSON export atomically."""
+        with self._compact_lock:
+            with self._lock:
+                self._dirty = False
+            addresses = self.all()
+            tmp_path = f"{self.export_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(addresses, file, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.export_path)
+            with self._lock:
+                self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def flush(self) -> None:
+        """Compact right away if there are appends missing from the JSON export."""
+        self._closed.set()
+        if self._dirty:
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Error compacting new addresses: {e}")
+
+    def _start_compaction_thread(self) -> None:
+        """Start the background compaction thread; the caller holds `_lock`."""
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+
+        def run():
+            while not self._closed.wait(self.compact_interval):
+                if not self._dirty:
+                    continue
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"Error compacting new addresses: {e}")
+
+        self._compaction = threading.Thread(target=run, name='new-address-compaction', daemon=True)
+        self._compaction.start()
+
+
+_new_address_store: Optional[NewAddressStore] = None
+_new_address_store_lock = threading.Lock()
+
+
+def get_new_address_store() -> NewAddressStore:
+    """Return the shared store of newly normalized addresses."""
+    global _new_address_store
+    if _new_address_store is None:
+        with _new_address_store_lock:
+            if _new_address_store is None:
+                _new_address_store = NewAddressStore()
+    return _new_address_store
@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from models import AddressWithId
+from stores.columnar import ColumnarAddresses
+from stores.snapshot_file import Section, SnapshotFile, builder_digest
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources')
+REFERENCE_ADDRESSES_PATH = os.path.join(RESOURCES_DIR, 'addresses-to-match-against.json')
+NEW_ADDRESSES_PATH = os.path.join(RESOURCES_DIR, 'new-addresses.json')
+# Prebuilt snapshot of the reference addresses and their indexes, see build_snapshot.py.
+# It is memory-mapped instead of parsing the JSON file while it matches that file; empty disables it
+REFERENCE_SNAPSHOT_PATH = os.environ.get("REFERENCE_SNAPSHOT_PATH",
+                                         os.path.join(RESOURCES_DIR, 'addresses-to-match-against.snapshot'))
+
+# How often (in seconds) the backing file is stat-ed for changes
+CHECK_INTERVAL = float(os.environ.get("REFERENCE_STORE_CHECK_INTERVAL", "5"))
+
+
+# (mtime_ns, size) of the address file and of the prebuilt snapshot, None for a missing file
+Fingerprint = Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]
+
+
+def _stat_file(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def parse_reference_addresses(data: Any) -> List[AddressWithId]:
+    """Wrap the {country: [address, ...]} reference document into addresses with IDs."""
+    addresses_with_ids = []
+    for country_code, addresses in (data or {}).items():
+        for idx, address in enumerate(addresses):
+            # Create a unique ID combining country code and index
+            addresses_with_ids.append(AddressWithId(
+                id=f"{country_code}_{idx}",
+                city=address['city'],
+                zip_code=address['zip_code'],
+                province=address['province'],
+                country=address['country'],
+                address_lines=address['address_lines']
+            ))
+    return addresses_with_ids
+
+
+class ReferenceSnapshot:
+    """Immutable view of one version of an address file.
+
+    Addresses are kept in a `ColumnarAddresses` sequence and materialized as
+    dicts on access. Derived structures (indexes, lookup tables) are built at
+    most once per snapshot via `derived` and are dropped together with the
+    snapshot. A snapshot loaded from a prebuilt file also exposes that file's
+    sections, so the factories can map their structure instead of building it.
+    """
+
+    def __init__(self, version: int, digest: str, addresses: Iterable[AddressWithId],
+                 prebuilt: Optional[SnapshotFile] = None):
+        self.version = version
+        self.digest = digest
+        self.addresses = addresses if isinstance(addresses, ColumnarAddresses) else ColumnarAddresses(addresses)
+        self.prebuilt = prebuilt
+        self._derived: Dict[str, Any] = {}
+        self._derived_lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    def get(self, address_id: str) -> Optional[AddressWithId]:
+        """Look up an address by its ID."""
+        return self.addresses.get(address_id)
+
+    def by_country(self, country: str) -> List[AddressWithId]:
+        """Return all addresses of the given country code."""
+        return self.addresses.by_country(country)
+
+    def section(self, name: str) -> Optional[Section]:
+        """Return the prebuilt section `name`, or None when it has to be built."""
+        return self.prebuilt.section(name) if self.prebuilt is not None else None
+
+    def derived(self, name: str, factory: Callable[['ReferenceSnapshot'], Any]) -> Any:
+        """Return the structure registered under `name`, building it on first use."""
+        value = self._derived.get(name)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = factory(self)
+                    self._derived[name] = value
+        return value
+
+    def cached(self, name: str) -> Optional[Any]:
+        """Return the structure registered under `name` if it was already built."""
+        return self._derived.get(name)
+
+    async def aderived(self, name: str, factory: Callable[['ReferenceSnapshot'], Any]) -> Any:
+        """Async version of `derived`; a missing structure is built in a worker thread."""
+        value = self._derived.get(name)
+        if value is None:
+            value = await asyncio.to_thread(self.derived, name, factory)
+        return value
+
+
+class ReferenceStore:
+    """Process-wide, lazily loaded cache of an address JSON file.
+
+    The file is parsed once and then only stat-ed (at most every
+    `check_interval` seconds). A changed mtime/size triggers a re-read; the
+    snapshot is replaced atomically and only if the content hash changed.
+    With a `snapshot_path`, a prebuilt snapshot of the same content is
+    memory-mapped instead of parsing the file; a stale or unreadable one, or
+    one built by other matching code than the running one, is ignored.
+    """
+
+    def __init__(self, path: str, parser: Callable[[Any], List[AddressWithId]], check_interval: float = CHECK_INTERVAL,
+                 snapshot_path: Optional[str] = None):
+        self.path = path
+        self.parser = parser
+        self.check_interval = check_interval
+        self.snapshot_path = snapshot_path
+        self._snapshot: Optional[ReferenceSnapshot] = None
+        self._fingerprint: Optional[Fingerprint] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _stat(self) -> Optional[Fingerprint]:
+        source = _stat_file(self.path)
+        prebuilt = _stat_file(self.snapshot_path) if self.snapshot_path else None
+        if source is None and prebuilt is None:
+            return None
+        return source, prebuilt
+
+    def _open_prebuilt(self, fingerprint: Optional[Fingerprint]) -> Optional[SnapshotFile]:
+        """Map the prebuilt snapshot if it was built from the current content of the file."""
+        if fingerprint is None or fingerprint[1] is None:
+            return None
+        try:
+            prebuilt = SnapshotFile(self.snapshot_path)
+        except (OSError, ValueError) as e:
+            print(f"Error loading snapshot {self.snapshot_path}: {e}")
+            return None
+
+        source, built_from = fingerprint[0], prebuilt.source
+        if built_from.get('builder') != builder_digest():
+            print(f"Snapshot {self.snapshot_path} was built by other matching code, loading {self.path} "
+                  f"(rebuild with build_snapshot.py)")
+            return None
+        if source is None or [built_from.get('mtime_ns'), built_from.get('size')] == list(source):
+            return prebuilt
+        # The file was touched or copied since the build, compare the content
+        with open(self.path, 'rb') as file:
+            if hashlib.file_digest(file, 'sha256').hexdigest() == built_from.get('digest'):
+                return prebuilt
+        print(f"Snapshot {self.snapshot_path} is stale, loading {self.path} (rebuild with build_snapshot.py)")
+        return None
+
+    def _reload(self, fingerprint: Optional[Fingerprint]) -> None:
+        prebuilt = self._open_prebuilt(fingerprint)
+        if prebuilt is not None:
+            self._replace(prebuilt.source['digest'], fingerprint,
+                          lambda: ColumnarAddresses.from_arrays(*prebuilt.section('addresses')), prebuilt)
+            return
+
+        if fingerprint is None or fingerprint[0] is None:
+            content = b""
+        else:
+            with open(self.path, 'rb') as file:
+                content = file.read()
+
+        def parse():
+            data = json.loads(content) if content.strip() else None
+            return self.parser(data)
+
+        self._replace(hashlib.sha256(content).hexdigest(), fingerprint, parse)
+
+    def _replace(self, digest: str, fingerprint: Optional[Fingerprint], load: Callable[[], Iterable[AddressWithId]],
+                 prebuilt: Optional[SnapshotFile] = None) -> None:
+        if self._snapshot is not None and self._snapshot.digest == digest:
+            self._fingerprint = fingerprint
+            return
+
+        try:
+            addresses = load()
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON file {self.path}: {e}")
+            addresses = None
+        except Exception as e:
+            print(f"Error loading addresses from {self.path}: {e}")
+            addresses = None
+
+        if addresses is None:
+            # Keep serving the last good snapshot
+            if self._snapshot is None:
+                self._snapshot = ReferenceSnapshot(0, digest, [])
+            self._fingerprint = fingerprint
+            return
+
+        version = self._snapshot.version + 1 if self._snapshot is not None else 1
+        self._snapshot = ReferenceSnapshot(version, digest, addresses, prebuilt)
+        self._fingerprint = fingerprint
+        self.reloads += 1
+
+    def snapshot(self) -> ReferenceSnapshot:
+        """Return the current snapshot, reloading it if the file changed."""
+        now = time.monotonic()
+        if self._snapshot is not None and now < self._next_check:
+            return self._snapshot
+
+        with self._lock:
+            if self._snapshot is None or now >= self._next_check:
+                fingerprint = self._stat()
+                if self._snapshot is None or fingerprint != self._fingerprint:
+                    self._reload(fingerprint)
+                self._next_check = now + self.check_interval
+        return self._snapshot
+
+    async def asnapshot(self) -> ReferenceSnapshot:
+        """Async version of `snapshot`; a due change check and reload run in a worker thread."""
+        if self._snapshot is not None and time.monotonic() < self._next_check:
+            return self._snapshot
+        return await asyncio.to_thread(self.snapshot)
+
+    def invalidate(self) -> None:
+        """Force a change check on the next access, e.g. after writing the file."""
+        self._next_check = 0.0
+
+    def get(self, address_id: str) -> Optional[AddressWithId]:
+        """Look up an address by its ID."""
+        return self.snapshot().get(address_id)
+
+    def by_country(self, country: str) -> List[AddressWithId]:
+        """Return all addresses of the given country code."""
+        return self.snapshot().by_country(country)
+
+    def all(self) -> ColumnarAddresses:
+        """Return all addresses of the current snapshot, as a lazily materializing sequence."""
+        return self.snapshot().addresses
+
+
+_reference_store: Optional[ReferenceStore] = None
+_stores_lock = threading.Lock()
+
+
+def get_reference_store() -> ReferenceStore:
+    """Return the shared store for addresses-to-match-against.json."""
+    global _reference_store
+    if _reference_store is None:
+        with _stores_lock:
+            if _reference_store is None:
+                _reference_store = ReferenceStore(REFERENCE_ADDRESSES_PATH, parse_reference_addresses,
+                                                  snapshot_path=REFERENCE_SNAPSHOT_PATH or None)
+    return _reference_store
+
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import mmap
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# Binary snapshot of the reference addresses and their indexes:
+#   MAGIC | header length (uint64, little-endian) | JSON header | arrays
+# The header describes named sections, each a JSON-able `meta` dict and named
+# arrays stored at ALIGNMENT-aligned offsets. Readers map the file read-only,
+# so the arrays are views of pages shared through the OS page cache.
+SNAPSHOT_MAGIC = b"ADDRSNAP"
+SNAPSHOT_FORMAT_VERSION = 1
+ALIGNMENT = 64
+# Sources (relative to the agent directory) of the code that determines the content of the
+# sections: the address columns, canonical keys, country rules, blocking keys and n-gram weights
+BUILDER_SOURCES = ('stores/columnar.py', 'matching/text.py', 'matching/canonicalizer.py', 'matching/exact_match.py',
+                   'matching/blocking_index.py', 'matching/similarity_index.py')
+
+_AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_builder_digest: Optional[str] = None
+
+Section = Tuple[Dict[str, Any], Dict[str, np.ndarray]]
+
+
+class SnapshotFormatError(ValueError):
+    pass
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def builder_digest() -> str:
+    """SHA-256 of the builder sources; a snapshot recording another digest was built by other code."""
+    global _builder_digest
+    if _builder_digest is None:
+        digest = hashlib.sha256()
+        for source in BUILDER_SOURCES:
+            digest.update(source.encode('utf-8'))
+            with open(os.path.join(_AGENT_DIR, source), 'rb') as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+        _builder_digest = digest.hexdigest()
+    return _builder_digest
+
+
+def write_snapshot(path: str, source: Dict[str, Any], sections: Dict[str, Section]) -> int:
+    """Write the sections to `path` atomically and return the file size.
+
+    The file is written next to `path` and then renamed over it, so workers
+    that still map the previous version keep reading a consistent file.
+    """
+    layout, offset = {}, 0
+    for name, (meta, arrays) in sections.items():
+        entries = {}
+        for array_name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            entries[array_name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = _aligned(offset + array.nbytes)
+        layout[name] = {'meta': meta, 'arrays': entries}
+    header = json.dumps({'format': SNAPSHOT_FORMAT_VERSION, 'source': source, 'sections': layout},
+                        ensure_ascii=False).encode('utf-8')
+    data_start = _aligned(len(SNAPSHOT_MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(SNAPSHOT_MAGIC)
+        file.write(len(header).to_bytes(8, 'little'))
+        file.write(header)
+        for name, (_, arrays) in sections.items():
+            for array_name, array in arrays.items():
+                file.seek(data_start + layout[name]['arrays'][array_name]['offset'])
+                file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(data_start + offset)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    return data_start + offset
+
+
+class SnapshotFile:
+    """Read-only memory mapping of a snapshot written by `write_snapshot`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise SnapshotFormatError(f"{path} is not an address snapshot")
+        header_start = len(SNAPSHOT_MAGIC) + 8
+        header_length = int.from_bytes(self._mmap[len(SNAPSHOT_MAGIC):header_start], 'little')
+        header = json.loads(self._mmap[header_start:header_start + header_length].decode('utf-8'))
+        if header.get('format') != SNAPSHOT_FORMAT_VERSION:
+            raise SnapshotFormatError(f"{path} has format {header.get('format')}, "
+                                      f"expected {SNAPSHOT_FORMAT_VERSION}; rebuild it")
+        self.source: Dict[str, Any] = header['source']
+        self._sections: Dict[str, Dict[str, Any]] = header['sections']
+        self._data_start = _aligned(header_start + header_length)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    def section(self, name: str) -> Optional[Section]:
+        """Return the meta dict and read-only array views of a section, or None if it was not built."""
+        layout = self._sections.get(name)
+        if layout is None:
+            return None
+        arrays = {}
+        for array_name, entry in layout['arrays'].items():
+            dtype = np.dtype(entry['dtype'])
+            count = int(np.prod(entry['shape'], dtype=np.int64))
+            arrays[array_name] = np.frombuffer(self._mmap, dtype=dtype, count=count,
+                                               offset=self._data_start + entry['offset']).reshape(entry['shape'])
+        return layout['meta'], arrays
+
+    def nbytes(self) -> int:
+        return len(self._mmap)
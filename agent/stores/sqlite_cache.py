@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+# Expired and least recently used rows are evicted once every this many writes
+EVICT_EVERY = 64
+
+
+class SqliteCache:
+    """Persistent key/value cache with TTL and size-bounded LRU eviction.
+
+    Values are stored as JSON in a SQLite table, so entries survive worker
+    restarts and are shared between worker processes on the same host.
+    """
+
+    def __init__(self, path: str, table: str, ttl_seconds: float, max_entries: int):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._connection.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value under the key."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(now)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """Async version of `get`, the SQLite access runs in a worker thread."""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        """Async version of `set`, the SQLite access runs in a worker thread."""
+        await asyncio.to_thread(self.set, key, value)
+
+    def _evict(self, now: float) -> None:
+        expired = self._connection.execute(
+            f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        overflow = self._connection.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        ).rowcount
+        self.evictions += expired + overflow
+
+    def invalidate(self, prefix: str, keep_prefix: Optional[str] = None) -> int:
+        """Remove entries whose key starts with `prefix` (except those starting with `keep_prefix`)."""
+        query = f"DELETE FROM {self.table} WHERE substr(key, 1, ?) = ?"
+        params = [len(prefix), prefix]
+        if keep_prefix is not None:
+            query += " AND substr(key, 1, ?) != ?"
+            params += [len(keep_prefix), keep_prefix]
+        with self._lock:
+            return self._connection.execute(query, params).rowcount
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._connection.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters for this process."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# The agent modules import each other flat (`from models import ...`), as under `langgraph dev`
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if AGENT_DIR not in sys.path:
+    sys.path.insert(0, AGENT_DIR)
+
+from stores.reference_store import REFERENCE_ADDRESSES_PATH, ReferenceStore, parse_reference_addresses  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def reference_addresses():
+    """The reference addresses shipped in resources/"""
+    return list(ReferenceStore(REFERENCE_ADDRESSES_PATH, parse_reference_addresses).snapshot().addresses)
+
+
+def make_address(city, zip_code, country, address_lines, province="", address_id=None):
+    """An address dict as the graph passes it around, with an ID if given"""
+    address = {'city': city, 'zip_code': zip_code, 'country': country, 'province': province,
+               'address_lines': list(address_lines)}
+    return dict(address, id=address_id) if address_id is not None else address
+
+
+@pytest.fixture
+def new_address_store(tmp_path):
+    """An empty new address store with its database and JSON export under tmp_path"""
+    from stores.new_address_store import NewAddressStore
+    store = NewAddressStore(str(tmp_path / 'new-addresses.sqlite3'), str(tmp_path / 'new-addresses.json'),
+                            compact_interval=3600)
+    yield store
+    store.flush()
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from nodes.batching import MicroBatcher
+
+
+def make_batcher(window=0.05, max_size=4, process=None):
+    batches = []
+
+    def default(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    process = process or default
+
+    async def aprocess(items):
+        return process(items)
+
+    return MicroBatcher('test', process, aprocess, window, max_size), batches
+
+
+def test_concurrent_threads_share_a_batch():
+    batcher, batches = make_batcher(window=0.5, max_size=4)
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(batcher.submit, range(4)))
+    assert results == [0, 10, 20, 30]
+    # A full batch is dispatched right away, not after the window
+    assert len(batches) == 1 and sorted(batches[0]) == [0, 1, 2, 3]
+    assert batcher.stats()['full_batches'] == 1 and batcher.stats()['max_wait_ms'] < 500
+
+
+def test_batches_are_dispatched_after_the_window():
+    batcher, batches = make_batcher(window=0.02, max_size=8)
+    assert batcher.submit(1) == 10
+    assert batcher.submit(2) == 20
+    assert batches == [[1], [2]]
+    stats = batcher.stats()
+    assert (stats['batches'], stats['items'], stats['full_batches']) == (2, 2, 0)
+
+
+def test_batch_size_is_capped():
+    batcher, batches = make_batcher(window=0.2, max_size=3)
+    with ThreadPoolExecutor(7) as executor:
+        assert list(executor.map(batcher.submit, range(7))) == [n * 10 for n in range(7)]
+    assert max(len(batch) for batch in batches) <= 3
+    assert sum(len(batch) for batch in batches) == 7
+
+
+def test_every_caller_gets_the_exception_of_the_call():
+    def fail(items):
+        raise RuntimeError("llm down")
+
+    batcher, _ = make_batcher(window=0.2, max_size=2, process=fail)
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(batcher.submit, n) for n in range(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+    assert batcher.stats()['failed_batches'] == 1
+
+
+def test_a_result_count_mismatch_fails_the_batch():
+    batcher, _ = make_batcher(window=0.01, process=lambda items: [])
+    with pytest.raises(ValueError):
+        batcher.submit(1)
+
+
+def test_async_callers_share_a_batch():
+    batcher, batches = make_batcher(window=0.05, max_size=8)
+
+    async def main():
+        return await asyncio.gather(*[batcher.asubmit(n) for n in range(5)])
+
+    assert asyncio.run(main()) == [0, 10, 20, 30, 40]
+    assert batches == [[0, 1, 2, 3, 4]]
+
+
+def test_cancelled_async_caller_does_not_strand_the_others():
+    batcher, batches = make_batcher(window=0.05, max_size=8)
+
+    async def main():
+        first = asyncio.create_task(batcher.asubmit(1))
+        second = asyncio.create_task(batcher.asubmit(2))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 20
+    assert batches == [[1, 2]]
+
+
+def test_stats_report_the_prompt_token_savings():
+    batcher, _ = make_batcher(window=0.01)
+    batcher.submit(1)
+    batcher.record_tokens(300, 1000)
+    stats = batcher.stats()
+    assert stats['prompt_tokens_per_item'] == 300
+    assert stats['prompt_token_savings'] == pytest.approx(0.7)
+
+
+def test_threads_and_event_loops_are_batched_separately():
+    batcher, batches = make_batcher(window=0.1, max_size=8)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(batcher.submit(1)))
+    thread.start()
+    results.append(asyncio.run(batcher.asubmit(2)))
+    thread.join()
+    assert sorted(results) == [10, 20]
+    assert sorted(batches) == [[1], [2]]
@@ -0,0 +1,56 @@
+from matching.blocking_index import MAX_POSTING_SCAN, BlockingIndex, blocking_keys
+from tests.conftest import make_address
+
+
+def test_blocking_keys_are_normalized():
+    keys = blocking_keys(make_address("WARSZAWA", "00-001", "pl", ["ul. Marszałkowska 1"]))
+    assert ('zip', '00001') in keys
+    assert ('city', 'warszawa') in keys
+    assert ('street', 'marszalkowska') in keys
+    assert ('number', '1') in keys
+
+
+def test_search_ranks_the_matching_record_first(reference_addresses):
+    index = BlockingIndex(reference_addresses)
+    query = make_address("WARSZAWA", "00001", "pl", ["Marszalkowska 1"])
+    results = index.search_with_scores(query, 3)
+    assert results[0][0]['id'] == "PL_0"
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+    assert index.match_probability(query) == 1.0
+
+
+def test_search_stays_within_the_country(reference_addresses):
+    index = BlockingIndex(reference_addresses)
+    results = index.search(make_address("Praha", "110 00", "CZ", ["Václavské náměstí 28"]), 10)
+    assert results and {address['country'] for address in results} == {"CZ"}
+
+
+def test_unknown_country_searches_every_country(reference_addresses):
+    index = BlockingIndex(reference_addresses)
+    results = index.search(make_address("Praha", "110 00", "", ["Václavské náměstí 28"]), 1)
+    assert results[0]['id'] == "CZ_0"
+
+
+def test_search_respects_the_limit(reference_addresses):
+    index = BlockingIndex(reference_addresses)
+    assert len(index.search(make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 1"]), 2)) <= 2
+    assert index.search(make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 1"]), 0) == []
+
+
+def test_rare_key_wins_over_posting_lists_longer_than_the_scan_bound():
+    # Every record shares the city and zip code, only one is on the queried street
+    addresses = [make_address("Warszawa", "00-001", "PL", [f"ul. Ulica{n} {n % 50}"], address_id=f"PL_{n}")
+                 for n in range(MAX_POSTING_SCAN + 500)]
+    addresses.append(make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 7"], address_id="PL_target"))
+    index = BlockingIndex(addresses)
+    results = index.search(make_address("Warszawa", "00-001", "PL", ["Marszałkowska 7"]), 5)
+    assert results[0]['id'] == "PL_target"
+    assert len(results) == 5
+
+
+def test_round_trip_through_arrays(reference_addresses):
+    index = BlockingIndex(reference_addresses)
+    copy = BlockingIndex.from_arrays(*index.to_arrays(), reference_addresses)
+    for address in reference_addresses:
+        assert copy.search_with_scores(address, 5) == index.search_with_scores(address, 5)
+        assert copy.match_probability(address) == index.match_probability(address)
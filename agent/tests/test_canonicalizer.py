@@ -0,0 +1,65 @@
+import pytest
+
+from matching.canonicalizer import Canonicalizer
+from tests.conftest import make_address
+
+
+@pytest.fixture(scope='module')
+def canonicalizer(reference_addresses):
+    return Canonicalizer(reference_addresses)
+
+
+def test_canonicalizes_every_field(canonicalizer):
+    result = canonicalizer.canonicalize(make_address("warsaw", "00001", "pl", ["marszalkowska 1"], "mazowieckie"))
+    assert result['address'] == make_address("Warszawa", "00-001", "PL", ["Ul. Marszałkowska 1"], "Mazowieckie")
+    assert result['complete']
+    assert result['changes'] == ['city', 'zip_code', 'country', 'province', 'address_lines']
+
+
+def test_formats_the_zip_code_by_country(canonicalizer):
+    result = canonicalizer.canonicalize(make_address("Praha", "11000", "CZ", ["Vaclavske namesti 28"], "praha"))
+    assert result['address']['zip_code'] == "110 00"
+    assert result['address']['address_lines'] == ["Václavské náměstí 28"]
+    assert result['complete']
+
+
+def test_reference_addresses_are_complete(canonicalizer, reference_addresses):
+    assert all(canonicalizer.canonicalize(address)['complete'] for address in reference_addresses)
+
+
+@pytest.mark.parametrize('address', [
+    # Secondary address line
+    make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 1", "lok. 5"], "mazowieckie"),
+    # Malformed zip code
+    make_address("Warszawa", "0001", "PL", ["ul. Marszałkowska 1"], "mazowieckie"),
+    # Unknown street
+    make_address("Warszawa", "00-001", "PL", ["ul. Nieistniejąca 1"], "mazowieckie"),
+    # Unknown country
+    make_address("Berlin", "10115", "DE", ["Unter den Linden 1"], "Berlin"),
+])
+def test_leaves_unvalidated_addresses_to_the_llm(canonicalizer, address):
+    assert not canonicalizer.canonicalize(address)['complete']
+
+
+@pytest.mark.parametrize('address', [
+    # A Warsaw street in Kraków, with a Gdańsk zip code
+    make_address("Kraków", "80-001", "PL", ["ul. Marszałkowska 1"], "małopolskie"),
+    # A Warsaw street in Kraków, with a Kraków zip code
+    make_address("Kraków", "31-100", "PL", ["ul. Marszałkowska 1"], "małopolskie"),
+    # A Kraków street in Kraków, with a Gdańsk zip code
+    make_address("Kraków", "80-001", "PL", ["ul. Floriańska 3"], "małopolskie"),
+])
+def test_street_and_zip_code_must_fit_the_city(canonicalizer, address):
+    assert not canonicalizer.canonicalize(address)['complete']
+
+
+def test_street_and_zip_code_of_the_city_are_complete(canonicalizer):
+    address = make_address("Kraków", "31-100", "PL", ["ul. Floriańska 3"], "małopolskie")
+    assert canonicalizer.canonicalize(address)['complete']
+
+
+def test_round_trip_through_arrays(canonicalizer, reference_addresses):
+    copy = Canonicalizer.from_arrays(*canonicalizer.to_arrays())
+    queries = reference_addresses + [make_address("Kraków", "80-001", "PL", ["ul. Marszałkowska 1"], "małopolskie")]
+    for address in queries:
+        assert copy.canonicalize(address) == canonicalizer.canonicalize(address)
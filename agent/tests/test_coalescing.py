@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from matching.canonicalizer import Canonicalizer
+from nodes.coalescing import SingleFlight, coalescing_key
+from tests.conftest import make_address
+
+
+def test_coalescing_key_covers_spelling_variants(reference_addresses):
+    canonicalizer = Canonicalizer(reference_addresses)
+    assert coalescing_key(make_address("Warsaw", "00001", "PL", ["Marszałkowska 1"]), canonicalizer) == \
+        coalescing_key(make_address("Warszawa", "00-001", "pl", ["ul. marszałkowska 1"]), canonicalizer)
+    assert coalescing_key(make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 1"]), canonicalizer) != \
+        coalescing_key(make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 2"]), canonicalizer)
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight('test')
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(flights.do, "key", call) for _ in range(4)]
+        while flights.leaders + flights.followers < 4:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert {result for result, _ in results} == {"result"}
+    assert flights.stats()['shared_rate'] == 0.75
+
+
+def test_followers_get_the_exception_and_the_key_is_forgotten():
+    flights = SingleFlight('test')
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(flights.do, "key", fail)
+        started.wait(5)
+        follower = executor.submit(flights.do, "key", lambda: "unused")
+        while flights.followers < 1:
+            threading.Event().wait(0.01)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+    assert flights.do("key", lambda: "again") == ("again", False)
+
+
+def test_async_callers_share_one_call():
+    flights = SingleFlight('test')
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*[flights.ado("key", call) for _ in range(3)],
+                                    flights.ado("other", call))
+
+    results = asyncio.run(main())
+    assert len(calls) == 2
+    assert [shared for _, shared in results] == [False, True, True, False]
+
+
+def test_cancelled_async_leader_hands_over_to_a_follower():
+    flights = SingleFlight('test')
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.create_task(flights.ado("key", call))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flights.ado("key", call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == (2, False)
@@ -0,0 +1,48 @@
+from matching import exact_match
+from matching.canonicalizer import Canonicalizer
+from matching.exact_match import ExactMatchIndex, canonical_key
+from tests.conftest import make_address
+
+
+def test_canonical_key_ignores_case_whitespace_punctuation_and_diacritics():
+    assert canonical_key(make_address("WARSZAWA", "00-001", "PL", ["Ul.  Marszałkowska 1"])) == \
+        canonical_key(make_address("warszawa", "00001", "pl", ["ul. marszalkowska 1"]))
+    assert canonical_key(make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 1"])) != \
+        canonical_key(make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 2"]))
+
+
+def test_lookup_finds_the_reference_address(reference_addresses):
+    index = ExactMatchIndex(reference_addresses)
+    matches = index.lookup(make_address("WARSZAWA", "00 001", "pl", ["UL. MARSZAŁKOWSKA 1"]))
+    assert [address['id'] for address in matches] == ["PL_0"]
+    assert index.lookup(make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 99"])) == []
+
+
+def test_lookup_with_canonicalizer_resolves_exonyms(reference_addresses):
+    canonicalizer = Canonicalizer(reference_addresses)
+    index = ExactMatchIndex(reference_addresses, canonicalizer)
+    matches = index.lookup(make_address("Warsaw", "00001", "PL", ["Marszałkowska 1"]))
+    assert [address['id'] for address in matches] == ["PL_0"]
+    assert ExactMatchIndex(reference_addresses).lookup(make_address("Warsaw", "00001", "PL", ["Marszałkowska 1"])) == []
+
+
+def test_hash_collisions_are_checked_against_the_key(reference_addresses, monkeypatch):
+    monkeypatch.setattr(exact_match, 'key_hash', lambda key: 7)
+    index = ExactMatchIndex(reference_addresses)
+    matches = index.lookup(make_address("Kraków", "31-002", "PL", ["ul. Floriańska 15/2"]))
+    assert [address['id'] for address in matches] == ["PL_1"]
+
+
+def test_key_addresses_key_the_records(reference_addresses):
+    source = make_address("Warszawa", "", "PL", ["Marszalkowska jeden"])
+    index = ExactMatchIndex(reference_addresses[:1], key_addresses=[source])
+    assert [address['id'] for address in index.lookup(source)] == ["PL_0"]
+    assert index.lookup(reference_addresses[0]) == []
+
+
+def test_round_trip_through_arrays(reference_addresses):
+    index = ExactMatchIndex(reference_addresses)
+    copy = ExactMatchIndex.from_arrays(*index.to_arrays(), reference_addresses)
+    assert len(copy) == len(index) == len(reference_addresses)
+    for address in reference_addresses:
+        assert copy.lookup(address) == index.lookup(address) == [address]
@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+from matching import indexes
+from matching.indexes import build_new_address_index
+from matching.new_address_index import SegmentedCandidateIndex, SegmentedExactMatchIndex
+from nodes import find_address
+from stores import NewAddressStore, ReferenceSnapshot, is_new_address_id
+from tests.conftest import make_address
+
+
+@pytest.fixture
+def snapshot(reference_addresses):
+    return ReferenceSnapshot(0, "test", reference_addresses)
+
+
+@pytest.fixture
+def new_address_index(snapshot, new_address_store, monkeypatch):
+    monkeypatch.setattr(indexes, 'get_new_address_store', lambda: new_address_store)
+    return build_new_address_index(snapshot)
+
+
+def test_new_ids_never_collide_with_reference_ids(snapshot, new_address_store, new_address_index):
+    # The first new address of a country used to get the ID of the country's first reference address
+    source = make_address("warszawa", "invalid", "PL", ["Marszałkowska 1"])
+    saved = new_address_store.append(make_address("Warszawa", "00-002", "PL", ["ul. Marszałkowska 1"],
+                                                  "mazowieckie"), source)
+    assert saved['id'] == "NEW_PL_0" and is_new_address_id(saved['id'])
+    assert snapshot.get(saved['id']) is None and not is_new_address_id(snapshot.get("PL_0")['id'])
+
+    new_address_index.refresh(force=True)
+    base = snapshot.derived('blocking_index', indexes.build_blocking_index)
+    candidates = SegmentedCandidateIndex(base, new_address_index.indexes('blocking_index')).search(source, 10)
+    ids = [candidate['id'] for candidate in candidates]
+    assert len(ids) == len(set(ids))
+    assert {"PL_0", "NEW_PL_0"} <= set(ids)
+
+
+def test_matches_resolve_by_id_namespace(snapshot, new_address_store, monkeypatch):
+    monkeypatch.setattr(find_address, 'get_new_address_store', lambda: new_address_store)
+    saved = new_address_store.append(make_address("Warszawa", "00-002", "PL", ["ul. Marszałkowska 1"],
+                                                  "mazowieckie"))
+    # The LLM answers with the IDs only, the records come from where the IDs belong
+    result = find_address.resolve_matches(
+        {'matchedAddresses': [{'id': "PL_0"}, {'id': saved['id']}, {'id': "PL_unknown"}]}, [], snapshot)
+    assert result['matchedAddresses'] == [snapshot.get("PL_0"), saved, {'id': "PL_unknown"}]
+
+
+def test_repeat_of_the_source_matches_the_new_address(snapshot, new_address_store, new_address_index):
+    source = make_address("Wroclaw", "50 999", "pl", ["Testowa 3"])
+    saved = new_address_store.append(make_address("Wrocław", "50-999", "PL", ["ul. Testowa 3"], "dolnośląskie"),
+                                     source)
+    new_address_index.refresh(force=True)
+    base = snapshot.derived('exact_match_index', indexes.build_exact_match_index)
+    index = SegmentedExactMatchIndex(base, new_address_index.indexes('exact_match_index'))
+    assert index.lookup(source) == [saved]
+    assert index.lookup(saved) == [saved]
+
+
+def test_addresses_flagged_as_erroneous_are_not_indexed(new_address_store, new_address_index):
+    source = make_address("Nowhere", "", "PL", ["Nonexistent 1"])
+    new_address_store.append(make_address("Nowhere", "", "PL", ["Nonexistent 1"]), source, error=True)
+    kept = new_address_store.append(make_address("Kraków", "31-100", "PL", ["ul. Testowa 1"]))
+    new_address_index.refresh(force=True)
+    assert [address['id'] for segment in new_address_index.segments for address in segment.addresses] == [kept['id']]
+    assert all(index.lookup(source) == [] for index in new_address_index.indexes('exact_match_index'))
+    assert new_address_store.since(0)[1] == 2
+
+
+def test_legacy_ids_move_to_the_new_namespace(tmp_path):
+    path = str(tmp_path / 'new-addresses.sqlite3')
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE addresses (id TEXT PRIMARY KEY, address TEXT NOT NULL, country TEXT NOT NULL, "
+                       "seq INTEGER NOT NULL)")
+    connection.execute("INSERT INTO addresses VALUES ('PL_0', '{\"city\": \"Warszawa\"}', 'PL', 0)")
+    connection.execute("CREATE TABLE sequences (country TEXT PRIMARY KEY, next INTEGER NOT NULL)")
+    connection.execute("INSERT INTO sequences VALUES ('PL', 1)")
+    connection.commit()
+    connection.close()
+
+    store = NewAddressStore(path, str(tmp_path / 'new-addresses.json'), compact_interval=3600)
+    try:
+        assert [address['id'] for address in store.all()] == ["NEW_PL_0"]
+        assert store.append(make_address("Kraków", "", "PL", ["Testowa 1"]))['id'] == "NEW_PL_1"
+    finally:
+        store.flush()
+
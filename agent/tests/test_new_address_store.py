@@ -0,0 +1,61 @@
+import json
+import threading
+
+from stores.new_address_store import NewAddressStore
+from tests.conftest import make_address
+
+
+def test_ids_are_sequenced_per_country(new_address_store):
+    ids = [new_address_store.append(make_address(city, "", country, ["Testowa 1"]))['id']
+           for city, country in (("Warszawa", "PL"), ("Praha", "cz"), ("Kraków", "PL"), ("Brno", "CZ"))]
+    assert ids == ["NEW_PL_0", "NEW_CZ_0", "NEW_PL_1", "NEW_CZ_1"]
+    assert [address['id'] for address in new_address_store.by_country("pl")] == ["NEW_PL_0", "NEW_PL_1"]
+    assert new_address_store.get("NEW_CZ_1")['city'] == "Brno"
+    assert len(new_address_store) == 4
+
+
+def test_concurrent_appends_get_unique_ids(new_address_store):
+    ids = []
+
+    def append(n):
+        for i in range(20):
+            ids.append(new_address_store.append(make_address("Warszawa", "", "PL", [f"Testowa {n}/{i}"]))['id'])
+
+    threads = [threading.Thread(target=append, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(ids) == sorted(f"NEW_PL_{n}" for n in range(160))
+
+
+def test_stores_on_the_same_database_share_the_sequence(tmp_path, new_address_store):
+    other = NewAddressStore(new_address_store.path, str(tmp_path / 'other.json'), compact_interval=3600)
+    try:
+        first = new_address_store.append(make_address("Warszawa", "", "PL", ["Testowa 1"]))
+        second = other.append(make_address("Kraków", "", "PL", ["Testowa 2"]))
+    finally:
+        other.flush()
+    assert (first['id'], second['id']) == ("NEW_PL_0", "NEW_PL_1")
+
+
+def test_legacy_json_export_seeds_the_sequence(tmp_path):
+    export_path = tmp_path / 'new-addresses.json'
+    export_path.write_text(json.dumps([
+        dict(make_address("Warszawa", "", "PL", ["Testowa 1"]), id="PL_4"),
+        dict(make_address("Praha", "", "CZ", ["Testova 1"]), id="NEW_CZ_2"),
+    ]), encoding='utf-8')
+    store = NewAddressStore(str(tmp_path / 'new-addresses.sqlite3'), str(export_path), compact_interval=3600)
+    try:
+        assert [address['id'] for address in store.all()] == ["NEW_PL_4", "NEW_CZ_2"]
+        assert store.append(make_address("Kraków", "", "PL", ["Testowa 2"]))['id'] == "NEW_PL_5"
+        assert store.append(make_address("Brno", "", "CZ", ["Testova 2"]))['id'] == "NEW_CZ_3"
+    finally:
+        store.flush()
+
+
+def test_compact_writes_the_json_export(new_address_store):
+    saved = new_address_store.append(make_address("Warszawa", "00-001", "PL", ["Testowa 1"], province="mazowieckie"))
+    new_address_store.compact()
+    with open(new_address_store.export_path, encoding='utf-8') as file:
+        assert json.load(file) == [saved]
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+
+import pytest
+
+from providers.scheduler import BULK, INTERACTIVE, AdaptiveLimiter, TokenBucket, is_retryable, is_throttled
+
+
+class StatusError(Exception):
+    """An HTTP error as the provider SDKs raise it"""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type('Response', (), {'headers': {'retry-after': retry_after} if retry_after else {}})()
+
+
+def test_error_classification():
+    assert is_throttled(StatusError(429)) and is_retryable(StatusError(429))
+    assert not is_throttled(StatusError(503)) and is_retryable(StatusError(503))
+    assert not is_retryable(StatusError(400))
+    assert is_retryable(TimeoutError()) and not is_retryable(ValueError())
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    assert bucket.wait_seconds(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_seconds(1, now) == pytest.approx(1)
+    assert bucket.wait_seconds(1, now + 1) == pytest.approx(0)
+    assert TokenBucket(0).wait_seconds(1000, now) == 0
+
+
+def test_limit_grows_additively_and_shrinks_multiplicatively():
+    limiter = AdaptiveLimiter('test', initial_limit=4, min_limit=1, max_limit=8, latency_target=1)
+    limiter.release(limiter.acquire(), 0.1)
+    assert limiter.limit == pytest.approx(4.25)
+    limiter.release(limiter.acquire(), 0.1, throttled=True, failed=True)
+    assert limiter.limit == pytest.approx(2.125)
+    limiter.release(limiter.acquire(), 2.0)
+    assert limiter.limit == pytest.approx(2.125 * 0.9)
+    limiter.release(limiter.acquire(), 0.1, failed=True)
+    assert limiter.limit == pytest.approx(2.125 * 0.9)
+    stats = limiter.stats()
+    assert (stats['throttled'], stats['slow_calls'], stats['inflight']) == (1, 1, 0)
+
+
+def test_limit_stays_within_bounds():
+    limiter = AdaptiveLimiter('test', initial_limit=2, min_limit=1, max_limit=2)
+    for _ in range(5):
+        limiter.release(limiter.acquire(), 0.1)
+    assert limiter.limit == 2
+    for _ in range(5):
+        limiter.release(limiter.acquire(), 0.1, throttled=True, failed=True)
+    assert limiter.limit == 1
+
+
+def test_calls_in_flight_stay_within_the_limit():
+    limiter = AdaptiveLimiter('test', initial_limit=3, max_limit=3)
+    inflight, peak, lock = [0], [0], threading.Lock()
+
+    def call():
+        with lock:
+            inflight[0] += 1
+            peak[0] = max(peak[0], inflight[0])
+        threading.Event().wait(0.02)
+        with lock:
+            inflight[0] -= 1
+
+    threads = [threading.Thread(target=limiter.call, args=(call,)) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 3
+    assert limiter.stats()['admitted'][INTERACTIVE] == 12
+
+
+def test_interactive_calls_are_admitted_before_bulk_calls():
+    limiter = AdaptiveLimiter('test', initial_limit=1, max_limit=1)
+    holder = limiter.acquire()
+    order = []
+
+    def wait(lane):
+        waiter = limiter.acquire(lane=lane)
+        order.append(lane)
+        limiter.release(waiter, 0.1)
+
+    threads = [threading.Thread(target=wait, args=(BULK,))]
+    threads[0].start()
+    while limiter.stats()['queued'][BULK] < 1:
+        threading.Event().wait(0.01)
+    threads.append(threading.Thread(target=wait, args=(INTERACTIVE,)))
+    threads[1].start()
+    while limiter.stats()['queued'][INTERACTIVE] < 1:
+        threading.Event().wait(0.01)
+    limiter.release(holder, 0.1)
+    for thread in threads:
+        thread.join()
+    assert order == [INTERACTIVE, BULK]
+
+
+def test_bulk_calls_only_use_their_share():
+    limiter = AdaptiveLimiter('test', initial_limit=4, max_limit=4, bulk_share=0.5)
+    bulk = [limiter.acquire(lane=BULK) for _ in range(2)]
+    assert limiter._capacity(BULK) == 2
+    assert limiter._dispatch() is None and limiter.inflight == 2
+    interactive = limiter.acquire(lane=INTERACTIVE)
+    assert limiter.inflight == 3
+    for waiter in bulk + [interactive]:
+        limiter.release(waiter, 0.1)
+
+
+def test_throttled_calls_are_retried_after_retry_after():
+    limiter = AdaptiveLimiter('test', initial_limit=4)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise StatusError(429, retry_after="0.01")
+        return "ok"
+
+    assert limiter.call(call) == "ok"
+    assert len(attempts) == 3
+    # Halved twice, then one success adds 1/limit
+    assert limiter.stats()['retries'] == 2 and limiter.limit == 2
+
+
+def test_non_retryable_errors_are_raised():
+    limiter = AdaptiveLimiter('test')
+
+    def call():
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        limiter.call(call)
+    assert limiter.stats()['retries'] == 0 and limiter.inflight == 0
+
+
+def test_async_calls_are_admitted_and_released():
+    limiter = AdaptiveLimiter('test', initial_limit=2, max_limit=2)
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return limiter.inflight
+
+    async def main():
+        return await asyncio.gather(*[limiter.acall(call) for _ in range(6)])
+
+    assert max(asyncio.run(main())) <= 2
+    assert limiter.inflight == 0
@@ -0,0 +1,47 @@
+import pytest
+
+from matching.similarity_index import SimilarityIndex, char_ngrams, similarity_text
+from tests.conftest import make_address
+
+
+@pytest.fixture(scope='module')
+def index(reference_addresses):
+    return SimilarityIndex(reference_addresses)
+
+
+def test_similarity_text_and_ngrams():
+    assert similarity_text(make_address("Kraków", "31-002", "PL", ["ul. Floriańska 15/2"])) == \
+        "ul florianska 15 2 31002 krakow"
+    assert char_ngrams("ab ab") == {" ab": 2, "ab ": 2}
+
+
+def test_search_tolerates_typos(index):
+    results = index.search_with_scores(make_address("Krakw", "31002", "PL", ["Florianska 15/2"]), 3)
+    assert results[0][0]['id'] == "PL_1"
+    assert 0 < results[0][1] <= 1.0001
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_search_stays_within_a_known_country(index):
+    results = index.search(make_address("Praha", "110 00", "CZ", ["Václavské náměstí 28"]), 10)
+    assert results[0]['id'] == "CZ_0"
+    assert {address['country'] for address in results} == {"CZ"}
+
+
+def test_search_respects_the_limit(index):
+    query = make_address("Warszawa", "00-001", "PL", ["ul. Marszałkowska 1"])
+    assert len(index.search(query, 2)) <= 2
+    assert index.search(query, 0) == []
+
+
+def test_search_batch_matches_single_searches(index, reference_addresses):
+    queries = reference_addresses[:10]
+    assert index.search_batch(queries, 3) == [index.search_with_scores(query, 3) for query in queries]
+    assert index.search_batch([], 3) == []
+
+
+def test_round_trip_through_arrays(index, reference_addresses):
+    copy = SimilarityIndex.from_arrays(*index.to_arrays(), reference_addresses)
+    for address in reference_addresses:
+        assert [match for match, _ in copy.search_with_scores(address, 5)] == \
+            [match for match, _ in index.search_with_scores(address, 5)]
@@ -0,0 +1,86 @@
+import shutil
+
+import numpy as np
+import pytest
+
+import build_snapshot
+from matching.indexes import PREBUILT_INDEXES
+from stores import reference_store
+from stores.reference_store import REFERENCE_ADDRESSES_PATH, ReferenceStore, parse_reference_addresses
+from stores.snapshot_file import SnapshotFile, SnapshotFormatError, write_snapshot
+from tests.conftest import make_address
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    path = tmp_path / 'addresses.json'
+    shutil.copy(REFERENCE_ADDRESSES_PATH, path)
+    return str(path)
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, source_path):
+    path = str(tmp_path / 'addresses.snapshot')
+    build_snapshot.build(source_path, path, list(PREBUILT_INDEXES))
+    return path
+
+
+def test_sections_round_trip(tmp_path):
+    path = str(tmp_path / 'sections.snapshot')
+    arrays = {'ints': np.arange(10, dtype=np.int32), 'floats': np.linspace(0, 1, 7, dtype=np.float32)}
+    write_snapshot(path, {'digest': "abc"}, {'numbers': ({'name': "numbers"}, arrays)})
+    snapshot = SnapshotFile(path)
+    meta, loaded = snapshot.section('numbers')
+    assert snapshot.source == {'digest': "abc"} and meta == {'name': "numbers"}
+    assert 'numbers' in snapshot and snapshot.section('missing') is None
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype and np.array_equal(loaded[name], array)
+        assert not loaded[name].flags.writeable
+
+
+def test_garbage_is_not_a_snapshot(tmp_path):
+    path = tmp_path / 'garbage.snapshot'
+    path.write_bytes(b"garbage")
+    with pytest.raises(SnapshotFormatError):
+        SnapshotFile(str(path))
+
+
+def test_prebuilt_snapshot_matches_the_json(source_path, snapshot_path):
+    loaded = ReferenceStore(source_path, parse_reference_addresses).snapshot()
+    mapped = ReferenceStore(source_path, parse_reference_addresses, snapshot_path=snapshot_path).snapshot()
+    assert loaded.prebuilt is None and mapped.prebuilt is not None
+    assert mapped.digest == loaded.digest
+    assert list(mapped.addresses) == list(loaded.addresses)
+    assert mapped.get("PL_3") == loaded.get("PL_3") and mapped.get("nope") is None
+
+    built = {name: loaded.derived(name, factory) for name, factory in PREBUILT_INDEXES.items()}
+    prebuilt = {name: mapped.derived(name, factory) for name, factory in PREBUILT_INDEXES.items()}
+    queries = list(loaded.addresses) + [make_address("WARSAW", "00001", "pl", ["marszalkowska 1"])]
+    for query in queries:
+        assert prebuilt['exact_match_index'].lookup(query) == built['exact_match_index'].lookup(query)
+        assert prebuilt['blocking_index'].search_with_scores(query, 5) == \
+            built['blocking_index'].search_with_scores(query, 5)
+        assert [match for match, _ in prebuilt['similarity_index'].search_with_scores(query, 5)] == \
+            [match for match, _ in built['similarity_index'].search_with_scores(query, 5)]
+        assert prebuilt['canonicalizer'].canonicalize(query) == built['canonicalizer'].canonicalize(query)
+
+
+def test_touched_source_with_the_same_content_keeps_the_snapshot(source_path, snapshot_path):
+    with open(source_path, 'rb') as file:
+        content = file.read()
+    with open(source_path, 'wb') as file:
+        file.write(content)
+    assert ReferenceStore(source_path, parse_reference_addresses, snapshot_path=snapshot_path).snapshot().prebuilt
+
+
+def test_changed_source_ignores_the_snapshot(source_path, snapshot_path):
+    with open(source_path, 'a', encoding='utf-8') as file:
+        file.write("\n")
+    snapshot = ReferenceStore(source_path, parse_reference_addresses, snapshot_path=snapshot_path).snapshot()
+    assert snapshot.prebuilt is None and len(snapshot) > 0
+
+
+def test_snapshot_of_other_matching_code_is_ignored(source_path, snapshot_path, monkeypatch):
+    monkeypatch.setattr(reference_store, 'builder_digest', lambda: "other")
+    snapshot = ReferenceStore(source_path, parse_reference_addresses, snapshot_path=snapshot_path).snapshot()
+    assert snapshot.prebuilt is None and len(snapshot) > 0